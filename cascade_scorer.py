@@ -0,0 +1,126 @@
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from embeddings import EmbeddingBackend, marker_embeddings
+from lexical_engine import LexicalSimilarityEngine
+from russian_stemmer import stem_table
+from similarity_cache import normalize_text
+
+WORD_RE = re.compile(r'\w+')
+
+CASCADE_STAGES = ('overlap', 'lexical', 'embedding')  # Порядок дешёвых стадий перед ИИ
+MIN_STEMS_FOR_OVERLAP = 2  # Маркеры короче не решаются по пересечению основ
+STEM_OVERLAP_ACCEPT = 0.8  # Доля основ маркера в предложении, при которой пара считается совпадением
+
+
+def _stems(text: str) -> frozenset:
+    return stem_table.word_ids(WORD_RE.findall(text.lower().replace('ё', 'е')), min_length=3)
+
+
+class CascadeScorer:
+    """Каскад дешёвых оценок перед ИИ: совпадение/пересечение основ, TF-IDF матрица,
+    локальные эмбеддинги. Каждая стадия решает пару, если её оценка вне полосы
+    неопределённости (low, high); в ИИ уходят только пары, которые ни одна стадия не решила.
+
+    Решения запоминаются по паре, поэтому повторные проверки не искажают счётчики стадий.
+    Счётчик stats['llm'] ведёт ComparisonScheduler: пара считается, когда запрос к ИИ отправлен.
+    """
+
+    def __init__(self, sentences: List[str], markers: List[str], band: Tuple[float, float],
+                 threshold: float, limits: Dict[str, float], stages: Tuple[str, ...] = CASCADE_STAGES,
+                 stage_bands: Optional[Dict[str, Tuple[float, float]]] = None,
+                 embedding_backend: Optional[EmbeddingBackend] = None, trigger_model=None,
+                 lexical: Optional[LexicalSimilarityEngine] = None,
+                 sentence_stems: Optional[Dict[str, frozenset]] = None):
+        self.band = band
+        self.stage_bands = stage_bands or {}
+        self.threshold = threshold
+        self.limits = limits
+        self.stages = tuple(stage for stage in stages if stage != 'embedding' or embedding_backend is not None)
+        self.stats = Counter()
+        self._decisions: Dict[Tuple[str, str, str], Optional[float]] = {}
+        # Идентификаторы основ предложений и маркеров можно передать готовыми
+        # (PreparedTranscript.stems_by_sentence, TriggerModel.marker_stem_ids)
+        self._stems: Dict[str, frozenset] = dict(sentence_stems or {})
+        if trigger_model is not None:
+            self._stems.update(zip(trigger_model.markers, trigger_model.marker_stem_ids))
+
+        self.lexical = None
+        if 'lexical' in self.stages:
+            self.lexical = lexical or LexicalSimilarityEngine(sentences, markers)
+
+        self._embedding_scores = None
+        if 'embedding' in self.stages:
+            sentence_list = list(dict.fromkeys(sentences))
+            if trigger_model is not None:
+                marker_list = trigger_model.markers
+                marker_vectors = marker_embeddings(trigger_model, embedding_backend)
+            else:
+                marker_list = list(dict.fromkeys(markers))
+                marker_vectors = embedding_backend.embed_batches(marker_list)
+            self._sentence_ids = {sent: i for i, sent in enumerate(sentence_list)}
+            self._marker_ids = {marker: i for i, marker in enumerate(marker_list)}
+            self._embedding_scores = embedding_backend.embed_batches(sentence_list) @ marker_vectors.T
+
+    def _stems_of(self, text: str) -> frozenset:
+        stems = self._stems.get(text)
+        if stems is None:
+            stems = self._stems[text] = _stems(text)
+        return stems
+
+    def _overlap(self, sent: str, marker: str) -> Optional[float]:
+        """Совпадение маркера целиком или почти всех его основ - уверенное совпадение"""
+        if normalize_text(marker) in normalize_text(sent):
+            return 1.0
+        marker_stems = self._stems_of(marker)
+        if len(marker_stems) < MIN_STEMS_FOR_OVERLAP:
+            return None
+        ratio = len(marker_stems & self._stems_of(sent)) / len(marker_stems)
+        return ratio if ratio >= STEM_OVERLAP_ACCEPT else None
+
+    def _stage_score(self, stage: str, sent: str, marker: str) -> Optional[float]:
+        if stage == 'lexical':
+            return self.lexical.similarity(sent, marker)
+        if stage == 'embedding':
+            sent_id = self._sentence_ids.get(sent)
+            marker_id = self._marker_ids.get(marker)
+            if sent_id is None or marker_id is None:
+                return None
+            return float(self._embedding_scores[sent_id, marker_id])
+        return None
+
+    def resolve(self, polarity: str, sent: str, marker: str) -> Optional[float]:
+        """Итоговая схожесть, если пару решила одна из дешёвых стадий, иначе None (нужен ИИ)"""
+        key = (polarity, sent, marker)
+        if key in self._decisions:
+            return self._decisions[key]
+
+        limit = self.limits[polarity]
+        decision = None
+        for stage in self.stages:
+            if stage == 'overlap':
+                ratio = self._overlap(sent, marker)
+                if ratio is not None:
+                    decision = min(max(ratio * limit, self.threshold), limit)
+                    self.stats['overlap_accepted'] += 1
+                    break
+                continue
+
+            score = self._stage_score(stage, sent, marker)
+            if score is None:
+                continue
+            low, high = self.stage_bands.get(stage, self.band)
+            if score < low:
+                decision = 0.0
+                self.stats[f'{stage}_rejected'] += 1
+                break
+            if score > high:
+                decision = min(max(score, self.threshold), limit)
+                self.stats[f'{stage}_accepted'] += 1
+                break
+
+        # Пары, ушедшие в ИИ, считает планировщик при отправке (stats['llm']):
+        # часть нерешённых пар может быть пропущена после заполнения лимитов
+        self._decisions[key] = decision
+        return decision
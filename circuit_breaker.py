@@ -0,0 +1,95 @@
+import time
+from collections import Counter, deque
+from typing import Optional
+
+FAILURE_RATE_THRESHOLD = 0.5  # Доля неудачных запросов в окне, при которой цепь размыкается
+SLOW_CALL_SECONDS = 20.0  # Успешный запрос дольше этого считается неудачным
+WINDOW_SIZE = 20  # Последних запросов в окне оценки
+MIN_CALLS = 5  # Минимум запросов в окне до первого решения
+OPEN_SECONDS = 30.0  # Сколько цепь остаётся разомкнутой до пробного запроса
+HALF_OPEN_PROBES = 1  # Пробных запросов одновременно в полуоткрытом состоянии
+
+
+class CircuitOpen(RuntimeError):
+    """GigaChat признан недоступным, запрос не отправляется"""
+
+
+class CircuitBreaker:
+    """Предохранитель для запросов к GigaChat.
+
+    closed    - запросы идут, результаты копятся в скользящем окне;
+    open      - после доли ошибок/медленных ответов выше порога запросы сразу отклоняются;
+    half_open - через OPEN_SECONDS пропускается пробный запрос: успех замыкает цепь,
+                неудача снова размыкает.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_rate_threshold: float = FAILURE_RATE_THRESHOLD,
+                 slow_call_seconds: float = SLOW_CALL_SECONDS, window_size: int = WINDOW_SIZE,
+                 min_calls: int = MIN_CALLS, open_seconds: float = OPEN_SECONDS,
+                 half_open_probes: int = HALF_OPEN_PROBES):
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = self.CLOSED
+        self.stats = Counter()
+        self._results = deque(maxlen=window_size)
+        self._opened_at = 0.0
+        self._probes = 0
+
+    @property
+    def is_open(self) -> bool:
+        """Разомкнута ли цепь и ещё не пора делать пробный запрос"""
+        return self.state == self.OPEN and time.monotonic() - self._opened_at < self.open_seconds
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос сейчас"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                self.stats['rejected'] += 1
+                return False
+            self.state = self.HALF_OPEN
+            self._probes = 0
+        if self.state == self.HALF_OPEN:
+            if self._probes >= self.half_open_probes:
+                self.stats['rejected'] += 1
+                return False
+            self._probes += 1
+            self.stats['probes'] += 1
+        return True
+
+    def record(self, success: Optional[bool], latency: float = 0.0):
+        """Учитывает результат запроса. success=None - нейтральный исход (например, 4xx)"""
+        failed = None if success is None else (not success or latency > self.slow_call_seconds)
+        if self.state == self.HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+            if failed is None:
+                return
+            if failed:
+                self._open()
+            else:
+                self._close()
+            return
+        if self.state == self.OPEN or failed is None:
+            # Ответы запросов, отправленных до размыкания, решение не меняют
+            return
+        self._results.append(failed)
+        if len(self._results) >= self.min_calls and \
+                sum(self._results) / len(self._results) >= self.failure_rate_threshold:
+            self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._results.clear()
+        self.stats['opened'] += 1
+
+    def _close(self):
+        self.state = self.CLOSED
+        self._results.clear()
+        self.stats['closed'] += 1
@@ -2,47 +2,52 @@ import asyncio
 import logging
 import os
 from typing import Dict, Tuple
-import pandas as pd
-from docx import Document
-import aiohttp
 import json
 import uuid
 from datetime import datetime
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from search_optimized import AsyncGigaChat, load_triggers, load_transcript, filter_by_main_speaker, analyze_text_optimized, format_simple_report
+from search_optimized import AsyncGigaChat, load_triggers, load_transcript, filter_by_main_speaker, analyze_text_optimized, format_simple_report, SCORING_MODE, DEGRADED_NOTICE
+from giga_client import get_shared_client
 
 class CompetencyAnalyzer:
     """Класс для анализа компетенций с интеграцией в Telegram бот"""
     
-    def __init__(self):
-        self.giga_chat = None
+    def __init__(self, scoring_mode: str = SCORING_MODE, giga_chat: AsyncGigaChat = None):
+        self.giga_chat = giga_chat
+        self.scoring_mode = scoring_mode
         
     async def initialize(self):
-        """Инициализация GigaChat"""
-        self.giga_chat = AsyncGigaChat()
-        await self.giga_chat.initialize()
+        """Подключение к GigaChat (в локальном режиме не нужно).
+        По умолчанию используется общий для процесса клиент с пулом соединений."""
+        if self.scoring_mode == 'offline' or self.giga_chat is not None:
+            return
+        self.giga_chat = await get_shared_client()
         
     async def close(self):
-        """Закрытие соединения"""
-        if self.giga_chat:
-            await self.giga_chat.close()
+        """Общий клиент не закрывается: его закрывает giga_client.shutdown при остановке приложения"""
+        self.giga_chat = None
             
-    async def analyze_competencies(self, trans_file_path: str, triggers_file_path: str) -> Tuple[str, str]:
+    async def analyze_competencies(self, trans_file_path: str, triggers_file_path: str,
+                                   user_id=None) -> Tuple[str, str]:
         """
         Анализирует компетенции и возвращает полный отчет и краткое резюме
         
         Args:
             trans_file_path: путь к файлу с текстом встречи
             triggers_file_path: путь к файлу с триггерами
+            user_id: пользователь, на суточный бюджет токенов которого списывается анализ
             
         Returns:
             Tuple[str, str]: (полный отчет, краткое резюме)
         """
         try:
             # Загружаем файлы
-            triggers = load_triggers(triggers_file_path)
+            # Модель триггеров компилируется один раз и переиспользуется по хэшу файла
+            from trigger_model import load_trigger_model
+            trigger_model = load_trigger_model(triggers_file_path)
+            triggers = trigger_model.triggers
             full_text = load_transcript(trans_file_path)
             
             # Фильтруем только главного спикера
@@ -51,7 +56,10 @@ class CompetencyAnalyzer:
             logging.info(f"Анализ компетенций: {len(full_text)} -> {len(text)} символов")
             
             # Анализируем текст
-            analysis = await analyze_text_optimized(text, triggers, self.giga_chat)
+            analysis = await analyze_text_optimized(
+                text, triggers, self.giga_chat, trigger_model=trigger_model, scoring_mode=self.scoring_mode,
+                user_id=user_id
+            )
             
             # Формируем полный отчет (как в REPORT.txt)
             full_report = self._create_detailed_report(analysis, trans_file_path, triggers_file_path)
@@ -68,6 +76,8 @@ class CompetencyAnalyzer:
     def _create_summary(self, analysis: Dict) -> str:
         """Создает краткое резюме по компетенциям"""
         summary = "📊 КРАТКОЕ РЕЗЮМЕ ПО КОМПЕТЕНЦИЯМ\n\n"
+        if analysis.get('_detailed_stats', {}).get('degraded'):
+            summary += DEGRADED_NOTICE + "\n\n"
         
         competency_scores = {}
         
@@ -152,6 +162,8 @@ class CompetencyAnalyzer:
         report += f"📁 Файл встречи: {trans_file_path}\n"
         report += f"📁 Файл триггеров: {triggers_file_path}\n"
         report += f"📅 Дата анализа: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+        if analysis.get('_detailed_stats', {}).get('degraded'):
+            report += DEGRADED_NOTICE + "\n"
         report += "=" * 80 + "\n\n"
         
         # Анализ компетенций
@@ -213,6 +225,12 @@ class CompetencyAnalyzer:
             report += f"   Время обработки: {stats.get('processing_time', 0):.1f}с\n"
             report += f"   Всего сравнений: {stats.get('total_comparisons', 0)}\n"
             report += f"   Токенов использовано: {stats.get('tokens_used', 0)}\n"
+            usage = stats.get('usage_stats', {})
+            if usage.get('budget'):
+                report += f"   Бюджет токенов: {usage['budget']}\n"
+            if usage.get('degraded_pairs'):
+                report += f"   Оценено локально после исчерпания бюджета: {usage['degraded_pairs']} пар\n"
+                report += f"   Сэкономлено токенов (оценка): {usage.get('saved_tokens_estimate', 0)}\n"
             report += f"   Размер кэша: {stats.get('cache_size', 0)}\n"
             report += f"   Предложений обработано: {stats.get('sentences_processed', 0)}\n"
             report += "=" * 80 + "\n\n"
@@ -220,20 +238,23 @@ class CompetencyAnalyzer:
         return report
 
 # Функция для использования в Telegram боте
-async def analyze_competencies_async(trans_file: str, triggers_file: str) -> Tuple[str, str]:
+async def analyze_competencies_async(trans_file: str, triggers_file: str, scoring_mode: str = SCORING_MODE,
+                                     user_id=None) -> Tuple[str, str]:
     """
     Асинхронная функция для анализа компетенций
     
     Args:
         trans_file: путь к файлу с текстом встречи
         triggers_file: путь к файлу с триггерами
+        scoring_mode: 'llm', 'rerank', 'cascade' или 'offline' (без обращений к GigaChat)
+        user_id: пользователь Telegram для учёта суточного бюджета токенов
         
     Returns:
         Tuple[str, str]: (полный отчет, краткое резюме)
     """
-    analyzer = CompetencyAnalyzer()
+    analyzer = CompetencyAnalyzer(scoring_mode)
     try:
         await analyzer.initialize()
-        return await analyzer.analyze_competencies(trans_file, triggers_file)
+        return await analyzer.analyze_competencies(trans_file, triggers_file, user_id=user_id)
     finally:
         await analyzer.close() 
\ No newline at end of file
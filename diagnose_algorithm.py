@@ -1,8 +1,9 @@
 import pandas as pd
 from docx import Document
-import re
 from difflib import SequenceMatcher
 
+from sentence_segmenter import split_sentences
+
 def load_transcript(path: str) -> str:
     """Читает весь текст встречи из .docx и возвращает строку."""
     doc = Document(path)
@@ -52,8 +53,7 @@ def load_triggers(xlsx_path: str) -> dict:
 
 def preprocess_text_simple(text: str) -> list:
     """Простая предобработка текста для диагностики"""
-    sentences = re.split(r'[.!?]+', text)
-    return [s.strip() for s in sentences if s.strip() and len(s.strip()) > 10]
+    return split_sentences(text)
 
 def diagnose_scoring_algorithm():
     """Диагностирует проблемы в алгоритме подсчета баллов"""
@@ -0,0 +1,152 @@
+import hashlib
+import re
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from russian_stemmer import stem_table
+
+WORD_RE = re.compile(r'\w+')
+
+EMBEDDING_DIM = 512  # Размерность эмбеддинга
+HASHES_PER_FEATURE = 4  # На сколько координат разбрасывается каждый признак
+EMBED_BATCH_SIZE = 256  # Фраз в одном пакете векторизации
+
+
+class EmbeddingBackend(ABC):
+    """Интерфейс бэкенда эмбеддингов: фразы -> L2-нормированные векторы одной размерности"""
+
+    name = 'base'
+    dim = 0
+
+    @property
+    def cache_key(self) -> str:
+        """Идентификатор бэкенда и его параметров для кэша эмбеддингов маркеров"""
+        return f"{self.name}:{self.dim}"
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Векторизует фразы: матрица (len(texts), dim)"""
+
+    def embed_batches(self, texts: List[str], batch_size: int = EMBED_BATCH_SIZE) -> np.ndarray:
+        """Векторизует фразы пакетами"""
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.vstack([self.embed(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)])
+
+
+class HashingEmbeddingBackend(EmbeddingBackend):
+    """Локальные эмбеддинги без сети: хэширование признаков (слова, основы Snowball,
+    символьные триграммы) со случайной знаковой проекцией в пространство dim"""
+
+    name = 'hashing'
+
+    def __init__(self, dim: int = EMBEDDING_DIM, hashes_per_feature: int = HASHES_PER_FEATURE):
+        self.dim = dim
+        self.hashes_per_feature = hashes_per_feature
+        self._projection: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    @property
+    def cache_key(self) -> str:
+        return f"{self.name}:{self.dim}:{self.hashes_per_feature}"
+
+    def _features(self, text: str) -> Counter:
+        features = Counter()
+        for word in WORD_RE.findall(text.lower().replace('ё', 'е')):
+            if len(word) < 3:
+                continue
+            features[f"w:{word}"] += 1
+            # Признак - строка основы, а не её идентификатор: проекция не зависит от процесса
+            features[f"s:{stem_table.stem_of(word)}"] += 2
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                features[padded[i:i + 3]] += 1
+        return features
+
+    def _project(self, feature: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Стабильные между процессами координаты и знаки признака"""
+        projection = self._projection.get(feature)
+        if projection is None:
+            digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=4 * self.hashes_per_feature).digest()
+            values = np.frombuffer(digest, dtype=np.uint32)
+            positions = (values % self.dim).astype(np.int64)
+            signs = np.where((values >> 31) & 1, 1.0, -1.0).astype(np.float32)
+            projection = (positions, signs)
+            self._projection[feature] = projection
+        return projection
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        result = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = self._features(text)
+            if not features:
+                continue
+            positions = []
+            values = []
+            for feature, count in features.items():
+                feature_positions, signs = self._project(feature)
+                positions.append(feature_positions)
+                values.append(signs * np.float32(np.log1p(count)))
+            np.add.at(result[row], np.concatenate(positions), np.concatenate(values))
+        norms = np.linalg.norm(result, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return result / norms
+
+
+class VectorIndex:
+    """Векторный индекс в памяти с поиском top-k по косинусной схожести"""
+
+    def __init__(self, keys: List[str], vectors: np.ndarray):
+        self.keys = list(keys)
+        self.vectors = vectors.astype(np.float32, copy=False)
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """Матрица косинусной схожести запросов (строки) со всеми векторами индекса"""
+        return queries @ self.vectors.T
+
+    def search(self, queries: np.ndarray, k: int) -> List[List[Tuple[str, float]]]:
+        """Для каждого запроса возвращает k ближайших ключей по убыванию схожести"""
+        if not self.keys or k <= 0:
+            return [[] for _ in range(len(queries))]
+        scores = self.scores(queries)
+        k = min(k, len(self.keys))
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        result = []
+        for row, ids in enumerate(best):
+            ids = ids[np.argsort(-scores[row, ids], kind='stable')]
+            result.append([(self.keys[i], float(scores[row, i])) for i in ids])
+        return result
+
+
+_BACKENDS = {
+    HashingEmbeddingBackend.name: HashingEmbeddingBackend,
+}
+
+
+def register_backend(backend_class):
+    """Регистрирует бэкенд эмбеддингов (например, с локальной моделью) по его имени"""
+    _BACKENDS[backend_class.name] = backend_class
+    return backend_class
+
+
+def get_embedding_backend(name: str = HashingEmbeddingBackend.name, **kwargs) -> EmbeddingBackend:
+    if name not in _BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд эмбеддингов: {name}")
+    return _BACKENDS[name](**kwargs)
+
+
+def marker_embeddings(trigger_model, backend: EmbeddingBackend) -> np.ndarray:
+    """Эмбеддинги маркеров модели триггеров, кэшируются в артефакте модели"""
+    cached = trigger_model.embeddings.get(backend.cache_key)
+    if cached is not None and len(cached) == len(trigger_model.markers):
+        return cached
+    vectors = backend.embed_batches(trigger_model.markers)
+    trigger_model.embeddings[backend.cache_key] = vectors
+    if trigger_model.path:
+        try:
+            trigger_model.save(trigger_model.path)
+        except OSError as e:
+            print(f"Не удалось сохранить эмбеддинги маркеров: {e}")
+    return vectors
@@ -0,0 +1,374 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+import uuid
+from collections import Counter
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import aiohttp
+
+from circuit_breaker import CircuitBreaker, CircuitOpen
+from rate_limiter import RateLimiter, estimate_tokens
+from token_ledger import UsageLedger
+
+# Конфигурация GigaChat API (адреса переопределяются окружением, например для заглушки giga_stub.py)
+AUTH_KEY = 'ZGMzMGJmZjEtODQwYS00ZjAwLWI2NjgtNGIyNGNiY2ViNmE1OjYwNjM3NTU0LWQxMDctNDA5ZS1hZWM3LTAwYjQ5MjZkOGU2OA=='
+SCOPE = 'GIGACHAT_API_PERS'
+API_AUTH_URL = os.environ.get('GIGACHAT_AUTH_URL', 'https://ngw.devices.sberbank.ru:9443/api/v2/oauth')
+API_CHAT_URL = os.environ.get('GIGACHAT_CHAT_URL', 'https://gigachat.devices.sberbank.ru/api/v1/chat/completions')
+
+# Пул соединений общего клиента
+CONNECTION_LIMIT = 32  # Всего открытых соединений
+CONNECTION_LIMIT_PER_HOST = 16  # Соединений на один хост (OAuth и chat - разные хосты)
+KEEPALIVE_TIMEOUT = 60  # Секунд держать простаивающее соединение открытым
+DNS_CACHE_TTL = 300  # Секунд кэшировать DNS
+
+# Жизненный цикл OAuth-токена
+TOKEN_LIFETIME = 30 * 60  # Время жизни токена, если сервер не вернул expires_at (секунды)
+TOKEN_REFRESH_MARGIN = 60  # За сколько секунд до истечения токен обновляется заранее
+
+# Повторы и таймауты
+REQUEST_TIMEOUT = 60  # Секунд на один запрос
+# Длинная генерация (max_tokens больше порога, например рекомендации): без потока ответ
+# приходит только после всей генерации, поэтому у неё свой таймаут, а её длительность
+# не считается медленным вызовом для предохранителя
+LONG_GENERATION_TOKENS = 2000
+LONG_REQUEST_TIMEOUT = 600  # Секунд на длинную генерацию
+MAX_RETRIES = 4  # Повторов при 429/5xx, таймаутах и сетевых ошибках
+BACKOFF_BASE = 0.5  # Первая пауза перед повтором (секунды), далее удваивается
+BACKOFF_MAX = 30.0  # Максимальная пауза перед повтором
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+COMPLETION_RESERVE = 64  # Токенов ответа, резервируемых в бюджете до получения usage
+LIMITER_COMPLETION_CAP = 4096  # Потолок оценки ответа для лимита tokens/min: иначе max_tokens рекомендаций занимал бы весь лимит
+
+# Параметры генерации: обычные и детерминированные (для оценок схожести, которые кэшируются)
+SAMPLING_PARAMS = {'temperature': 0.7, 'max_tokens': 500}
+DETERMINISTIC_PARAMS = {'temperature': 0.0, 'top_p': 1.0, 'repetition_penalty': 1.0, 'max_tokens': 500}
+
+
+def create_session() -> aiohttp.ClientSession:
+    """Сессия с пулом keep-alive соединений и кэшем DNS"""
+    connector = aiohttp.TCPConnector(
+        limit=CONNECTION_LIMIT,
+        limit_per_host=CONNECTION_LIMIT_PER_HOST,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        ssl=False,
+    )
+    return aiohttp.ClientSession(connector=connector)
+
+
+class AsyncGigaChat:
+    """Асинхронный клиент GigaChat.
+
+    Может работать на собственной сессии или на переданной извне (общий пул
+    соединений); чужую сессию close() не закрывает.
+    """
+
+    def __init__(self, session: Optional[aiohttp.ClientSession] = None,
+                 rate_limiter: Optional[RateLimiter] = None, ledger: Optional[UsageLedger] = None,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.session = session
+        self.rate_limiter = rate_limiter or RateLimiter()
+        # Предохранитель: при недоступном GigaChat запросы сразу отклоняются с CircuitOpen
+        self.breaker = breaker or CircuitBreaker()
+        # Реальный расход токенов по анализам и пользователям (см. UsageLedger.scope)
+        self.ledger = ledger or UsageLedger()
+        # Счётчики для подбора параллельности: запросы, повторы, ожидания (секунды)
+        self.stats = Counter()
+        self.token = None
+        self.expires_at = 0.0  # Момент истечения токена (time.time())
+        self.history = []
+        self._owns_session = session is None
+        self._refresh_task: Optional[asyncio.Task] = None
+        # Запросы «в полёте» по хэшу промпта: одинаковые одновременные вызовы ждут один запрос
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def initialize(self):
+        if self.session is None:
+            self.session = create_session()
+            self._owns_session = True
+        await self._ensure_token()
+
+    async def close(self):
+        for task in list(self._inflight.values()):
+            task.cancel()
+        self._inflight.clear()
+        if self._refresh_task is not None and not self._refresh_task.done():
+            self._refresh_task.cancel()
+        self._refresh_task = None
+        if self.session and self._owns_session:
+            await self.session.close()
+        self.session = None
+
+    async def _fetch_token(self):
+        headers = {
+            'Authorization': f'Basic {AUTH_KEY}',
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Accept': 'application/json',
+            'RqUID': str(uuid.uuid4()),
+        }
+        data = {'grant_type': 'client_credentials', 'scope': SCOPE}
+        async with self.session.post(API_AUTH_URL, headers=headers, data=data, ssl=False) as resp:
+            # Тело ошибки может быть не JSON (HTML шлюза), поэтому статус проверяется до разбора
+            if resp.status != 200:
+                raise RuntimeError(f"Auth failed {resp.status}")
+            js = await resp.json()
+            token = js.get('access_token')
+            if not token:
+                raise RuntimeError(f"Auth failed {resp.status}: no access_token")
+        self.token = token
+        self.expires_at = _parse_expires_at(js)
+
+    def _token_fresh(self) -> bool:
+        return bool(self.token) and time.time() < self.expires_at - TOKEN_REFRESH_MARGIN
+
+    async def _ensure_token(self, force: bool = False):
+        """Возвращает при действующем токене, иначе обновляет его. Одновременные вызовы
+        ждут одно и то же обновление, поэтому на пачку запросов уходит один запрос к OAuth."""
+        if not force and self._token_fresh():
+            return
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._fetch_token())
+        # shield: отмена одного ожидающего не должна отменять обновление для остальных
+        await asyncio.shield(self._refresh_task)
+
+    async def _invalidate_token(self, token: str):
+        """Обновляет токен после 401, если его ещё не обновил другой запрос"""
+        if self.token == token:
+            await self._ensure_token(force=True)
+        else:
+            await self._ensure_token()
+
+    def _circuit_open(self) -> CircuitOpen:
+        """Учитывает запрос, отклонённый предохранителем: в счётчике клиента и в текущем анализе"""
+        self.stats['circuit_rejected'] += 1
+        usage = self.ledger.current()
+        if usage is not None:
+            usage.circuit_rejected += 1
+        return CircuitOpen("GigaChat временно недоступен")
+
+    async def send(self, prompt: str, deterministic: bool = False, params: Optional[dict] = None) -> str:
+        """Отправляет промпт. Если такой же промпт уже выполняется в том же scope учёта
+        токенов, ждёт его результат вместо второго HTTP-запроса. deterministic=True - температура 0 и фиксированные
+        параметры выборки, повторный запрос даёт тот же ответ. params - собственные
+        параметры генерации вызывающего (например, для рекомендаций)."""
+        if params is None:
+            params = DETERMINISTIC_PARAMS if deterministic else SAMPLING_PARAMS
+        # Общая задача выполняется в контексте первого вызывающего, и токены списываются
+        # на его анализ, поэтому запросы разных анализов (и пользователей) не объединяются
+        usage = self.ledger.current()
+        scope = usage.analysis_id if usage is not None else ''
+        key = hashlib.sha256(
+            f"{scope}\x1f{json.dumps(params, sort_keys=True)}\x1f{prompt}".encode('utf-8')).hexdigest()
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._send(prompt, params))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _, key=key: self._inflight.pop(key, None))
+        else:
+            self.stats['coalesced'] += 1
+        # shield: отмена одного из ожидающих не отменяет запрос для остальных
+        return await asyncio.shield(task)
+
+    async def _send(self, prompt: str, params: dict) -> str:
+        if self.breaker.is_open:
+            raise self._circuit_open()
+        # Бюджет проверяется до запроса: при исчерпании бросается BudgetExceeded
+        estimate = estimate_tokens(prompt) + COMPLETION_RESERVE
+        usage = self.ledger.reserve(estimate)
+        try:
+            content, reported = await self._request(prompt, params)
+        except BaseException:
+            self.ledger.release(usage, estimate)
+            raise
+        self.ledger.commit(usage, estimate, reported)
+        return content
+
+    async def _request(self, prompt: str, params: dict) -> Tuple[str, Optional[dict]]:
+        """Запрос к chat/completions с повторами; возвращает текст ответа и блок usage"""
+        timeout = LONG_REQUEST_TIMEOUT if _is_long_generation(params) else REQUEST_TIMEOUT
+        resp = await self._post(prompt, params, aiohttp.ClientTimeout(total=timeout))
+        try:
+            js = await resp.json()
+        finally:
+            resp.release()
+        return js['choices'][0]['message']['content'], js.get('usage')
+
+    async def stream(self, prompt: str, params: Optional[dict] = None) -> AsyncIterator[str]:
+        """Потоковая генерация (SSE): отдаёт фрагменты ответа по мере их получения.
+
+        Повторы, лимиты, предохранитель и бюджет - как у send(), но повтор возможен только
+        до первого фрагмента. Одинаковые потоковые запросы не объединяются.
+        """
+        if self.breaker.is_open:
+            raise self._circuit_open()
+        params = {**(params or SAMPLING_PARAMS), 'stream': True}
+        estimate = estimate_tokens(prompt) + COMPLETION_RESERVE
+        usage = self.ledger.reserve(estimate)
+        reported = None
+        try:
+            # Между фрагментами ограничено ожидание чтения, а не длительность всей генерации
+            resp = await self._post(prompt, params, aiohttp.ClientTimeout(total=None, sock_read=REQUEST_TIMEOUT))
+            self.stats['streams'] += 1
+            try:
+                async for raw in resp.content:
+                    line = raw.decode('utf-8').strip()
+                    if not line.startswith('data:'):
+                        continue
+                    data = line[len('data:'):].strip()
+                    if data == '[DONE]':
+                        break
+                    chunk = json.loads(data)
+                    reported = chunk.get('usage') or reported
+                    for choice in chunk.get('choices', []):
+                        delta = (choice.get('delta') or {}).get('content')
+                        if delta:
+                            yield delta
+            finally:
+                resp.release()
+        except BaseException:
+            self.ledger.release(usage, estimate)
+            raise
+        self.ledger.commit(usage, estimate, reported)
+
+    async def _post(self, prompt: str, params: dict, timeout: aiohttp.ClientTimeout) -> aiohttp.ClientResponse:
+        """POST в chat/completions с повторами при 429/5xx, таймаутах и 401.
+        Возвращает ответ со статусом 200, тело не прочитано (вызывающий делает release())"""
+        await self._ensure_token()
+
+        payload = {
+            'model': 'GigaChat',
+            'messages': [
+                {
+                    'role': 'user',
+                    'content': prompt
+                }
+            ],
+            **params
+        }
+
+        tokens = estimate_tokens(prompt) + min(payload.get('max_tokens', COMPLETION_RESERVE), LIMITER_COMPLETION_CAP)
+        long_generation = _is_long_generation(params)
+        reauthorized = False
+        attempt = 0
+        while True:
+            self.stats['limiter_wait'] += await self.rate_limiter.acquire(tokens)
+            if not self.breaker.allow():
+                raise self._circuit_open()
+            self.stats['requests'] += 1
+            token = self.token
+            headers = {
+                'Authorization': f'Bearer {token}',
+                'Content-Type': 'application/json'
+            }
+            retry_after = None
+            started = time.monotonic()
+            outcome = None  # Для предохранителя: True/False, None - нейтрально (4xx, 429, отмена)
+            try:
+                resp = await self.session.post(API_CHAT_URL, headers=headers, json=payload, ssl=False,
+                                               timeout=timeout)
+                if resp.status == 200:
+                    outcome = True
+                    return resp
+                status = resp.status
+                retry_after = _parse_retry_after(resp.headers.get('Retry-After'))
+                resp.release()
+                if status >= 500:
+                    outcome = False
+            except asyncio.TimeoutError:
+                status = 'timeout'
+                outcome = False
+                self.stats['timeouts'] += 1
+            except aiohttp.ClientError:
+                status = 'connection'
+                outcome = False
+                self.stats['connection_errors'] += 1
+            finally:
+                # Длинная генерация медленна по природе: учитывается только её исход
+                self.breaker.record(outcome, 0.0 if long_generation else time.monotonic() - started)
+
+            # При 401 токен обновляется и запрос повторяется один раз
+            if status == 401 and not reauthorized:
+                reauthorized = True
+                self.stats['reauthorizations'] += 1
+                await self._invalidate_token(token)
+                continue
+            if status == 429:
+                self.stats['throttled'] += 1
+            elif status in RETRY_STATUSES:
+                self.stats['server_errors'] += 1
+            if (status not in RETRY_STATUSES and isinstance(status, int)) or attempt >= MAX_RETRIES:
+                raise RuntimeError(f"Request failed with status {status}")
+
+            # Экспоненциальная пауза с полным джиттером; Retry-After от сервера важнее
+            delay = retry_after if retry_after is not None else \
+                random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+            attempt += 1
+            self.stats['retries'] += 1
+            self.stats['backoff_wait'] += delay
+            await asyncio.sleep(delay)
+
+
+def _is_long_generation(params: dict) -> bool:
+    return params.get('max_tokens', 0) > LONG_GENERATION_TOKENS
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After в секундах (формат HTTP-даты не поддерживается)"""
+    try:
+        return min(max(float(value), 0.0), BACKOFF_MAX) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _parse_expires_at(js: dict) -> float:
+    """Момент истечения токена из ответа OAuth (expires_at в мс или с, либо expires_in)"""
+    expires_at = js.get('expires_at')
+    if isinstance(expires_at, (int, float)) and expires_at > 0:
+        # GigaChat возвращает время в миллисекундах
+        return expires_at / 1000 if expires_at > 1e11 else float(expires_at)
+    expires_in = js.get('expires_in')
+    if isinstance(expires_in, (int, float)) and expires_in > 0:
+        return time.time() + expires_in
+    return time.time() + TOKEN_LIFETIME
+
+
+# Общий для процесса клиент: один пул соединений и один OAuth-токен на все анализы
+_shared_client: Optional[AsyncGigaChat] = None
+_shared_lock: Optional[asyncio.Lock] = None
+
+
+async def get_shared_client() -> AsyncGigaChat:
+    """Возвращает общий клиент, при первом обращении создаёт его и получает токен"""
+    global _shared_client, _shared_lock
+    if _shared_client is not None:
+        return _shared_client
+    if _shared_lock is None:
+        _shared_lock = asyncio.Lock()
+    async with _shared_lock:
+        if _shared_client is None:
+            client = AsyncGigaChat()
+            try:
+                await client.initialize()
+            except Exception:
+                await client.close()
+                raise
+            _shared_client = client
+    return _shared_client
+
+
+async def startup():
+    """Хук запуска приложения: заранее открывает пул и получает токен"""
+    await get_shared_client()
+
+
+async def shutdown():
+    """Хук остановки приложения: закрывает общий клиент и его соединения"""
+    global _shared_client, _shared_lock
+    client, _shared_client, _shared_lock = _shared_client, None, None
+    if client is not None:
+        await client.close()
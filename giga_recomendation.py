@@ -1,46 +1,37 @@
-import requests
+import asyncio
 import json
 from datetime import datetime
 import os
-from docx import Document
-import pandas as pd
+import time
+from typing import Awaitable, Callable, Optional, Tuple
 
+from giga_client import AsyncGigaChat, get_shared_client
 
-class MeetingAnalyzer:
-    def __init__(self, auth_key, scope, api_auth_url, api_chat_url):
-        self.auth_key = auth_key
-        self.scope = scope
-        self.api_auth_url = api_auth_url
-        self.api_chat_url = api_chat_url
-        self.access_token = None
-        self.token_expires = 0
+# Параметры генерации рекомендаций (одинаковые для синхронной и асинхронной версии)
+RECOMMENDATION_PARAMS = {
+    "temperature": 0.7,
+    "top_p": 0.9,
+    "n": 1,
+    "stream": False,
+    "max_tokens": 200000,
+    "repetition_penalty": 1.0
+}
 
-    def get_access_token(self):
-        headers = {
-            'Authorization': f'Bearer {self.auth_key}',
-            'RqUID': '6f0b1291-c7f3-43c6-bb2e-9f3efb2dc98e',
-            'Content-Type': 'application/x-www-form-urlencoded'
-        }
-        data = {'scope': self.scope}
+# Колбэк потоковой генерации: получает весь текст, сгенерированный к этому моменту
+ProgressCallback = Callable[[str], Awaitable[None]]
+PROGRESS_INTERVAL = 0.5  # Секунд между вызовами колбэка: текст склеивается только перед вызовом
 
-        response = requests.post(self.api_auth_url, headers=headers, data=data, verify=False)
-        if response.status_code == 200:
-            token_data = response.json()
-            self.access_token = token_data['access_token']
-            self.token_expires = datetime.now().timestamp() + int(token_data['expires_at'])
-            return True
-        else:
-            print(f"Ошибка получения токена: {response.status_code} - {response.text}")
-            return False
 
-    def is_token_valid(self):
-        return self.access_token and datetime.now().timestamp() < self.token_expires
+class RecommendationPrompts:
+    """Подготовка промптов рекомендаций: чтение встречи, отчёта и курсов без обращения к API"""
 
     def read_docx(self, file_path):
         """Чтение текста из файла .docx"""
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"Файл {file_path} не найден")
 
+        # python-docx, pandas и requests импортируются при первом использовании
+        from docx import Document
         doc = Document(file_path)
         full_text = []
         for para in doc.paragraphs:
@@ -50,6 +41,7 @@ class MeetingAnalyzer:
     def _load_triggers_courses(self, triggers_file_path):
         """Загружает курсы из файла триггеров"""
         try:
+            import pandas as pd
             df = pd.read_excel(triggers_file_path)
             df = df.fillna('')
             
@@ -88,16 +80,8 @@ class MeetingAnalyzer:
         
         return low_score_competencies
 
-    def analyze_meeting(self):
-        if not self.is_token_valid() and not self.get_access_token():
-            return "Ошибка: не удалось получить токен доступа"
-
-        # Чтение текста встречи из файла
-        try:
-            trans = self.read_docx('./trans.docx')
-        except Exception as e:
-            return f"Ошибка чтения файла: {str(e)}"
-
+    def _meeting_prompt(self, trans):
+        """Промпт итогов встречи по тексту встречи"""
         prompt = f"""Проанализируй текст встречи и сформируй рекомендации в следующем формате:
 
 Итоги ММ
@@ -128,8 +112,7 @@ class MeetingAnalyzer:
 
 Текст встречи для анализа:
 {trans}"""
-
-        return self._send_request(prompt)
+        return prompt
 
     def _compress_text(self, text, max_length=500):
         """Сжимает текст, убирая лишние пробелы и переносы"""
@@ -139,36 +122,6 @@ class MeetingAnalyzer:
             compressed = compressed[:max_length] + "..."
         return compressed
 
-    def _send_request(self, prompt):
-        """Отправка запроса к GigaChat API"""
-        headers = {
-            'Authorization': f'Bearer {self.access_token}',
-            'Content-Type': 'application/json'
-        }
-
-        payload = {
-            "model": "GigaChat",
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            "temperature": 0.7,
-            "top_p": 0.9,
-            "n": 1,
-            "stream": False,
-            "max_tokens": 200000,
-            "repetition_penalty": 1.0
-        }
-
-        response = requests.post(self.api_chat_url, headers=headers, json=payload, verify=False)
-        if response.status_code == 200:
-            result = response.json()
-            return result['choices'][0]['message']['content']
-        else:
-            return f"Ошибка анализа встречи: {response.status_code} - {response.text}"
-
     def _extract_competencies_with_scores(self, report_text):
         """Извлекает компетенции с баллами из отчета"""
         competencies_with_scores = {}
@@ -198,25 +151,20 @@ class MeetingAnalyzer:
         print(f"DEBUG: Компетенции: {competencies_with_scores}")
         return competencies_with_scores
 
-    def analyze_meeting_with_file(self, file_path=None, user_id=None):
-        """Анализ встречи с уже загруженным файлом пользователя (без повторной загрузки)"""
-        # Если file_path не передан — ищем trans.docx в temp_files/{user_id}/trans.docx
-        if file_path is None:
-            if user_id is None:
-                return "❌ Ошибка: Не указан путь к файлу и user_id."
+    def _resolve_trans_path(self, file_path=None, user_id=None):
+        """Путь к тексту встречи: переданный или temp_files/{user_id}/trans.docx"""
+        if file_path is None and user_id is not None:
             file_path = f"temp_files/{user_id}/trans.docx"
-        if not self.is_token_valid() and not self.get_access_token():
-            return "Ошибка: не удалось получить токен доступа"
+        return file_path
 
+    def _prepare_detailed_prompt(self, file_path) -> Tuple[Optional[str], Optional[str]]:
+        """Промпт детальных рекомендаций по встрече, REPORT.txt и triggers.xlsx.
+        Возвращает (промпт, None) или (None, текст ошибки)"""
         # Чтение текста встречи из файла
         try:
             trans = self.read_docx(file_path)
         except Exception as e:
-            return f"Ошибка чтения файла: {str(e)}"
-
-        if not self.is_token_valid() and not self.get_access_token():
-            return "Ошибка: не удалось получить токен доступа"
-
+            return None, f"Ошибка чтения файла: {str(e)}"
 
         # Читаем отчет по компетенциям (обязательно)
         competency_report = ""
@@ -234,14 +182,14 @@ class MeetingAnalyzer:
                         print(f"DEBUG: Используется полный отчет")
                 print(f"DEBUG: Используется файл: REPORT.txt")
             else:
-                return "❌ Ошибка: Файл REPORT.txt не найден. Сначала выполните анализ компетенций."
+                return None, "❌ Ошибка: Файл REPORT.txt не найден. Сначала выполните анализ компетенций."
         except Exception as e:
-            return f"❌ Ошибка чтения отчета компетенций: {str(e)}"
+            return None, f"❌ Ошибка чтения отчета компетенций: {str(e)}"
 
         # Загружаем курсы из файла триггеров
         triggers_file_path = 'triggers.xlsx'
         if not os.path.exists(triggers_file_path):
-            return "❌ Ошибка: Файл triggers.xlsx не найден."
+            return None, "❌ Ошибка: Файл triggers.xlsx не найден."
         
         courses_dict = self._load_triggers_courses(triggers_file_path)
         
@@ -348,15 +296,169 @@ class MeetingAnalyzer:
 {competency_report}
 """
 
+        return prompt, None
+
+
+class MeetingAnalyzer(RecommendationPrompts):
+    """Синхронный анализатор встреч (requests). В асинхронном коде используйте AsyncMeetingAnalyzer"""
+
+    def __init__(self, auth_key, scope, api_auth_url, api_chat_url):
+        self.auth_key = auth_key
+        self.scope = scope
+        self.api_auth_url = api_auth_url
+        self.api_chat_url = api_chat_url
+        self.access_token = None
+        self.token_expires = 0
+
+    def get_access_token(self):
+        headers = {
+            'Authorization': f'Bearer {self.auth_key}',
+            'RqUID': '6f0b1291-c7f3-43c6-bb2e-9f3efb2dc98e',
+            'Content-Type': 'application/x-www-form-urlencoded'
+        }
+        data = {'scope': self.scope}
+
+        import requests
+        response = requests.post(self.api_auth_url, headers=headers, data=data, verify=False)
+        if response.status_code == 200:
+            token_data = response.json()
+            self.access_token = token_data['access_token']
+            self.token_expires = datetime.now().timestamp() + int(token_data['expires_at'])
+            return True
+        else:
+            print(f"Ошибка получения токена: {response.status_code} - {response.text}")
+            return False
+
+    def is_token_valid(self):
+        return self.access_token and datetime.now().timestamp() < self.token_expires
+
+    def analyze_meeting(self):
+        if not self.is_token_valid() and not self.get_access_token():
+            return "Ошибка: не удалось получить токен доступа"
+
+        # Чтение текста встречи из файла
+        try:
+            trans = self.read_docx('./trans.docx')
+        except Exception as e:
+            return f"Ошибка чтения файла: {str(e)}"
+
+        prompt = self._meeting_prompt(trans)
         return self._send_request(prompt)
 
+    def _send_request(self, prompt):
+        """Отправка запроса к GigaChat API"""
+        headers = {
+            'Authorization': f'Bearer {self.access_token}',
+            'Content-Type': 'application/json'
+        }
+
+        payload = {
+            "model": "GigaChat",
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            **RECOMMENDATION_PARAMS
+        }
+
+        import requests
+        response = requests.post(self.api_chat_url, headers=headers, json=payload, verify=False)
+        if response.status_code == 200:
+            result = response.json()
+            return result['choices'][0]['message']['content']
+        else:
+            return f"Ошибка анализа встречи: {response.status_code} - {response.text}"
+
+    def analyze_meeting_with_file(self, file_path=None, user_id=None):
+        """Анализ встречи с уже загруженным файлом пользователя (без повторной загрузки)"""
+        # Если file_path не передан — ищем trans.docx в temp_files/{user_id}/trans.docx
+        file_path = self._resolve_trans_path(file_path, user_id)
+        if file_path is None:
+            return "❌ Ошибка: Не указан путь к файлу и user_id."
+        if not self.is_token_valid() and not self.get_access_token():
+            return "Ошибка: не удалось получить токен доступа"
+
+        prompt, error = self._prepare_detailed_prompt(file_path)
+        if error:
+            return error
+
+        if not self.is_token_valid() and not self.get_access_token():
+            return "Ошибка: не удалось получить токен доступа"
+
+        return self._send_request(prompt)
+
+
+class AsyncMeetingAnalyzer(RecommendationPrompts):
+    """Асинхронный анализатор встреч на общем клиенте GigaChat: пул соединений, токен,
+    лимиты и предохранитель общие с анализом компетенций.
+
+    Промпты и формат результата те же, что у MeetingAnalyzer: методы возвращают текст
+    рекомендаций или строку с ошибкой. Чтение docx/xlsx идёт в отдельном потоке,
+    поэтому цикл событий бота не блокируется. С колбэком on_progress ответ генерируется
+    потоком (SSE), и первые разделы видны до окончания генерации.
+    """
+
+    def __init__(self, giga_chat: Optional[AsyncGigaChat] = None):
+        # None - общий клиент процесса (giga_client.get_shared_client)
+        self.giga_chat = giga_chat
+
+    async def _client(self) -> AsyncGigaChat:
+        if self.giga_chat is None:
+            return await get_shared_client()
+        return self.giga_chat
+
+    async def _send_request(self, prompt, on_progress: Optional[ProgressCallback] = None):
+        """Отправка запроса к GigaChat API. С on_progress ответ запрашивается потоком,
+        и колбэк получает накопленный текст не чаще раза в PROGRESS_INTERVAL секунд"""
+        try:
+            giga = await self._client()
+        except Exception as e:
+            print(f"Ошибка получения токена: {e}")
+            return "Ошибка: не удалось получить токен доступа"
+        try:
+            if on_progress is None:
+                return await giga.send(prompt, params=RECOMMENDATION_PARAMS)
+            parts = []
+            next_progress = 0.0
+            async for delta in giga.stream(prompt, params=RECOMMENDATION_PARAMS):
+                parts.append(delta)
+                if time.monotonic() >= next_progress:
+                    # Склеенный текст заменяет фрагменты, чтобы следующая склейка не начиналась с нуля
+                    parts = [''.join(parts)]
+                    await on_progress(parts[0])
+                    next_progress = time.monotonic() + PROGRESS_INTERVAL
+            return ''.join(parts)
+        except Exception as e:
+            return f"Ошибка анализа встречи: {str(e)}"
+
+    async def analyze_meeting(self, file_path='./trans.docx', on_progress: Optional[ProgressCallback] = None):
+        # Чтение текста встречи из файла
+        try:
+            trans = await asyncio.to_thread(self.read_docx, file_path)
+        except Exception as e:
+            return f"Ошибка чтения файла: {str(e)}"
+        return await self._send_request(self._meeting_prompt(trans), on_progress)
+
+    async def analyze_meeting_with_file(self, file_path=None, user_id=None,
+                                        on_progress: Optional[ProgressCallback] = None):
+        """Анализ встречи с уже загруженным файлом пользователя (без повторной загрузки).
+        on_progress - асинхронный колбэк для показа рекомендаций по мере генерации"""
+        file_path = self._resolve_trans_path(file_path, user_id)
+        if file_path is None:
+            return "❌ Ошибка: Не указан путь к файлу и user_id."
+
+        prompt, error = await asyncio.to_thread(self._prepare_detailed_prompt, file_path)
+        if error:
+            return error
+        return await self._send_request(prompt, on_progress)
+
 
 # Пример использования
 if __name__ == "__main__":
-    AUTH_KEY = 'ZGMzMGJmZjEtODQwYS00ZjAwLWI2NjgtNGIyNGNiY2ViNmE1OjYwNjM3NTU0LWQxMDctNDA5ZS1hZWM3LTAwYjQ5MjZkOGU2OA=='
-    SCOPE = 'GIGACHAT_API_PERS'
-    API_AUTH_URL = 'https://ngw.devices.sberbank.ru:9443/api/v2/oauth'
-    API_CHAT_URL = 'https://gigachat.devices.sberbank.ru/api/v1/chat/completions'
+    # Адреса берутся из giga_client и переопределяются GIGACHAT_AUTH_URL / GIGACHAT_CHAT_URL
+    from giga_client import AUTH_KEY, SCOPE, API_AUTH_URL, API_CHAT_URL
 
     analyzer = MeetingAnalyzer(AUTH_KEY, SCOPE, API_AUTH_URL, API_CHAT_URL)
 
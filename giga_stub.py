@@ -0,0 +1,287 @@
+"""Локальная замена GigaChat API для нагрузочных тестов и воспроизведения ответов.
+
+Реализует OAuth (/api/v2/oauth) и /api/v1/chat/completions (в том числе stream=True),
+задержки по заданному распределению, инъекцию 429/500 и запись/воспроизведение
+ответов по хэшу промпта. Клиент направляется на заглушку переменными окружения:
+
+    python giga_stub.py --port 8090 --latency lognormal:0.8,0.5 --error-429 0.05
+    GIGACHAT_AUTH_URL=http://127.0.0.1:8090/api/v2/oauth \\
+    GIGACHAT_CHAT_URL=http://127.0.0.1:8090/api/v1/chat/completions python telegram_bot.py
+
+Запись реальных ответов (запросы уходят в настоящий GigaChat через AsyncGigaChat):
+
+    python giga_stub.py --record recordings.jsonl
+    python giga_stub.py --replay recordings.jsonl
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+import uuid
+import zlib
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+from aiohttp import web
+
+from rate_limiter import estimate_tokens
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8090
+AUTH_PATH = '/api/v2/oauth'
+CHAT_PATH = '/api/v1/chat/completions'
+TOKEN_TTL = 30 * 60  # Время жизни выданного токена (секунды)
+STREAM_CHUNK_CHARS = 24  # Символов в одном SSE-фрагменте
+STREAM_CHUNK_DELAY = 0.02  # Пауза между SSE-фрагментами (секунды)
+
+_BATCH_RE = re.compile(r'JSON-массивом из (\d+)')
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """Распределение задержки в секундах по строке:
+    '0.3' или 'fixed:0.3', 'uniform:a,b', 'normal:mu,sigma', 'lognormal:median,sigma', 'exp:mean'"""
+    kind, _, args = spec.partition(':')
+    if not args:
+        kind, args = 'fixed', kind
+    values = [float(value) for value in args.split(',')]
+    if kind == 'fixed':
+        return lambda: values[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(values[0], values[1])
+    if kind == 'normal':
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == 'lognormal':
+        # Медиана задаётся явно: exp(mu) = median
+        return lambda: random.lognormvariate(0.0, values[1]) * values[0]
+    if kind == 'exp':
+        return lambda: random.expovariate(1.0 / values[0]) if values[0] > 0 else 0.0
+    raise ValueError(f"Неизвестное распределение задержки: {spec}")
+
+
+def prompt_key(prompt: str) -> str:
+    """Ключ записи: SHA-256 текста промпта"""
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+
+def synthetic_answer(prompt: str) -> str:
+    """Правдоподобный ответ по виду промпта; одинаковый для одинаковых промптов"""
+    seed = zlib.crc32(prompt.encode('utf-8'))
+    batch = _BATCH_RE.search(prompt)
+    if batch:
+        count = int(batch.group(1))
+        rng = random.Random(seed)
+        return '[' + ', '.join(f'{rng.random() * 0.9:.2f}' for _ in range(count)) + ']'
+    if 'Ответь только число' in prompt:
+        return f'{(seed % 90) / 100:.2f}'
+    if prompt.rstrip().endswith('Позитив:'):
+        return 'Давайте вместе найдём решение, которое подойдёт всем.'
+    return (
+        "# ДЕТАЛЬНЫЕ РЕКОМЕНДАЦИИ ПО РАЗВИТИЮ\n\n"
+        "## Анализ встречи и компетенций\n\n"
+        "Ответ локальной заглушки GigaChat.\n\n"
+        "## РЕКОМЕНДАЦИИ ПО КОМПЕТЕНЦИЯМ\n\n"
+        "**Сотрудничество** - 5.0\n"
+        "- 💡 **Практические рекомендации:**\n"
+        "  - Чаще задавайте открытые вопросы\n\n"
+        "## ОБЩИЕ РЕКОМЕНДАЦИИ ПО ВСТРЕЧЕ\n\n"
+        "1. Озвучивайте правила в начале встречи\n"
+    )
+
+
+class GigaChatStub:
+    """Заглушка GigaChat на aiohttp.web.
+
+    Режимы ответов: синтетические (по умолчанию), запись (запросы проксируются в
+    настоящий GigaChat, ответы дописываются в JSONL) и воспроизведение (ответы из
+    JSONL по хэшу промпта; для промптов без записи - синтетический ответ).
+    Статистика доступна по GET /stats.
+    """
+
+    def __init__(self, latency: str = '0', auth_latency: str = '0', error_429: float = 0.0,
+                 error_500: float = 0.0, retry_after: Optional[float] = None, token_ttl: float = TOKEN_TTL,
+                 record_path: Optional[str] = None, replay_path: Optional[str] = None):
+        self.latency = parse_latency(latency)
+        self.auth_latency = parse_latency(auth_latency)
+        self.error_429 = error_429
+        self.error_500 = error_500
+        self.retry_after = retry_after
+        self.token_ttl = token_ttl
+        self.record_path = record_path
+        self.stats = Counter()
+        self.inflight = 0
+        self._tokens: Dict[str, float] = {}
+        self._recordings: Dict[str, dict] = {}
+        self._upstream = None
+        if replay_path:
+            self._recordings = self._load(replay_path)
+        self._started = time.monotonic()
+
+    @staticmethod
+    def _load(path: str) -> Dict[str, dict]:
+        recordings = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        recordings[record['key']] = record
+        print(f"🎞️ Загружено записей для воспроизведения: {len(recordings)}")
+        return recordings
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(AUTH_PATH, self.handle_auth)
+        app.router.add_post(CHAT_PATH, self.handle_chat)
+        app.router.add_get('/stats', self.handle_stats)
+        app.on_cleanup.append(self._close_upstream)
+        return app
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> web.AppRunner:
+        """Запускает заглушку в текущем цикле событий (для тестов в том же процессе)"""
+        runner = web.AppRunner(self.app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+    async def handle_auth(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.auth_latency())
+        self.stats['auth'] += 1
+        token = uuid.uuid4().hex
+        expires_at = time.time() + self.token_ttl
+        self._tokens[token] = expires_at
+        return web.json_response({'access_token': token, 'expires_at': int(expires_at * 1000)})
+
+    def _authorized(self, request: web.Request) -> bool:
+        token = request.headers.get('Authorization', '').partition('Bearer ')[2]
+        return self._tokens.get(token, 0) > time.time()
+
+    async def handle_chat(self, request: web.Request) -> web.StreamResponse:
+        self.stats['requests'] += 1
+        self.inflight += 1
+        self.stats['max_inflight'] = max(self.stats['max_inflight'], self.inflight)
+        try:
+            if not self._authorized(request):
+                self.stats['401'] += 1
+                return web.json_response({'status': 401, 'message': 'Token has expired'}, status=401)
+            payload = await request.json()
+            await asyncio.sleep(self.latency())
+
+            roll = random.random()
+            if roll < self.error_429:
+                self.stats['429'] += 1
+                headers = {'Retry-After': str(self.retry_after)} if self.retry_after is not None else None
+                return web.json_response({'status': 429, 'message': 'Too Many Requests'}, status=429,
+                                         headers=headers)
+            if roll < self.error_429 + self.error_500:
+                self.stats['500'] += 1
+                return web.json_response({'status': 500, 'message': 'Internal Server Error'}, status=500)
+
+            prompt = payload['messages'][-1]['content']
+            content, usage = await self._answer(prompt, payload)
+            self.stats['200'] += 1
+            if payload.get('stream'):
+                return await self._stream(request, content, usage)
+            return web.json_response({
+                'choices': [{'message': {'role': 'assistant', 'content': content}, 'index': 0,
+                             'finish_reason': 'stop'}],
+                'created': int(time.time()),
+                'model': payload.get('model', 'GigaChat'),
+                'object': 'chat.completion',
+                'usage': usage,
+            })
+        finally:
+            self.inflight -= 1
+
+    async def _answer(self, prompt: str, payload: dict):
+        key = prompt_key(prompt)
+        if self.record_path:
+            return await self._record(key, prompt, payload)
+        record = self._recordings.get(key)
+        if record is not None:
+            self.stats['replayed'] += 1
+            return record['content'], record['usage']
+        if self._recordings:
+            self.stats['replay_misses'] += 1
+        content = synthetic_answer(prompt)
+        prompt_tokens = estimate_tokens(prompt)
+        completion_tokens = estimate_tokens(content)
+        return content, {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                         'total_tokens': prompt_tokens + completion_tokens}
+
+    async def _record(self, key: str, prompt: str, payload: dict):
+        """Проксирует запрос в настоящий GigaChat и дописывает ответ в файл записи"""
+        if self._upstream is None:
+            from giga_client import AsyncGigaChat
+            self._upstream = AsyncGigaChat()
+            await self._upstream.initialize()
+        params = {name: value for name, value in payload.items() if name not in ('model', 'messages', 'stream')}
+        content, usage = await self._upstream._request(prompt, params)
+        record = {'key': key, 'prompt': prompt[:200], 'content': content, 'usage': usage}
+        self._recordings[key] = record
+        with open(self.record_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.stats['recorded'] += 1
+        return content, usage
+
+    async def _stream(self, request: web.Request, content: str, usage: dict) -> web.StreamResponse:
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        for start in range(0, len(content), STREAM_CHUNK_CHARS):
+            chunk = {'choices': [{'delta': {'content': content[start:start + STREAM_CHUNK_CHARS]}, 'index': 0}]}
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+            await asyncio.sleep(STREAM_CHUNK_DELAY)
+        last = {'choices': [{'delta': {}, 'index': 0, 'finish_reason': 'stop'}], 'usage': usage}
+        await response.write(f"data: {json.dumps(last)}\n\ndata: [DONE]\n\n".encode('utf-8'))
+        await response.write_eof()
+        return response
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        elapsed = time.monotonic() - self._started
+        return web.json_response({
+            **self.stats,
+            'inflight': self.inflight,
+            'uptime': round(elapsed, 1),
+            'requests_per_second': round(self.stats['requests'] / elapsed, 2) if elapsed else 0.0,
+        })
+
+    async def _close_upstream(self, app):
+        if self._upstream is not None:
+            await self._upstream.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Локальная заглушка GigaChat API')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--latency', default='0', help="Задержка chat: 0.3, uniform:0.1,0.5, lognormal:0.8,0.5, ...")
+    parser.add_argument('--auth-latency', default='0', help='Задержка OAuth в том же формате')
+    parser.add_argument('--error-429', type=float, default=0.0, help='Доля ответов 429')
+    parser.add_argument('--error-500', type=float, default=0.0, help='Доля ответов 500')
+    parser.add_argument('--retry-after', type=float, default=None, help='Retry-After для 429 (секунды)')
+    parser.add_argument('--token-ttl', type=float, default=TOKEN_TTL, help='Время жизни токена (секунды)')
+    parser.add_argument('--seed', type=int, default=None, help='Seed для задержек и ошибок')
+    modes = parser.add_mutually_exclusive_group()
+    modes.add_argument('--record', metavar='PATH', help='Проксировать в GigaChat и записывать ответы в JSONL')
+    modes.add_argument('--replay', metavar='PATH', help='Отвечать записанными ответами из JSONL')
+    args = parser.parse_args()
+    overridden = [name for name in ('GIGACHAT_CHAT_URL', 'GIGACHAT_AUTH_URL') if name in os.environ]
+    if args.record and overridden:
+        # Запись идёт в настоящий GigaChat по адресам giga_client; переопределённые адреса
+        # (запросы или получение токена) могли бы указывать на заглушку
+        parser.error(f"--record: уберите {', '.join(overridden)} из окружения заглушки")
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    stub = GigaChatStub(latency=args.latency, auth_latency=args.auth_latency, error_429=args.error_429,
+                        error_500=args.error_500, retry_after=args.retry_after, token_ttl=args.token_ttl,
+                        record_path=args.record, replay_path=args.replay)
+    print(f"🧪 Заглушка GigaChat: http://{args.host}:{args.port}{CHAT_PATH}")
+    web.run_app(stub.app(), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from ngram_index import NGRAM_RANGE, char_ngrams
+
+CHUNK_SIZE = 256  # Строк предложений в одном блоке умножения матриц
+
+
+class LexicalSimilarityEngine:
+    """Лексическая схожесть всех предложений со всеми маркерами.
+
+    Предложения и маркеры один раз векторизуются как TF-IDF по символьным
+    n-граммам в разреженные матрицы, после чего вся матрица схожести
+    предложение×маркер считается блочным умножением матриц.
+    """
+
+    def __init__(self, sentences: List[str], markers: List[str],
+                 ngram_range: Tuple[int, int] = NGRAM_RANGE, chunk_size: int = CHUNK_SIZE,
+                 marker_counts: Optional[Dict[str, dict]] = None):
+        self.sentences = list(dict.fromkeys(sentences))
+        self.markers = list(dict.fromkeys(markers))
+        self.sentence_ids = {sent: i for i, sent in enumerate(self.sentences)}
+        self.marker_ids = {marker: i for i, marker in enumerate(self.markers)}
+        self.ngram_range = ngram_range
+        self.chunk_size = max(1, chunk_size)
+
+        self.vocabulary: Dict[str, int] = {}
+        sentence_counts = [char_ngrams(sent, ngram_range) for sent in self.sentences]
+        # n-граммы маркеров могут прийти готовыми из скомпилированной модели триггеров
+        marker_counts = [
+            marker_counts[marker] if marker_counts and marker in marker_counts and ngram_range == NGRAM_RANGE
+            else char_ngrams(marker, ngram_range)
+            for marker in self.markers
+        ]
+        for counts in sentence_counts + marker_counts:
+            for gram in counts:
+                self.vocabulary.setdefault(gram, len(self.vocabulary))
+
+        sentence_tf = self._count_matrix(sentence_counts)
+        marker_tf = self._count_matrix(marker_counts)
+
+        # Сглаженный IDF по всем документам (предложения и маркеры вместе)
+        documents = len(sentence_counts) + len(marker_counts)
+        df = np.bincount(sentence_tf.indices, minlength=len(self.vocabulary)) + \
+            np.bincount(marker_tf.indices, minlength=len(self.vocabulary))
+        self.idf = (np.log((1 + documents) / (1 + df)) + 1).astype(np.float32)
+
+        self.sentence_matrix = self._tfidf(sentence_tf)
+        self.marker_matrix = self._tfidf(marker_tf)
+        self.matrix = self._compute_similarity()
+
+    def _count_matrix(self, counts_list: List[Counter]) -> sparse.csr_matrix:
+        indptr = [0]
+        indices = []
+        data = []
+        for counts in counts_list:
+            for gram, count in counts.items():
+                indices.append(self.vocabulary[gram])
+                data.append(count)
+            indptr.append(len(indices))
+        return sparse.csr_matrix(
+            (np.array(data, dtype=np.float32), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+            shape=(len(counts_list), len(self.vocabulary))
+        )
+
+    def _tfidf(self, tf: sparse.csr_matrix) -> sparse.csr_matrix:
+        weighted = tf.multiply(self.idf).tocsr()
+        norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return sparse.diags(1.0 / norms).dot(weighted).tocsr().astype(np.float32)
+
+    def _compute_similarity(self) -> np.ndarray:
+        """Косинусная схожесть всех пар, блоками по chunk_size предложений"""
+        result = np.zeros((len(self.sentences), len(self.markers)), dtype=np.float32)
+        markers_t = self.marker_matrix.T.tocsc()
+        for start in range(0, len(self.sentences), self.chunk_size):
+            block = self.sentence_matrix[start:start + self.chunk_size]
+            result[start:start + block.shape[0]] = block.dot(markers_t).toarray()
+        return result
+
+    def covers(self, sentence: str, marker: str) -> bool:
+        """Есть ли пара в матрице"""
+        return sentence in self.sentence_ids and marker in self.marker_ids
+
+    def similarity(self, sentence: str, marker: str) -> Optional[float]:
+        """Схожесть пары из матрицы или None, если пара не векторизована"""
+        sent_id = self.sentence_ids.get(sentence)
+        marker_id = self.marker_ids.get(marker)
+        if sent_id is None or marker_id is None:
+            return None
+        return float(self.matrix[sent_id, marker_id])
+
+    def top_k(self, marker: str, k: int) -> List[Tuple[str, float]]:
+        """Возвращает k самых похожих на маркер предложений по убыванию схожести"""
+        marker_id = self.marker_ids.get(marker)
+        if marker_id is None or k <= 0:
+            return []
+        column = self.matrix[:, marker_id]
+        k = min(k, len(column))
+        if k == 0:
+            return []
+        best = np.argpartition(-column, k - 1)[:k]
+        best = best[np.argsort(-column[best], kind='stable')]
+        return [(self.sentences[i], float(column[i])) for i in best]
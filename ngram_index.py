@@ -0,0 +1,96 @@
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+from russian_stemmer import stem_table
+
+WORD_RE = re.compile(r'\w+')
+
+# Параметры отбора кандидатов
+MIN_WORD_LENGTH = 3  # Более короткие слова не индексируются
+MAX_GRAM_FREQUENCY = 0.5  # Граммы, встречающиеся в большей доле предложений, не учитываются
+MIN_SHARED_GRAMS = 3  # Минимум общих граммов для попадания в кандидаты
+MAX_CANDIDATES = 60  # Максимум кандидатов на один маркер
+
+NGRAM_RANGE = (2, 4)  # Длины символьных n-грамм TF-IDF (lexical_engine)
+
+
+Gram = Union[int, str]  # Идентификатор основы слова (stem_table) или символьная триграмма
+
+
+def char_ngrams(text: str, ngram_range: Tuple[int, int] = NGRAM_RANGE) -> Counter:
+    """Считает символьные n-граммы внутри слов (с границами слова, как char_wb).
+    Лежит здесь, а не в lexical_engine, чтобы модель триггеров загружалась без numpy/scipy"""
+    grams = Counter()
+    min_n, max_n = ngram_range
+    for word in WORD_RE.findall(text.lower().replace('ё', 'е')):
+        padded = f" {word} "
+        for n in range(min_n, max_n + 1):
+            for i in range(len(padded) - n + 1):
+                grams[padded[i:i + n]] += 1
+    return grams
+
+
+def extract_grams(text: str) -> Set[Gram]:
+    """Возвращает множество граммов фразы: основы слов и символьные триграммы"""
+    return grams_from_words(WORD_RE.findall(text.lower().replace('ё', 'е')))
+
+
+def grams_from_words(words: Iterable[str]) -> Set[Gram]:
+    """Граммы уже разбитой на слова фразы (слова в нижнем регистре, ё -> е)"""
+    grams = set()
+    for word in words:
+        if len(word) < MIN_WORD_LENGTH:
+            continue
+        grams.add(stem_table.word_id(word))
+        padded = f"#{word}#"
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+class NgramIndex:
+    """Инвертированный индекс предложений по граммам для быстрого отбора кандидатов"""
+
+    def __init__(self, sentences: List[str], max_gram_frequency: float = MAX_GRAM_FREQUENCY,
+                 sentence_tokens: Optional[Sequence[Sequence[str]]] = None):
+        """sentence_tokens - готовые слова предложений (PreparedTranscript.tokens)"""
+        self.sentences = sentences
+        self.postings: Dict[Gram, List[int]] = {}
+        for sent_id, sent in enumerate(sentences):
+            grams = grams_from_words(sentence_tokens[sent_id]) if sentence_tokens is not None else extract_grams(sent)
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(sent_id)
+
+        # Слишком частые граммы не различают предложения, убираем их из индекса
+        max_postings = max(1, int(len(sentences) * max_gram_frequency))
+        self.postings = {gram: ids for gram, ids in self.postings.items() if len(ids) <= max_postings}
+
+    def candidates(self, marker: str, min_shared: int = MIN_SHARED_GRAMS,
+                   limit: int = MAX_CANDIDATES, grams: Optional[Iterable[Gram]] = None) -> List[str]:
+        """Возвращает предложения, разделяющие с маркером больше всего граммов,
+        в исходном порядке текста. Граммы маркера можно передать готовыми."""
+        shared = Counter()
+        for gram in (grams if grams is not None else extract_grams(marker)):
+            ids = self.postings.get(gram)
+            if ids:
+                shared.update(ids)
+
+        # При равном числе общих граммов выигрывает более раннее предложение,
+        # чтобы отбор не зависел от порядка обхода множеств
+        ranked = sorted(shared.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        best = [sent_id for sent_id, count in ranked if count >= min_shared]
+        return [self.sentences[sent_id] for sent_id in sorted(best)]
+
+    def candidates_for_triggers(self, triggers: dict, marker_grams: Optional[Dict[str, frozenset]] = None,
+                                **kwargs) -> Dict[str, List[str]]:
+        """Отбирает кандидатов для каждого маркера из файла триггеров"""
+        marker_grams = marker_grams or {}
+        result = {}
+        for indicators in triggers.values():
+            for data in indicators.values():
+                for markers_key in ('positive_markers', 'negative_markers'):
+                    for marker in data[markers_key]:
+                        if marker and marker not in result:
+                            result[marker] = self.candidates(marker, grams=marker_grams.get(marker), **kwargs)
+        return result
@@ -0,0 +1,122 @@
+import hashlib
+import re
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from ngram_index import MIN_WORD_LENGTH
+from russian_stemmer import stem_table
+from sentence_segmenter import split_sentences
+
+PREPARE_VERSION = 2  # Увеличивайте при изменении разбиения, токенизации или состава PreparedTranscript
+TRANSCRIPT_CACHE_SIZE = 32  # Подготовленных стенограмм в памяти процесса (LRU)
+
+WORD_RE = re.compile(r'\w+')
+
+
+class FilterConfig(NamedTuple):
+    """Пороги SmartPhraseFilter.filter_batch, с которыми готовится стенограмма"""
+    min_length: int = 20
+    max_stopword_ratio: float = 0.7
+    min_meaningful_words: int = 3
+    limit: Optional[int] = None  # Максимум значимых предложений (None - без ограничения)
+
+
+class PreparedTranscript(NamedTuple):
+    """Результат предобработки стенограммы. Неизменяемый: один объект из кэша
+    разделяют все анализы одного текста (с любым файлом триггеров).
+
+    sentences, tokens, stems и categories выровнены по значимым предложениям;
+    filter_reasons - по всем просмотренным фильтром предложениям all_sentences.
+    """
+    digest: str
+    config: FilterConfig
+    sentences: Tuple[str, ...]
+    tokens: Tuple[Tuple[str, ...], ...]  # Слова предложения в нижнем регистре, ё -> е
+    stems: Tuple[frozenset, ...]  # Идентификаторы основ (stem_table) слов не короче MIN_WORD_LENGTH
+    categories: Tuple[str, ...]  # Тематика предложения (categorize_content)
+    all_sentences: Tuple[str, ...]
+    filter_reasons: Tuple[Optional[str], ...]  # None - предложение прошло фильтр, иначе причина
+    stats: Tuple[Tuple[str, object], ...]  # Статистика filter_batch без изменяемых контейнеров
+
+    def filter_stats(self) -> dict:
+        """Статистика фильтрации в формате SmartPhraseFilter.filter_batch (новый словарь)"""
+        stats = dict(self.stats)
+        stats['filtered_examples'] = {reason: list(examples) for reason, examples in stats['filtered_examples']}
+        return stats
+
+    def stems_by_sentence(self) -> Dict[str, frozenset]:
+        return dict(zip(self.sentences, self.stems))
+
+    def categories_by_sentence(self) -> Dict[str, str]:
+        return dict(zip(self.sentences, self.categories))
+
+
+def transcript_digest(text: str) -> str:
+    """SHA-256 текста стенограммы"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def tokenize(text: str) -> Tuple[str, ...]:
+    return tuple(WORD_RE.findall(text.lower().replace('ё', 'е')))
+
+
+def prepare_transcript(text: str, config: FilterConfig, phrase_filter,
+                       categorize: Callable[[str], str], digest: Optional[str] = None) -> PreparedTranscript:
+    """Разбивает текст на предложения, фильтрует их phrase_filter (SmartPhraseFilter)
+    и вычисляет признаки значимых предложений"""
+    all_sentences = split_sentences(text)
+    verdicts, stats = phrase_filter.filter_batch(
+        all_sentences, min_length=config.min_length, max_stopword_ratio=config.max_stopword_ratio,
+        min_meaningful_words=config.min_meaningful_words, limit=config.limit
+    )
+    sentences = tuple(sent for sent, reason in zip(all_sentences, verdicts) if reason is None)
+    tokens = tuple(tokenize(sent) for sent in sentences)
+    stats['filtered_examples'] = tuple(
+        (reason, tuple(examples)) for reason, examples in stats['filtered_examples'].items()
+    )
+    return PreparedTranscript(
+        digest=digest or transcript_digest(text),
+        config=config,
+        sentences=sentences,
+        tokens=tokens,
+        stems=tuple(stem_table.word_ids(words, MIN_WORD_LENGTH) for words in tokens),
+        categories=tuple(categorize(sent) for sent in sentences),
+        all_sentences=tuple(all_sentences),
+        filter_reasons=tuple(verdicts),
+        stats=tuple(stats.items()),
+    )
+
+
+class TranscriptCache:
+    """LRU подготовленных стенограмм по дайджесту текста и настройкам фильтра.
+    Повторный анализ той же загрузки (в том числе с другим файлом триггеров)
+    не повторяет разбиение, фильтрацию и токенизацию."""
+
+    def __init__(self, max_entries: int = TRANSCRIPT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.stats = Counter()
+        self._entries: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, text: str, config: FilterConfig, phrase_filter,
+            categorize: Callable[[str], str]) -> Tuple[PreparedTranscript, bool]:
+        """Возвращает подготовленную стенограмму и признак попадания в кэш"""
+        digest = transcript_digest(text)
+        key = (PREPARE_VERSION, digest, config)
+        prepared = self._entries.get(key)
+        if prepared is not None:
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return prepared, True
+
+        self.stats['misses'] += 1
+        prepared = prepare_transcript(text, config, phrase_filter, categorize, digest)
+        self._entries[key] = prepared
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return prepared, False
+
+    def clear(self):
+        self._entries.clear()
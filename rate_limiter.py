@@ -0,0 +1,69 @@
+import asyncio
+import time
+from typing import Optional
+
+REQUESTS_PER_SECOND = 5.0  # Запросов к GigaChat в секунду
+TOKENS_PER_MINUTE = 60000  # Токенов в минуту (оценка по длине промпта)
+CHARS_PER_TOKEN = 3  # Грубая оценка: символов русского текста на один токен
+
+
+def estimate_tokens(text: str) -> int:
+    """Оценка числа токенов промпта для лимита tokens/min"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class TokenBucket:
+    """Корзина токенов: ёмкость capacity, пополняется со скоростью rate в секунду"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """Через сколько секунд в корзине наберётся amount (0, если уже есть)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """Ограничение запросов в секунду и токенов в минуту.
+
+    Ожидающие обслуживаются по очереди, поэтому большой запрос не голодает
+    из-за потока мелких.
+    """
+
+    def __init__(self, requests_per_second: Optional[float] = REQUESTS_PER_SECOND,
+                 tokens_per_minute: Optional[float] = TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_second, max(1.0, requests_per_second)) if requests_per_second else None
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute) if tokens_per_minute else None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int = 1) -> float:
+        """Ждёт разрешения на запрос с tokens токенами и возвращает время ожидания в секундах"""
+        waited = 0.0
+        async with self._lock:
+            while True:
+                delay = max(
+                    self.requests.delay(1) if self.requests else 0.0,
+                    self.tokens.delay(tokens) if self.tokens else 0.0,
+                )
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+                waited += delay
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(tokens)
+        return waited
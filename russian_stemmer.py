@@ -0,0 +1,165 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Стеммер Snowball для русского языка (snowballstem.org/algorithms/russian/stemmer.html)
+# без внешних зависимостей. Окончания каждой группы отсортированы по убыванию длины:
+# удаляется самое длинное совпавшее окончание, лежащее в области RV.
+VOWELS = frozenset('аеиоуыэюя')
+
+
+def _longest_first(*suffixes: str) -> Tuple[str, ...]:
+    return tuple(sorted(suffixes, key=len, reverse=True))
+
+
+# Окончания первой группы удаляются, только если перед ними стоит «а» или «я»
+PERFECTIVE_GERUND_1 = frozenset({'в', 'вши', 'вшись'})
+PERFECTIVE_GERUND = _longest_first(*PERFECTIVE_GERUND_1, 'ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись')
+ADJECTIVE = _longest_first(
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+    'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+)
+PARTICIPLE_1 = frozenset({'ем', 'нн', 'вш', 'ющ', 'щ'})
+PARTICIPLE = _longest_first(*PARTICIPLE_1, 'ивш', 'ывш', 'ующ')
+REFLEXIVE = _longest_first('ся', 'сь')
+VERB_1 = frozenset({
+    'ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно',
+})
+VERB = _longest_first(
+    *VERB_1, 'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым',
+    'ен', 'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю',
+)
+NOUN = _longest_first(
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой', 'ий', 'й',
+    'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия', 'ья', 'я',
+)
+SUPERLATIVE = _longest_first('ейш', 'ейше')
+DERIVATIONAL = _longest_first('ост', 'ость')
+
+
+def _region_after_vowel_consonant(word: str, start: int) -> int:
+    """Начало области после первой пары «гласная, согласная», найденной с позиции start"""
+    for i in range(start + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            return i + 1
+    return len(word)
+
+
+def _strip(word: str, region: int, suffixes: Tuple[str, ...],
+           after_a: frozenset = frozenset()) -> Optional[str]:
+    """Слово без самого длинного окончания из suffixes, лежащего в области [region:).
+    None, если окончание не найдено или окончание из after_a не предварено «а»/«я»."""
+    for suffix in suffixes:
+        if word.endswith(suffix):
+            start = len(word) - len(suffix)
+            if start < region:
+                continue
+            if suffix in after_a and (start - 1 < region or word[start - 1] not in 'ая'):
+                return None
+            return word[:start]
+    return None
+
+
+def stem(word: str) -> str:
+    """Основа русского слова по алгоритму Snowball. Ожидается слово в нижнем регистре;
+    ё приравнивается к е, слова без кириллицы возвращаются без изменений."""
+    word = word.replace('ё', 'е')
+    rv = len(word)
+    for i, char in enumerate(word):
+        if char in VOWELS:
+            rv = i + 1
+            break
+    r2 = _region_after_vowel_consonant(word, _region_after_vowel_consonant(word, 0))
+
+    # Шаг 1: деепричастие совершенного вида; иначе возвратная частица и затем
+    # прилагательное (с причастием), глагол или существительное
+    result = _strip(word, rv, PERFECTIVE_GERUND, PERFECTIVE_GERUND_1)
+    if result is None:
+        reflexive = _strip(word, rv, REFLEXIVE)
+        if reflexive is not None:
+            word = reflexive
+        result = _strip(word, rv, ADJECTIVE)
+        if result is not None:
+            participle = _strip(result, rv, PARTICIPLE, PARTICIPLE_1)
+            if participle is not None:
+                result = participle
+        else:
+            result = _strip(word, rv, VERB, VERB_1)
+            if result is None:
+                result = _strip(word, rv, NOUN)
+    if result is not None:
+        word = result
+
+    # Шаг 2: конечная «и»
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Шаг 3: словообразовательный суффикс в области R2
+    derivational = _strip(word, max(r2, rv), DERIVATIONAL)
+    if derivational is not None:
+        word = derivational
+
+    # Шаг 4: превосходная степень, удвоенная «н», мягкий знак
+    superlative = _strip(word, rv, SUPERLATIVE)
+    if superlative is not None:
+        word = superlative
+        if word.endswith('нн') and len(word) - 1 >= rv:
+            word = word[:-1]
+    elif word.endswith('нн') and len(word) - 1 >= rv:
+        word = word[:-1]
+    elif word.endswith('ь') and len(word) - 1 >= rv:
+        word = word[:-1]
+    return word
+
+
+class StemTable:
+    """Мемоизированная таблица основ: слово -> идентификатор основы (int).
+
+    Одна таблица на процесс (stem_table) разделяется предложениями, маркерами и
+    анализами, поэтому каждое слово стеммируется один раз. Идентификаторы
+    действительны только внутри процесса; между процессами переносится словарь
+    «слово -> основа» (memo), например в артефакте модели триггеров.
+    """
+
+    def __init__(self):
+        self.stems: List[str] = []
+        self.stem_ids: Dict[str, int] = {}
+        self._word_ids: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._word_ids)
+
+    def _stem_id(self, word_stem: str) -> int:
+        stem_id = self.stem_ids.get(word_stem)
+        if stem_id is None:
+            stem_id = self.stem_ids[word_stem] = len(self.stems)
+            self.stems.append(word_stem)
+        return stem_id
+
+    def word_id(self, word: str) -> int:
+        """Идентификатор основы слова (в нижнем регистре)"""
+        stem_id = self._word_ids.get(word)
+        if stem_id is None:
+            stem_id = self._word_ids[word] = self._stem_id(stem(word))
+        return stem_id
+
+    def word_ids(self, words: Iterable[str], min_length: int = 0) -> frozenset:
+        """Множество идентификаторов основ слов не короче min_length"""
+        return frozenset(self.word_id(word) for word in words if len(word) >= min_length)
+
+    def stem_of(self, word: str) -> str:
+        return self.stems[self.word_id(word)]
+
+    def memo(self, words: Optional[Iterable[str]] = None) -> Dict[str, str]:
+        """Словарь «слово -> основа» для всех слов таблицы или только для words"""
+        if words is None:
+            return {word: self.stems[stem_id] for word, stem_id in self._word_ids.items()}
+        return {word: self.stem_of(word) for word in words}
+
+    def update(self, memo: Dict[str, str]):
+        """Добавляет готовые основы слов без повторного стемминга"""
+        for word, word_stem in memo.items():
+            if word not in self._word_ids:
+                self._word_ids[word] = self._stem_id(word_stem)
+
+
+# Общая таблица основ процесса
+stem_table = StemTable()
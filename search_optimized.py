@@ -1,54 +1,124 @@
-import pandas as pd
-from docx import Document
 import asyncio
-import uuid
-import aiohttp
 import json
 import re
 from io import BytesIO
-from typing import List, Dict, Tuple, Optional
+from typing import TYPE_CHECKING, List, Dict, Tuple, Optional, Union
 from difflib import SequenceMatcher
 import logging
 import os
 import string
 import time
+from collections import Counter
 
 # Импортируем умный фильтр и подробную отчётность
 from smart_filter import SmartPhraseFilter
+from prepared_transcript import FilterConfig, PreparedTranscript, TranscriptCache
+from ngram_index import NgramIndex
+from similarity_cache import PersistentAdviceCache, PersistentSimilarityCache, make_key
+from giga_client import AsyncGigaChat
+from token_ledger import ANALYSIS_TOKEN_BUDGET, BudgetExceeded
+from circuit_breaker import CircuitOpen
+
+# Движки на numpy/scipy импортируются при первом анализе, а не при загрузке модуля
+if TYPE_CHECKING:
+    from lexical_engine import LexicalSimilarityEngine
+    from trigger_model import TriggerModel
+    from cascade_scorer import CascadeScorer
+    from embeddings import EmbeddingBackend
 # from detailed_report import format_detailed_report
 
-AUTH_KEY = 'ZGMzMGJmZjEtODQwYS00ZjAwLWI2NjgtNGIyNGNiY2ViNmE1OjYwNjM3NTU0LWQxMDctNDA5ZS1hZWM3LTAwYjQ5MjZkOGU2OA=='
-SCOPE = 'GIGACHAT_API_PERS'
-API_AUTH_URL = 'https://ngw.devices.sberbank.ru:9443/api/v2/oauth'
-API_CHAT_URL = 'https://gigachat.devices.sberbank.ru/api/v1/chat/completions'
-MAX_TOKENS = 20000  # Лимит токенов для GigaChat
-
 # КАРДИНАЛЬНО ИСПРАВЛЕННЫЕ настройки
 SEMANTIC_THRESHOLD = 0.12  # 🔧 ЕЩЕ СНИЖЕН порог с 15% до 12% для лучшего поиска негативных совпадений
 MAX_SENTENCES = 500  # 🔧 УВЕЛИЧЕН лимит с 200 до 500 предложений
 MIN_SIMILARITY_FOR_AI = 0.08  # 🔧 ЕЩЕ СНИЖЕН порог для AI с 10% до 8% для поиска негативных маркеров
 MAX_SIMILARITY_CAP = 0.85  # 🔧 ЕЩЕ УВЕЛИЧЕН лимит с 75% до 85%
-CACHE_SIZE_LIMIT = 1000
+CACHE_SIZE_LIMIT = 200000  # Максимум оценок в постоянном кэше (LRU)
+DETERMINISTIC_SCORING = True  # Промпты схожести с температурой 0: повторные запуски дают те же оценки
+# Версии шаблонов промптов. Версия шаблона входит в ключ кэша его оценок:
+# при изменении шаблона увеличьте его версию, и устареют только его записи
+PROMPT_VERSIONS = {
+    'similarity_pos': 'v1',  # check_semantic_similarity_positive
+    'similarity_neg': 'v1',  # check_semantic_similarity_strict
+    'similarity_batch': 'v1',  # check_semantic_similarity_batch
+    'marker_batch': 'v1',  # check_marker_similarity_batch
+    'advice': 'v1',  # _advice_prompt
+}
 
 # 🔧 МАКСИМАЛЬНО ОСЛАБЛЕННЫЕ ограничения для нахождения позитивных совпадений
 MAX_POSITIVE_MATCHES = 10  # УВЕЛИЧЕН с 5 до 10 позитивных совпадений на индикатор
 MAX_NEGATIVE_MATCHES = 8  # УВЕЛИЧЕН с 5 до 8 негативных совпадений на индикатор
+USE_MATCH_CAPS = True  # Ранжированная проверка с остановкой по лимитам совпадений и обрезкой примеров
+LEXICAL_BOUND_MARGIN = 0.3  # Насколько оценка ИИ может превысить базовое сходство при ранней остановке
 MIN_PERCENTAGE = -200  # СНИЖЕН с -100% до -200%
 MAX_PERCENTAGE = 300  # УВЕЛИЧЕН с 200% до 300%
 
+# Параллельная обработка сравнений
+MAX_CONCURRENT_REQUESTS = 8  # Максимум одновременных запросов к GigaChat
+LLM_BATCH_SIZE = 30  # Маркеров в одном пакетном запросе (1 - отдельный запрос на каждую пару)
+
+# Предварительный отбор кандидатов по n-граммному индексу
+USE_NGRAM_INDEX = True  # Отключите, чтобы сравнить каждый маркер со всеми предложениями (проверка полноты)
+
+# Базовое сходство из матрицы TF-IDF по символьным n-граммам вместо SequenceMatcher.
+# Косинусная схожесть в среднем заметно выше отношения SequenceMatcher, а пороги
+# выше подобраны под SequenceMatcher, поэтому режим включается явно
+USE_LEXICAL_ENGINE = False
+
+# Режим оценки схожести:
+#   'llm'     - GigaChat оценивает всех кандидатов
+#   'rerank'  - GigaChat оценивает только лучших кандидатов векторного поиска по локальным эмбеддингам
+#   'offline' - только локальные эмбеддинги, без сети
+#   'cascade' - дешёвые стадии (основы, TF-IDF, эмбеддинги), GigaChat только для неуверенных пар
+SCORING_MODE = 'llm'
+EMBEDDING_BACKEND = 'hashing'
+RERANK_TOP_K = 5  # Кандидатов на маркер для переоценки через GigaChat
+OFFLINE_TOP_K = 10  # Кандидатов на маркер в локальном режиме
+EMBEDDING_MATCH_THRESHOLD = 0.25  # Минимальная косинусная схожесть эмбеддингов для совпадения в локальном режиме
+# Полоса неопределённости каскада: оценка стадии ниже нижней границы - не совпадение,
+# выше верхней - совпадение, внутри полосы пара уходит на следующую стадию и в итоге в GigaChat
+CASCADE_BAND = (SEMANTIC_THRESHOLD - 0.03, SEMANTIC_THRESHOLD + 0.18)
+CASCADE_STAGE_BANDS = {}  # Отдельные полосы для стадий, например {'embedding': (0.05, 0.35)}
+# CASCADE_BAND задана в шкале SequenceMatcher, а лексическая стадия оценивает пары косинусом
+# TF-IDF, который заметно выше. Её полоса зависит от источника базового сходства: он решает,
+# какие пары доходят до каскада. Как подобраны полосы: на стенограмме backstage/trans.docx
+# и triggers.xlsx (в репозиторий не входят) взяты пары, прошедшие проверку контекста и порог
+# базового сходства 0.05, и для каждой границы CASCADE_BAND найдена доля пар ниже неё по
+# SequenceMatcher; граница полосы - квантиль косинуса TF-IDF тех же пар с этой долей.
+# При источнике 'sequence' до каскада доходит ~2 тыс. пар, из них 97.7% ниже 0.09 и 0.1%
+# выше 0.30 по SequenceMatcher. При источнике 'tfidf' порог 0.05 почти ничего не отсекает
+# (~21 тыс. пар), и по SequenceMatcher 99.8% из них ниже 0.09: поэтому полоса 'tfidf'
+# узкая и почти всё отсекает. Для другого корпуса полосы нужно подобрать заново тем же способом
+CASCADE_LEXICAL_BANDS = {
+    'sequence': (0.21, 0.31),  # Базовое сходство SequenceMatcher (use_lexical_engine=False)
+    'tfidf': (0.28, 0.32),  # Базовое сходство из матрицы TF-IDF
+}
+
+# Пороги предобработки: preprocess_text_optimized и анализ компетенций (до 85% стоп-слов)
+PREPROCESS_FILTER = FilterConfig(min_length=20, max_stopword_ratio=0.7, min_meaningful_words=3, limit=MAX_SENTENCES)
+ANALYSIS_FILTER = FilterConfig(min_length=20, max_stopword_ratio=0.85, min_meaningful_words=3, limit=MAX_SENTENCES)
+
+DEGRADED_NOTICE = "⚠️ ДЕГРАДИРОВАННЫЙ РЕЖИМ: GigaChat был недоступен, часть оценок получена локально без ИИ"
+DEFAULT_ADVICE = "Сформулируйте мысль конструктивно, с акцентом на развитие и готовность к изменениям."
+
 # Инициализируем умный фильтр с ослабленными критериями для поиска позитивных совпадений
 smart_filter = SmartPhraseFilter()
 
-# Глобальный кэш для ускорения
-similarity_cache = {}
+# Глобальный кэш для ускорения, сохраняется на диске между перезапусками
+similarity_cache = PersistentSimilarityCache(max_entries=CACHE_SIZE_LIMIT)
+advice_cache = PersistentAdviceCache(max_entries=CACHE_SIZE_LIMIT)
+# Подготовленные стенограммы по дайджесту текста и порогам фильтра
+transcript_cache = TranscriptCache()
 
 def load_transcript(path: str) -> str:
     """Читает весь текст встречи из .docx и возвращает строку."""
+    # python-docx и pandas импортируются при первом использовании, а не при запуске бота
+    from docx import Document
     doc = Document(path)
     return "\n".join(para.text for para in doc.paragraphs if para.text.strip())
 
 def load_triggers(xlsx_path: str) -> dict:
     """Загружает триггеры из Excel файла с группировкой по компетенциям и индикаторам."""
+    import pandas as pd
     df = pd.read_excel(xlsx_path, sheet_name='Лист1')
     df.columns = df.columns.str.strip()
 
@@ -95,6 +165,16 @@ def load_triggers(xlsx_path: str) -> dict:
     logging.info(result)
     return result
 
+def collect_markers(triggers: dict) -> List[str]:
+    """Возвращает все уникальные непустые маркеры из триггеров в порядке появления"""
+    markers = {}
+    for indicators in triggers.values():
+        for data in indicators.values():
+            for marker in list(data['positive_markers']) + list(data['negative_markers']):
+                if marker:
+                    markers.setdefault(marker, None)
+    return list(markers)
+
 def is_meaningful_phrase(phrase: str) -> bool:
     """Умная проверка значимости фразы с ОСЛАБЛЕННЫМИ критериями для поиска позитивных совпадений."""
     return smart_filter.is_meaningful_phrase_basic(phrase, min_length=20, min_meaningful_words=3)
@@ -129,10 +209,9 @@ def categorize_content(text: str) -> str:
     
     return 'general'
 
-def is_contextually_relevant(sentence: str, marker: str) -> bool:
+def is_contextually_relevant(sentence: str, marker: str, sent_category: Optional[str] = None) -> bool:
     """🔧 ОСЛАБЛЕННАЯ ФУНКЦИЯ: Более мягкая проверка контекстуальной релевантности для поиска негативных маркеров"""
-    sent_category = categorize_content(sentence)
-    marker_category = categorize_content(marker)
+    sent_category = sent_category or categorize_content(sentence)
     
     # 🔧 ОСЛАБЛЕННЫЕ ПРАВИЛА: разрешаем больше совпадений для поиска негативных маркеров
     
@@ -147,10 +226,9 @@ def is_contextually_relevant(sentence: str, marker: str) -> bool:
     # Все остальные совпадения разрешаем для поиска негативных маркеров
     return True
 
-def is_contextually_relevant_positive(sentence: str, marker: str) -> bool:
+def is_contextually_relevant_positive(sentence: str, marker: str, sent_category: Optional[str] = None) -> bool:
     """🔧 МАКСИМАЛЬНО ОСЛАБЛЕННАЯ проверка для ПОЗИТИВНЫХ маркеров - почти все разрешено"""
-    sent_category = categorize_content(sentence)
-    marker_category = categorize_content(marker)
+    sent_category = sent_category or categorize_content(sentence)
     
     # Для позитивных маркеров разрешаем почти все
     # Блокируем только явно неподходящие короткие формальные фразы
@@ -160,141 +238,192 @@ def is_contextually_relevant_positive(sentence: str, marker: str) -> bool:
     # Все остальное разрешаем для позитивных совпадений
     return True
 
+def prepare_text(text: str, config: FilterConfig = ANALYSIS_FILTER) -> Tuple[PreparedTranscript, bool]:
+    """Единая предобработка: разбиение на предложения, фильтрация smart_filter, слова,
+    основы и тематика предложений. Результат кэшируется по дайджесту текста и порогам,
+    возвращается вместе с признаком попадания в кэш."""
+    return transcript_cache.get(text, config, smart_filter, categorize_content)
+
 def preprocess_text_optimized(text: str) -> List[str]:
     """Оптимизированная предобработка текста"""
-    # Разбиваем на предложения
-    sentences = []
-    current_sentence = []
-
-    for char in text:
-        current_sentence.append(char)
-        if char in '.!?':
-            sentence = ''.join(current_sentence).strip()
-            if sentence and len(sentence) > 10:
-                sentences.append(sentence)
-            current_sentence = []
-
-    if current_sentence:
-        final_sentence = ''.join(current_sentence).strip()
-        if final_sentence and len(final_sentence) > 10:
-            sentences.append(final_sentence)
-
-    # Фильтруем только значимые предложения
-    meaningful_sentences = []
-    for sent in sentences:
-        if is_meaningful_phrase(sent):
-            meaningful_sentences.append(sent)
-        
-        # Ограничиваем количество для ускорения
-        if len(meaningful_sentences) >= MAX_SENTENCES:
-            break
+    # Значимые предложения (не больше MAX_SENTENCES для ускорения)
+    prepared, _ = prepare_text(text, PREPROCESS_FILTER)
+    return list(prepared.sentences)
+
+def _similarity_template(polarity: str, batched: bool = False) -> str:
+    """Шаблон промпта, которым оценивается пара: пакетный или одиночный для полярности"""
+    if batched:
+        return 'similarity_batch'
+    return 'similarity_pos' if polarity == 'pos' else 'similarity_neg'
+
+def _prompt_version(template: str, scoring: bool = True) -> str:
+    """Версия шаблона для ключа кэша. Для промптов оценок (scoring=True) включает
+    режим выборки DETERMINISTIC_SCORING, с которым они отправляются"""
+    if not scoring:
+        return f"{template}:{PROMPT_VERSIONS[template]}"
+    sampling = 'det' if DETERMINISTIC_SCORING else 'sampled'
+    return f"{template}:{PROMPT_VERSIONS[template]}:{sampling}"
+
+def _similarity_cache_key(polarity: str, sent: str, marker: str, batched: bool = False,
+                          lexical: Optional['LexicalSimilarityEngine'] = None, scoring_mode: str = 'llm') -> str:
+    """Ключ кэша схожести для позитивной ('pos') или негативной ('neg') проверки.
+    Оценки на базовом сходстве из матрицы TF-IDF и из SequenceMatcher хранятся раздельно,
+    как и оценки разных режимов: состав пакетных запросов в них разный"""
+    variant = []
+    if lexical is not None and lexical.covers(sent, marker):
+        variant.append('tfidf')
+    if scoring_mode != 'llm':
+        variant.append(scoring_mode)
+    return make_key(polarity, sent, marker, _prompt_version(_similarity_template(polarity, batched)), '+'.join(variant))
+
+def _base_similarity(sent: str, marker: str, lexical: Optional['LexicalSimilarityEngine'] = None) -> float:
+    """Базовое лексическое сходство: из матрицы движка, если пара в ней есть, иначе SequenceMatcher"""
+    if lexical is not None:
+        similarity = lexical.similarity(sent, marker)
+        if similarity is not None:
+            return similarity
+    return SequenceMatcher(None, sent.lower(), marker.lower()).ratio()
+
+def _precheck_similarity(polarity: str, sent: str, marker: str,
+                         lexical: Optional['LexicalSimilarityEngine'] = None,
+                         cascade: Optional['CascadeScorer'] = None,
+                         batched: bool = False, scoring_mode: str = 'llm') -> Tuple[Optional[float], float]:
+    """Дешёвая часть проверки схожести без обращения к ИИ.
+
+    Returns:
+        Tuple[Optional[float], float]: (итоговая схожесть или None, если нужен ИИ; базовое сходство)
+    """
+    cache_key = _similarity_cache_key(polarity, sent, marker, batched, lexical, scoring_mode)
+    cached = similarity_cache.get(cache_key)
+    if cached is not None:
+        return cached, 0.0
+
+    # Локальные решения дёшево пересчитать, поэтому на диск сохраняются только оценки с ИИ
+
+    if polarity == 'pos':
+        # Для позитивных маркеров - максимально мягкая проверка контекста
+        if not is_contextually_relevant_positive(sent, marker):
+            similarity_cache.set(cache_key, 0.0, persist=False)
+            return 0.0, 0.0
+    else:
+        # 🔧 ОСЛАБЛЕННАЯ проверка - контекстуальная релевантность
+        if not is_contextually_relevant(sent, marker):
+            similarity_cache.set(cache_key, 0.0, persist=False)
+            return 0.0, 0.0
 
-    return meaningful_sentences
+    # Базовое сходство
+    base_similarity = _base_similarity(sent, marker, lexical)
 
-async def check_phrase_similarity_positive(giga_chat: 'AsyncGigaChat', sent: str, marker: str, total_tokens: int) -> Tuple[float, int]:
-    """🔧 СПЕЦИАЛЬНАЯ функция для ПОЗИТИВНЫХ маркеров - максимально мягкая проверка"""
-    # Кэш
-    cache_key = f"POS_{hash(sent)}_{hash(marker)}"
-    if cache_key in similarity_cache:
-        return similarity_cache[cache_key], total_tokens
-
-    # Для позитивных маркеров - максимально мягкая проверка контекста
-    if not is_contextually_relevant_positive(sent, marker):
-        similarity_cache[cache_key] = 0.0
-        return 0.0, total_tokens
-
-    # Базовое сходство с бонусом для позитивных
-    base_similarity = SequenceMatcher(None, sent.lower(), marker.lower()).ratio()
-    
-    # Для позитивных маркеров снижаем порог еще больше
-    if base_similarity < 0.05:  # Очень низкий порог
-        similarity_cache[cache_key] = 0.0
-        return 0.0, total_tokens
-    
-    # Проверяем токены
-    if total_tokens >= MAX_TOKENS:
-        # Для позитивных даем бонус к базовому сходству
-        boosted_similarity = min(base_similarity + 0.1, 0.8)
-        similarity_cache[cache_key] = boosted_similarity
-        return boosted_similarity, total_tokens
+    # 🔧 ОСЛАБЛЕННЫЙ порог для обоих типов маркеров
+    if base_similarity < 0.05:  # Снижен с MIN_SIMILARITY_FOR_AI до 0.05
+        similarity_cache.set(cache_key, 0.0, persist=False)
+        return 0.0, base_similarity
 
-    try:
-        # Используем специальную мягкую функцию для позитивных маркеров
-        ai_similarity = await check_semantic_similarity_positive(giga_chat, sent, marker)
-        new_tokens = total_tokens + len(sent) + len(marker)
-        
+    # 🔧 Если высокое - ограничиваем (только для негативных)
+    if polarity == 'neg' and base_similarity >= MAX_SIMILARITY_CAP:
+        final_similarity = min(base_similarity, MAX_SIMILARITY_CAP)
+        similarity_cache.set(cache_key, final_similarity, persist=False)
+        return final_similarity, base_similarity
+
+    # Каскад дешёвых стадий: в ИИ идут только пары из полосы неопределённости.
+    # Решения каскада запоминает сам каскад: в кэше под этим ключом они заменили бы
+    # оценки ИИ для следующих анализов в режиме 'llm'
+    if cascade is not None:
+        resolved = cascade.resolve(polarity, sent, marker)
+        if resolved is not None:
+            return resolved, base_similarity
+
+    return None, base_similarity
+
+def _local_only_reason(giga_chat: 'AsyncGigaChat') -> Optional[str]:
+    """Почему ИИ сейчас не используется: 'circuit_open' (GigaChat недоступен),
+    'budget' (исчерпан бюджет токенов анализа) или None"""
+    breaker = getattr(giga_chat, 'breaker', None)
+    if breaker is not None and breaker.is_open:
+        return 'circuit_open'
+    ledger = getattr(giga_chat, 'ledger', None)
+    if ledger is not None and ledger.exhausted():
+        return 'budget'
+    return None
+
+def _fallback_similarity(polarity: str, base_similarity: float) -> float:
+    """Схожесть без ИИ: бонус к базовому сходству (для позитивных больше).
+    Такие оценки (бюджет исчерпан, GigaChat недоступен, ошибка запроса) не кэшируются:
+    иначе следующие анализы приняли бы их за ответ модели"""
+    if polarity == 'pos':
+        return min(base_similarity + 0.1, 0.8)
+    return min(base_similarity + 0.05, 0.8)
+
+def _similarity_upper_bound(polarity: str, base_similarity: float) -> float:
+    """Оптимистичная оценка итоговой схожести пары по её базовому сходству.
+    Пары с низким лексическим сходством почти никогда не получают от ИИ высокий балл,
+    поэтому граница - базовое сходство плюс LEXICAL_BOUND_MARGIN, но не выше лимитов _combine_similarity"""
+    limit = 0.8 if polarity == 'pos' else MAX_SIMILARITY_CAP
+    return min(base_similarity + LEXICAL_BOUND_MARGIN, limit)
+
+def _combine_similarity(polarity: str, ai_similarity: float, base_similarity: float) -> float:
+    """Объединяет оценку ИИ с базовым сходством"""
+    if polarity == 'pos':
         # Для позитивных маркеров берем максимум из базового и ИИ
         final_similarity = max(ai_similarity, base_similarity + 0.05)
-        final_similarity = min(final_similarity, 0.8)
-        
-        similarity_cache[cache_key] = final_similarity
-        return final_similarity, new_tokens
-        
+        return min(final_similarity, 0.8)
+
+    # 🔧 ОСЛАБЛЕННАЯ валидация AI для негативных маркеров
+    if ai_similarity > MAX_SIMILARITY_CAP:
+        return min(base_similarity, MAX_SIMILARITY_CAP)
+    elif ai_similarity < base_similarity * 0.5:  # Снижен с 0.6 до 0.5
+        return base_similarity
+    return min(max(ai_similarity, base_similarity), MAX_SIMILARITY_CAP)
+
+def _degraded_reason(error: Exception) -> str:
+    """Причина локальной оценки пары по ошибке запроса к ИИ"""
+    if isinstance(error, BudgetExceeded):
+        return 'budget'
+    if isinstance(error, CircuitOpen):
+        return 'circuit_open'
+    return 'error'
+
+async def _ai_similarity(polarity: str, giga_chat: 'AsyncGigaChat', sent: str, marker: str,
+                         base_similarity: float, lexical: Optional['LexicalSimilarityEngine'] = None,
+                         scoring_mode: str = 'llm') -> float:
+    """Оценка пары через ИИ без дешёвых проверок (их уже сделал _precheck_similarity).
+    В кэш сохраняется только итог по разобранному ответу; ошибки запроса пробрасываются вызывающему"""
+    # Мягкий промпт для позитивных маркеров, 🔧 ОСЛАБЛЕННЫЙ - для негативных
+    score = await _ask_similarity(polarity, giga_chat, sent, marker)
+    ai_similarity = _semantic_score_bounds(polarity, score, sent, marker, base_similarity)
+    final_similarity = _combine_similarity(polarity, ai_similarity, base_similarity)
+    if score is not None:
+        similarity_cache[_similarity_cache_key(polarity, sent, marker, False, lexical, scoring_mode)] = final_similarity
+    return final_similarity
+
+async def _check_phrase_similarity(polarity: str, giga_chat: 'AsyncGigaChat', sent: str, marker: str,
+                                   lexical: Optional['LexicalSimilarityEngine'] = None,
+                                   cascade: Optional['CascadeScorer'] = None) -> float:
+    decided, base_similarity = _precheck_similarity(polarity, sent, marker, lexical, cascade)
+    if decided is not None:
+        return decided
+    if _local_only_reason(giga_chat):
+        return _fallback_similarity(polarity, base_similarity)
+    try:
+        return await _ai_similarity(polarity, giga_chat, sent, marker, base_similarity, lexical)
     except Exception:
-        # В случае ошибки даем бонус к базовому сходству
-        boosted_similarity = min(base_similarity + 0.1, 0.8)
-        similarity_cache[cache_key] = boosted_similarity
-        return boosted_similarity, total_tokens
+        # В случае ошибки (в том числе BudgetExceeded и CircuitOpen) даем бонус к базовому сходству
+        return _fallback_similarity(polarity, base_similarity)
 
-async def check_phrase_similarity_optimized(giga_chat: 'AsyncGigaChat', sent: str, marker: str, total_tokens: int) -> Tuple[float, int]:
-    """🔧 ОСЛАБЛЕННАЯ проверка схожести для поиска негативных маркеров"""
-    # Кэш
-    cache_key = f"{hash(sent)}_{hash(marker)}"
-    if cache_key in similarity_cache:
-        return similarity_cache[cache_key], total_tokens
-
-    # 🔧 ОСЛАБЛЕННАЯ проверка - контекстуальная релевантность
-    if not is_contextually_relevant(sent, marker):
-        similarity_cache[cache_key] = 0.0
-        return 0.0, total_tokens
-
-    # Базовое сходство
-    base_similarity = SequenceMatcher(None, sent.lower(), marker.lower()).ratio()
-    
-    # 🔧 ОСЛАБЛЕННЫЙ порог для негативных маркеров
-    if base_similarity < 0.05:  # Снижен с MIN_SIMILARITY_FOR_AI до 0.05
-        similarity_cache[cache_key] = 0.0
-        return 0.0, total_tokens
-    
-    # 🔧 Если высокое - ограничиваем
-    if base_similarity >= MAX_SIMILARITY_CAP:
-        final_similarity = min(base_similarity, MAX_SIMILARITY_CAP)
-        similarity_cache[cache_key] = final_similarity
-        return final_similarity, total_tokens
-    
-    # Проверяем токены
-    if total_tokens >= MAX_TOKENS:
-        # Для негативных маркеров даем небольшой бонус к базовому сходству
-        boosted_similarity = min(base_similarity + 0.05, 0.8)
-        similarity_cache[cache_key] = boosted_similarity
-        return boosted_similarity, total_tokens
+async def check_phrase_similarity_positive(giga_chat: 'AsyncGigaChat', sent: str, marker: str,
+                                           lexical: Optional['LexicalSimilarityEngine'] = None,
+                                           cascade: Optional['CascadeScorer'] = None) -> float:
+    """🔧 СПЕЦИАЛЬНАЯ функция для ПОЗИТИВНЫХ маркеров - максимально мягкая проверка"""
+    return await _check_phrase_similarity('pos', giga_chat, sent, marker, lexical, cascade)
 
-    try:
-        # 🔧 ОСЛАБЛЕННАЯ проверка через AI для негативных маркеров
-        ai_similarity = await check_semantic_similarity_strict(giga_chat, sent, marker)
-        new_tokens = total_tokens + len(sent) + len(marker)
-        
-        # 🔧 ОСЛАБЛЕННАЯ валидация AI для негативных маркеров
-        if ai_similarity > MAX_SIMILARITY_CAP:
-            final_similarity = min(base_similarity, MAX_SIMILARITY_CAP)
-        elif ai_similarity < base_similarity * 0.5:  # Снижен с 0.6 до 0.5
-            final_similarity = base_similarity
-        else:
-            final_similarity = min(max(ai_similarity, base_similarity), MAX_SIMILARITY_CAP)
-        
-        similarity_cache[cache_key] = final_similarity
-        return final_similarity, new_tokens
-        
-    except Exception:
-        # Для негативных маркеров даем небольшой бонус к базовому сходству
-        boosted_similarity = min(base_similarity + 0.05, 0.8)
-        similarity_cache[cache_key] = boosted_similarity
-        return boosted_similarity, total_tokens
+async def check_phrase_similarity_optimized(giga_chat: 'AsyncGigaChat', sent: str, marker: str,
+                                            lexical: Optional['LexicalSimilarityEngine'] = None,
+                                            cascade: Optional['CascadeScorer'] = None) -> float:
+    """🔧 ОСЛАБЛЕННАЯ проверка схожести для поиска негативных маркеров"""
+    return await _check_phrase_similarity('neg', giga_chat, sent, marker, lexical, cascade)
 
-async def check_semantic_similarity_positive(giga_chat: 'AsyncGigaChat', sentence: str, marker: str) -> float:
-    """🔧 СПЕЦИАЛЬНАЯ функция для ПОЗИТИВНЫХ маркеров - максимально мягкая"""
-    
-    prompt = f"""Оцени смысловое сходство по шкале 0-1 с МАКСИМАЛЬНЫМ ПОЗИТИВНЫМ УКЛОНОМ.
+def _positive_similarity_prompt(sentence: str, marker: str) -> str:
+    return f"""Оцени смысловое сходство по шкале 0-1 с МАКСИМАЛЬНЫМ ПОЗИТИВНЫМ УКЛОНОМ.
 
 ФРАЗА ИЗ ВСТРЕЧИ: "{sentence}"
 ПОЗИТИВНЫЙ МАРКЕР: "{marker}"
@@ -308,20 +437,8 @@ async def check_semantic_similarity_positive(giga_chat: 'AsyncGigaChat', sentenc
 
 Ответь только число 0.XX"""
 
-    try:
-        response = await giga_chat.send(prompt)
-        result = float(response.strip())
-        # Для позитивных маркеров повышаем результат
-        return min(max(result, 0.2), 0.8)
-    except:
-        # Для позитивных маркеров даем больший базовый бонус
-        base_sim = SequenceMatcher(None, sentence.lower(), marker.lower()).ratio()
-        return min(max(base_sim + 0.1, 0.2), 0.8)
-
-async def check_semantic_similarity_strict(giga_chat: 'AsyncGigaChat', sentence: str, marker: str) -> float:
-    """🔧 ОСЛАБЛЕННАЯ функция: Гибкая контекстуальная проверка через AI для поиска негативных совпадений"""
-    
-    prompt = f"""Оцени смысловое сходство по шкале 0-1 с ОСЛАБЛЕННЫМИ КРИТЕРИЯМИ.
+def _strict_similarity_prompt(sentence: str, marker: str) -> str:
+    return f"""Оцени смысловое сходство по шкале 0-1 с ОСЛАБЛЕННЫМИ КРИТЕРИЯМИ.
 
 ФРАЗА ИЗ ВСТРЕЧИ: "{sentence}"
 НЕГАТИВНЫЙ МАРКЕР: "{marker}"
@@ -336,12 +453,28 @@ async def check_semantic_similarity_strict(giga_chat: 'AsyncGigaChat', sentence:
 
 Ответь только число 0.XX"""
 
+async def _ask_similarity(polarity: str, giga_chat: 'AsyncGigaChat', sentence: str, marker: str) -> Optional[float]:
+    """Оценка пары ИИ или None, если ответ не число.
+    Ошибки запроса пробрасываются: вызывающий оценивает пару локально и не кэширует её"""
+    prompt = _positive_similarity_prompt(sentence, marker) if polarity == 'pos' else _strict_similarity_prompt(sentence, marker)
+    response = await giga_chat.send(prompt, deterministic=DETERMINISTIC_SCORING)
     try:
-        response = await giga_chat.send(prompt)
-        result = float(response.strip())
-        return min(result, MAX_SIMILARITY_CAP)
-    except:
-        return SequenceMatcher(None, sentence.lower(), marker.lower()).ratio()
+        return float(response.strip())
+    except (AttributeError, ValueError):
+        return None
+
+async def check_semantic_similarity_positive(giga_chat: 'AsyncGigaChat', sentence: str, marker: str,
+                                             base_similarity: Optional[float] = None) -> float:
+    """🔧 СПЕЦИАЛЬНАЯ функция для ПОЗИТИВНЫХ маркеров - максимально мягкая"""
+    # Для позитивных маркеров результат поднимается до 0.2; если ответ не число - больший базовый бонус
+    score = await _ask_similarity('pos', giga_chat, sentence, marker)
+    return _semantic_score_bounds('pos', score, sentence, marker, base_similarity)
+
+async def check_semantic_similarity_strict(giga_chat: 'AsyncGigaChat', sentence: str, marker: str,
+                                           base_similarity: Optional[float] = None) -> float:
+    """🔧 ОСЛАБЛЕННАЯ функция: Гибкая контекстуальная проверка через AI для поиска негативных совпадений"""
+    score = await _ask_similarity('neg', giga_chat, sentence, marker)
+    return _semantic_score_bounds('neg', score, sentence, marker, base_similarity)
 
 async def check_semantic_similarity(giga_chat: 'AsyncGigaChat', text1: str, text2: str) -> float:
     """Проверяет семантическое сходство двух фраз с помощью GigaChat"""
@@ -353,95 +486,533 @@ async def check_semantic_similarity(giga_chat: 'AsyncGigaChat', text1: str, text
 Ответьте только числом 0.XX без объяснений."""
 
     try:
-        response = await giga_chat.send(prompt)
+        response = await giga_chat.send(prompt, deterministic=DETERMINISTIC_SCORING)
         return float(response.strip())
     except (ValueError, AttributeError):
         return SequenceMatcher(None, text1.lower(), text2.lower()).ratio()
     except Exception:
         return 0.0
 
-async def analyze_text_optimized(text: str, triggers: dict, giga_chat: 'AsyncGigaChat') -> dict:
-    """Оптимизированный анализ текста с подробной статистикой"""
+BATCH_ARRAY_RE = re.compile(r'\[[^\[\]]*\]')
+
+def _is_score_item(item) -> bool:
+    """Элемент массива оценок: число, строка с числом или объект с полем score"""
+    if isinstance(item, dict):
+        item = item.get('score')
+    if isinstance(item, bool):
+        return False
+    if isinstance(item, (int, float)):
+        return True
+    return isinstance(item, str) and re.fullmatch(r'\s*-?\d+(?:[.,]\d+)?\s*', item) is not None
+
+def parse_batch_scores(response: str, expected: int) -> List[Optional[float]]:
+    """Разбирает ответ GigaChat с JSON-массивом оценок.
+
+    Возвращает список длины expected; на месте некорректных или
+    отсутствующих оценок стоит None.
+    """
+    scores = None
+    # Модель может повторить в ответе метки из промпта ([ПОЗИТИВНЫЙ]),
+    # поэтому берётся первый фрагмент в скобках, который является массивом оценок
+    for match in BATCH_ARRAY_RE.finditer(response or ''):
+        try:
+            parsed = json.loads(match.group(0).replace("'", '"'))
+        except ValueError:
+            continue
+        if isinstance(parsed, list) and any(_is_score_item(item) for item in parsed):
+            scores = parsed
+            break
+
+    # Модель иногда отвечает списком чисел без скобок
+    if scores is None:
+        numbers = re.findall(r'\d+(?:[.,]\d+)?', response or '')
+        if len(numbers) == expected:
+            scores = numbers
+
+    result = []
+    for item in (scores or [])[:expected]:
+        if isinstance(item, dict):
+            item = item.get('score')
+        try:
+            value = float(str(item).replace(',', '.'))
+        except (TypeError, ValueError):
+            result.append(None)
+            continue
+        result.append(value if 0.0 <= value <= 1.0 else None)
+
+    result.extend([None] * (expected - len(result)))
+    return result
+
+def _semantic_score_bounds(polarity: str, ai_similarity: Optional[float], sentence: str, marker: str,
+                           base_similarity: Optional[float] = None) -> float:
+    """Ограничивает оценку ИИ как в одиночных проверках, при отсутствии оценки - схожесть без ИИ"""
+    if ai_similarity is None and base_similarity is None:
+        base_similarity = _base_similarity(sentence, marker)
+
+    if polarity == 'pos':
+        if ai_similarity is None:
+            # Для позитивных маркеров даем больший базовый бонус
+            return min(max(base_similarity + 0.1, 0.2), 0.8)
+        return min(max(ai_similarity, 0.2), 0.8)
+
+    if ai_similarity is None:
+        return _fallback_similarity('neg', base_similarity)
+    return min(ai_similarity, MAX_SIMILARITY_CAP)
+
+_BATCH_SCORING_RULES = """ПРАВИЛА:
+- Для ПОЗИТИВНЫХ маркеров будь максимально лояльным: качества, навыки, цели, работа с клиентами, команда, развитие, опыт и планы = ПОЗИТИВНО. Оценивай от 0.2 до 0.8
+- Для НЕГАТИВНЫХ маркеров ищи ЛЮБЫЕ смысловые связи: проблемы, ошибки, неудачи, сомнения, недовольство, критика = НЕГАТИВНО. Оценивай от 0.12 до 0.85"""
+
+def _polarity_label(polarity: str) -> str:
+    return "ПОЗИТИВНЫЙ" if polarity == 'pos' else "НЕГАТИВНЫЙ"
+
+async def _score_batch(giga_chat: 'AsyncGigaChat', prompt: str, expected: int) -> List[Optional[float]]:
+    """Оценки из ответа пакетного запроса; ошибки самого запроса пробрасываются вызывающему"""
+    response = await giga_chat.send(prompt, deterministic=DETERMINISTIC_SCORING)
+    return parse_batch_scores(response, expected)
+
+def _batch_similarity_prompt(sentence: str, markers: List[Tuple[str, str]]) -> str:
+    markers_block = "\n".join(
+        f'{i}. [{_polarity_label(polarity)}] "{marker}"' for i, (polarity, marker) in enumerate(markers, 1)
+    )
+    return f"""Оцени смысловое сходство фразы из встречи с КАЖДЫМ маркером по шкале 0-1.
+
+ФРАЗА ИЗ ВСТРЕЧИ: "{sentence}"
+
+МАРКЕРЫ:
+{markers_block}
+
+{_BATCH_SCORING_RULES}
+
+Ответь только JSON-массивом из {len(markers)} чисел в порядке маркеров, например [0.35, 0.12]"""
+
+async def check_semantic_similarity_batch(giga_chat: 'AsyncGigaChat', sentence: str, markers: List[Tuple[str, str]],
+                                          base_similarities: Optional[List[float]] = None) -> List[float]:
+    """Оценивает одну фразу сразу против нескольких маркеров одним запросом
+
+    Args:
+        sentence: фраза из встречи
+        markers: список пар (полярность 'pos'/'neg', маркер)
+        base_similarities: уже посчитанное базовое сходство для запасных оценок
+
+    Returns:
+        List[float]: оценки в порядке маркеров
+    """
+    if not markers:
+        return []
+
+    scores = await _score_batch(giga_chat, _batch_similarity_prompt(sentence, markers), len(markers))
+    base_similarities = base_similarities or [None] * len(markers)
+    return [
+        _semantic_score_bounds(polarity, score, sentence, marker, base)
+        for (polarity, marker), score, base in zip(markers, scores, base_similarities)
+    ]
+
+async def check_marker_similarity_batch(giga_chat: 'AsyncGigaChat', marker: str, polarity: str, sentences: List[str]) -> List[float]:
+    """Оценивает один маркер сразу против блока фраз одним запросом
+
+    Returns:
+        List[float]: оценки в порядке фраз
+    """
+    if not sentences:
+        return []
+
+    sentences_block = "\n".join(f'{i}. "{sentence}"' for i, sentence in enumerate(sentences, 1))
+    prompt = f"""Оцени смысловое сходство маркера с КАЖДОЙ фразой из встречи по шкале 0-1.
+
+{_polarity_label(polarity)} МАРКЕР: "{marker}"
+
+ФРАЗЫ ИЗ ВСТРЕЧИ:
+{sentences_block}
+
+{_BATCH_SCORING_RULES}
+
+Ответь только JSON-массивом из {len(sentences)} чисел в порядке фраз, например [0.35, 0.12]"""
+
+    scores = await _score_batch(giga_chat, prompt, len(sentences))
+    return [
+        _semantic_score_bounds(polarity, score, sentence, marker)
+        for sentence, score in zip(sentences, scores)
+    ]
+
+def _advice_prompt(sentence: str) -> str:
+    return (
+        f"Преобразуй негативную фразу в конструктивную, позитивную, сохраняя суть. "
+        f"Ответь ТОЛЬКО позитивной фразой без лишних слов, разметки или объяснений.\n"
+        f"Негатив: \"{sentence}\"\n"
+        f"Позитив:"
+    )
+
+async def generate_advice(giga_chat: 'AsyncGigaChat', sentences: List[str],
+                          max_concurrency: int = MAX_CONCURRENT_REQUESTS) -> Tuple[Dict[str, str], dict]:
+    """Генерирует советы для негативных фраз: по одному запросу на уникальную фразу,
+    параллельно и с постоянным кэшем. Возвращает советы по фразе и статистику."""
+    sentences = list(dict.fromkeys(sentences))
+    # Советы всегда запрашиваются с параметрами выборки по умолчанию, поэтому
+    # DETERMINISTIC_SCORING на их ключ не влияет
+    keys = {sent: make_key('advice', sent, '', _prompt_version('advice', scoring=False)) for sent in sentences}
+    advice_cache.prefetch(keys.values())
+
+    advice = {}
+    missing = []
+    for sent in sentences:
+        cached = advice_cache.get(keys[sent])
+        if cached is not None:
+            advice[sent] = cached
+        else:
+            missing.append(sent)
+    stats = {'sentences': len(sentences), 'cached': len(sentences) - len(missing), 'requests': 0, 'failed': 0}
+
+    pending = iter(missing)
+
+    async def worker():
+        for sent in pending:
+            stats['requests'] += 1
+            try:
+                text = (await giga_chat.send(_advice_prompt(sent))).strip()
+            except Exception:
+                stats['failed'] += 1
+                advice[sent] = DEFAULT_ADVICE
+                continue
+            # Post-processing: если совет неинформативный, подставить дефолт
+            if not text or text.lower().startswith("позитив:") or len(text) < 5:
+                text = DEFAULT_ADVICE
+            advice[sent] = text
+            advice_cache.set(keys[sent], text)
+
+    workers_count = max(1, min(max_concurrency, len(missing)))
+    try:
+        await asyncio.gather(*(worker() for _ in range(workers_count)))
+    finally:
+        advice_cache.flush()
+    return advice, stats
+
+class ComparisonScheduler:
+    """Планировщик сравнений: заранее собирает все пары (предложение, маркер)
+    и выполняет их с ограниченным числом одновременных запросов к GigaChat."""
+
+    def __init__(self, giga_chat: 'AsyncGigaChat', max_concurrency: int = MAX_CONCURRENT_REQUESTS,
+                 batch_size: int = LLM_BATCH_SIZE, lexical: Optional['LexicalSimilarityEngine'] = None,
+                 cascade: Optional['CascadeScorer'] = None, scoring_mode: str = 'llm'):
+        self.giga_chat = giga_chat
+        self.scoring_mode = scoring_mode  # Входит в ключи кэша схожести
+        self.lexical = lexical
+        self.cascade = cascade
+        self.max_concurrency = max(1, max_concurrency)
+        self.batch_size = max(1, batch_size)
+        self.batched = self.batch_size > 1
+        self.skipped_pairs = 0
+        self.llm_pairs = 0  # Пар, оценённых ИИ (ответ получен)
+        self.degraded = Counter()  # Пар, оценённых локально, по причине ('budget', 'circuit_open', 'error')
+
+    def build_work_set(self, sentences: List[str], triggers: dict,
+                       candidates: Optional[Dict[str, List[str]]] = None) -> List[Tuple[str, str, str]]:
+        """Собирает уникальные пары (полярность, предложение, маркер) по всем индикаторам.
+        Если заданы кандидаты, маркер сравнивается только со своими кандидатами."""
+        work = {}
+        for indicators in triggers.values():
+            for data in indicators.values():
+                for polarity, markers_key in (('pos', 'positive_markers'), ('neg', 'negative_markers')):
+                    for marker in data[markers_key]:
+                        if not marker:
+                            continue
+                        marker_sentences = candidates[marker] if candidates is not None else sentences
+                        for sent in marker_sentences:
+                            work.setdefault((polarity, sent, marker), None)
+        return list(work)
+
+    def _count_dispatched(self, pairs: int):
+        """Учитывает пары, отправленные в ИИ, в счётчике каскада"""
+        if self.cascade is not None:
+            self.cascade.stats['llm'] += pairs
+
+    async def _compare(self, polarity: str, sent: str, marker: str, base_similarity: Optional[float] = None) -> float:
+        """Сравнивает пару; base_similarity передаётся, если дешёвые проверки пары уже выполнены"""
+        if base_similarity is None:
+            decided, base_similarity = _precheck_similarity(
+                polarity, sent, marker, self.lexical, self.cascade, scoring_mode=self.scoring_mode
+            )
+            if decided is not None:
+                return decided
+        reason = _local_only_reason(self.giga_chat)
+        if not reason:
+            self._count_dispatched(1)
+            try:
+                similarity = await _ai_similarity(
+                    polarity, self.giga_chat, sent, marker, base_similarity, self.lexical, self.scoring_mode
+                )
+            except Exception as e:
+                reason = _degraded_reason(e)
+            else:
+                self.llm_pairs += 1
+                return similarity
+        self.degraded[reason] += 1
+        return _fallback_similarity(polarity, base_similarity)
+
+    async def _compare_batch(self, sent: str, pairs: List[Tuple[str, str]],
+                             bases: Optional[Dict[Tuple[str, str, str], float]] = None) -> Dict[Tuple[str, str, str], float]:
+        """Сравнивает фразу с группой маркеров: дешёвые проверки локально, остальное одним запросом.
+        Для пар из bases дешёвые проверки уже выполнены, берётся их базовое сходство"""
+        results = {}
+        pending = []
+        for polarity, marker in pairs:
+            if bases is not None and (polarity, sent, marker) in bases:
+                pending.append((polarity, marker, bases[(polarity, sent, marker)]))
+                continue
+            decided, base_similarity = _precheck_similarity(
+                polarity, sent, marker, self.lexical, self.cascade, True, self.scoring_mode
+            )
+            if decided is not None:
+                results[(polarity, sent, marker)] = decided
+            else:
+                pending.append((polarity, marker, base_similarity))
+
+        if not pending:
+            return results
+
+        try:
+            reason = _local_only_reason(self.giga_chat)
+            if reason == 'budget':
+                raise BudgetExceeded("Бюджет токенов исчерпан")
+            if reason == 'circuit_open':
+                raise CircuitOpen("GigaChat временно недоступен")
+            self._count_dispatched(len(pending))
+            markers = [(polarity, marker) for polarity, marker, _ in pending]
+            scores = await _score_batch(self.giga_chat, _batch_similarity_prompt(sent, markers), len(pending))
+        except Exception as e:
+            # Бюджет исчерпан, GigaChat недоступен или запрос не удался: пары оцениваются локально
+            self.degraded[_degraded_reason(e)] += len(pending)
+            for polarity, marker, base_similarity in pending:
+                results[(polarity, sent, marker)] = _fallback_similarity(polarity, base_similarity)
+            return results
+        self.llm_pairs += len(pending)
+
+        for (polarity, marker, base_similarity), score in zip(pending, scores):
+            ai_similarity = _semantic_score_bounds(polarity, score, sent, marker, base_similarity)
+            final_similarity = _combine_similarity(polarity, ai_similarity, base_similarity)
+            # Оценка, которой нет в ответе, - локальная: она идёт только в результат этого анализа
+            if score is not None:
+                similarity_cache[_similarity_cache_key(polarity, sent, marker, True, self.lexical, self.scoring_mode)] = final_similarity
+            results[(polarity, sent, marker)] = final_similarity
+        return results
+
+    def build_indicator_groups(self, sentences: List[str], triggers: dict,
+                               candidates: Optional[Dict[str, List[str]]] = None) -> List[Tuple[int, List[Tuple[str, str, str]]]]:
+        """Собирает пары по индикаторам и полярности вместе с лимитом совпадений группы"""
+        groups = []
+        for indicators in triggers.values():
+            for data in indicators.values():
+                for polarity, markers_key, cap in (('pos', 'positive_markers', MAX_POSITIVE_MATCHES),
+                                                   ('neg', 'negative_markers', MAX_NEGATIVE_MATCHES)):
+                    pairs = {}
+                    for marker in data[markers_key]:
+                        if not marker:
+                            continue
+                        marker_sentences = candidates[marker] if candidates is not None else sentences
+                        for sent in marker_sentences:
+                            pairs.setdefault((polarity, sent, marker), None)
+                    if pairs:
+                        groups.append((cap, list(pairs)))
+        return groups
+
+    def _cap_reached(self, cap: int, pairs: List[Tuple[str, str, str]], results: dict, next_base: float) -> bool:
+        """Лимит заполнен, если есть cap совпадений и худшее из них не ниже того,
+        что оптимистично может получить следующая по базовому сходству пара"""
+        matches = sorted((results[key] for key in pairs if results.get(key, 0.0) >= SEMANTIC_THRESHOLD), reverse=True)
+        return len(matches) >= cap and matches[cap - 1] >= _similarity_upper_bound(pairs[0][0], next_base)
+
+    async def run_capped(self, sentences: List[str], triggers: dict,
+                         candidates: Optional[Dict[str, List[str]]] = None) -> Dict[Tuple[str, str, str], float]:
+        """Как run, но пары каждого индикатора проверяются по убыванию дешёвой схожести
+        волнами по cap пар, и запросы к ИИ для индикатора прекращаются, как только лимит
+        MAX_POSITIVE_MATCHES / MAX_NEGATIVE_MATCHES заполнен. Пропущенных пар в результате нет."""
+        groups = self.build_indicator_groups(sentences, triggers, candidates)
+        similarity_cache.prefetch(
+            _similarity_cache_key(polarity, sent, marker, self.batched, self.lexical, self.scoring_mode)
+            for _, pairs in groups for polarity, sent, marker in pairs
+        )
+        results = {}
+        # Базовое сходство пар, которым нужен ИИ: повторно в _compare* они не проверяются
+        bases = {}
+        ranked_groups = []
+        for cap, pairs in groups:
+            ranked = []
+            for key in pairs:
+                if key in results:
+                    continue
+                if key in bases:
+                    ranked.append((bases[key], key))
+                    continue
+                polarity, sent, marker = key
+                decided, base_similarity = _precheck_similarity(
+                    polarity, sent, marker, self.lexical, self.cascade, self.batched, self.scoring_mode
+                )
+                if decided is not None:
+                    results[key] = decided
+                else:
+                    bases[key] = base_similarity
+                    ranked.append((base_similarity, key))
+            ranked.sort(key=lambda item: -item[0])
+            ranked_groups.append([cap, pairs, ranked, 0])
+
+        try:
+            # Волны всех индикаторов выполняются вместе, чтобы пакеты по фразе оставались полными
+            while True:
+                wave = {}
+                for group in ranked_groups:
+                    cap, pairs, ranked, position = group
+                    if position >= len(ranked) or self._cap_reached(cap, pairs, results, ranked[position][0]):
+                        continue
+                    for _, key in ranked[position:position + cap]:
+                        if key not in results:
+                            wave.setdefault(key, None)
+                    group[3] = position + cap
+                if not wave:
+                    break
+                await self._execute(list(wave), results, bases)
+        finally:
+            similarity_cache.flush()
+
+        self.skipped_pairs = sum(
+            1 for _, _, ranked, _ in ranked_groups for _, key in ranked if key not in results
+        )
+        return results
+
+    def _build_units(self, work: List[Tuple[str, str, str]]) -> list:
+        """Разбивает пары на единицы работы: по одной паре или по группе маркеров для одной фразы"""
+        if self.batch_size == 1:
+            return work
+
+        by_sentence = {}
+        for polarity, sent, marker in work:
+            by_sentence.setdefault(sent, []).append((polarity, marker))
+
+        units = []
+        for sent, pairs in by_sentence.items():
+            for i in range(0, len(pairs), self.batch_size):
+                units.append((sent, pairs[i:i + self.batch_size]))
+        return units
+
+    async def run(self, sentences: List[str], triggers: dict,
+                  candidates: Optional[Dict[str, List[str]]] = None) -> Dict[Tuple[str, str, str], float]:
+        """Выполняет все сравнения и возвращает схожесть по ключу (полярность, предложение, маркер)"""
+        work = self.build_work_set(sentences, triggers, candidates)
+        # Одним проходом подтягиваем с диска оценки, сохранённые прошлыми анализами
+        similarity_cache.prefetch(
+            _similarity_cache_key(polarity, sent, marker, self.batched, self.lexical, self.scoring_mode)
+            for polarity, sent, marker in work
+        )
+        results = {}
+        try:
+            await self._execute(work, results)
+        finally:
+            similarity_cache.flush()
+        return results
+
+    async def _execute(self, work: List[Tuple[str, str, str]], results: dict,
+                       bases: Optional[Dict[Tuple[str, str, str], float]] = None):
+        """Выполняет сравнения пар пулом воркеров и складывает оценки в results.
+        bases - базовое сходство уже проверенных пар (run_capped)"""
+        units = self._build_units(work)
+        pending = iter(units)
+
+        # Воркеры разбирают общую очередь, поэтому одновременно выполняется
+        # не больше max_concurrency запросов независимо от общего числа пар
+        async def worker():
+            for unit in pending:
+                if self.batch_size == 1:
+                    polarity, sent, marker = unit
+                    base_similarity = bases.get(unit) if bases is not None else None
+                    results[unit] = await self._compare(polarity, sent, marker, base_similarity)
+                else:
+                    results.update(await self._compare_batch(*unit, bases))
+
+        workers_count = max(1, min(self.max_concurrency, len(units)))
+        await asyncio.gather(*(worker() for _ in range(workers_count)))
+
+def _embedding_candidates(sentences: List[str], triggers: dict, backend: 'EmbeddingBackend', top_k: int,
+                          trigger_model: Optional['TriggerModel'] = None) -> Tuple[Dict[str, List[str]], Dict[Tuple[str, str], float]]:
+    """Отбирает для каждого маркера top_k ближайших предложений по локальным эмбеддингам.
+
+    Returns:
+        Tuple: (кандидаты по маркеру в порядке текста, косинусная схожесть по паре (предложение, маркер))
+    """
+    from embeddings import VectorIndex, marker_embeddings
+
+    unique_sentences = list(dict.fromkeys(sentences))
+    vector_index = VectorIndex(unique_sentences, backend.embed_batches(unique_sentences))
+    if trigger_model:
+        markers = trigger_model.markers
+        marker_vectors = marker_embeddings(trigger_model, backend)
+    else:
+        markers = collect_markers(triggers)
+        marker_vectors = backend.embed_batches(markers)
+
+    sentence_order = {sent: i for i, sent in enumerate(unique_sentences)}
+    candidates = {}
+    scores = {}
+    for marker, hits in zip(markers, vector_index.search(marker_vectors, top_k)):
+        candidates[marker] = sorted((sent for sent, _ in hits), key=sentence_order.get)
+        for sent, score in hits:
+            scores[(sent, marker)] = score
+    return candidates, scores
+
+async def analyze_text_optimized(text: Union[str, PreparedTranscript], triggers: dict, giga_chat: Optional['AsyncGigaChat'],
+                                 max_concurrency: int = MAX_CONCURRENT_REQUESTS,
+                                 batch_size: int = LLM_BATCH_SIZE,
+                                 use_index: bool = USE_NGRAM_INDEX,
+                                 use_lexical_engine: bool = USE_LEXICAL_ENGINE,
+                                 trigger_model: Optional['TriggerModel'] = None,
+                                 scoring_mode: str = SCORING_MODE,
+                                 embedding_backend: Optional['EmbeddingBackend'] = None,
+                                 use_match_caps: bool = USE_MATCH_CAPS,
+                                 user_id=None,
+                                 token_budget: Optional[int] = ANALYSIS_TOKEN_BUDGET) -> dict:
+    """Оптимизированный анализ текста с подробной статистикой.
+
+    text - стенограмма или готовый результат prepare_text; стенограмма готовится с
+    порогами ANALYSIS_FILTER, повторный анализ того же текста берёт её из кэша.
+
+    Если передана скомпилированная модель триггеров (trigger_model.load_trigger_model),
+    предвычисленные признаки маркеров берутся из неё. В режиме scoring_mode='offline'
+    giga_chat не используется и может быть None.
+
+    Расход токенов GigaChat учитывается в клиенте по анализу и пользователю (user_id);
+    после исчерпания token_budget или суточного бюджета пользователя пары оцениваются локально.
+    """
+    if scoring_mode not in ('llm', 'rerank', 'offline', 'cascade'):
+        raise ValueError(f"Неизвестный режим оценки: {scoring_mode}")
+    args = (text, triggers, giga_chat, max_concurrency, batch_size, use_index, use_lexical_engine,
+            trigger_model, scoring_mode, embedding_backend, use_match_caps)
+    ledger = getattr(giga_chat, 'ledger', None)
+    if ledger is None or scoring_mode == 'offline':
+        return await _analyze_text(*args)
+    with ledger.scope(user_id=user_id, budget=token_budget):
+        return await _analyze_text(*args)
+
+async def _analyze_text(text: Union[str, PreparedTranscript], triggers: dict, giga_chat: Optional['AsyncGigaChat'], max_concurrency: int,
+                        batch_size: int, use_index: bool, use_lexical_engine: bool,
+                        trigger_model: Optional['TriggerModel'], scoring_mode: str,
+                        embedding_backend: Optional['EmbeddingBackend'], use_match_caps: bool) -> dict:
     start_time = time.time()
+    # Счётчики клиента (повторы, ожидания лимитера) общие для процесса, в отчёт идёт прирост за анализ
+    client_stats_before = dict(getattr(giga_chat, 'stats', {}))
     
     # Предобработка с ограничениями и сбор статистики
     print("🔄 Предобработка текста...")
     
-    # Разбиваем на все предложения
-    all_sentences = []
-    current_sentence = []
-    for char in text:
-        current_sentence.append(char)
-        if char in '.!?':
-            sentence = ''.join(current_sentence).strip()
-            if sentence and len(sentence) > 10:
-                all_sentences.append(sentence)
-            current_sentence = []
-    if current_sentence:
-        final_sentence = ''.join(current_sentence).strip()
-        if final_sentence and len(final_sentence) > 10:
-            all_sentences.append(final_sentence)
-    
-    # Детальная статистика фильтрации
-    filter_stats = {
-        'total_sentences': len(all_sentences),
-        'passed_filter': 0,
-        'filtered_by_pattern': 0,
-        'filtered_by_length': 0,
-        'filtered_by_stopwords': 0,
-        'filtered_by_morphology': 0,
-        'filtered_examples': {
-            'pattern': [],
-            'length': [],
-            'stopwords': [],
-            'morphology': []
-        }
-    }
-    
-    # Фильтруем с детальной статистикой
-    meaningful_sentences = []
-    for sent in all_sentences:
-        # Проверяем паттерны
-        if smart_filter.is_insignificant_by_pattern(sent):
-            filter_stats['filtered_by_pattern'] += 1
-            if len(filter_stats['filtered_examples']['pattern']) < 5:
-                filter_stats['filtered_examples']['pattern'].append(sent[:100])
-            continue
-        
-        # Проверяем длину (ОСЛАБЛЕННЫЙ фильтр)
-        cleaned = smart_filter.clean_phrase(sent)
-        if len(cleaned) < 20:
-            filter_stats['filtered_by_length'] += 1
-            if len(filter_stats['filtered_examples']['length']) < 5:
-                filter_stats['filtered_examples']['length'].append(sent[:100])
-            continue
-        
-        # Морфологический анализ
-        morph_analysis = smart_filter.analyze_morphology(sent)
-        
-        # Проверяем стоп-слова (ОСЛАБЛЕННЫЙ фильтр)
-        if morph_analysis['total_words'] > 0:
-            stopword_ratio = morph_analysis['stopwords_count'] / morph_analysis['total_words']
-            if stopword_ratio > 0.85:  # ОСЛАБЛЕННЫЙ с 70% до 85%
-                filter_stats['filtered_by_stopwords'] += 1
-                if len(filter_stats['filtered_examples']['stopwords']) < 5:
-                    filter_stats['filtered_examples']['stopwords'].append(sent[:100])
-                continue
-        
-        # Проверяем значимые слова (ОСЛАБЛЕННЫЙ фильтр)
-        if morph_analysis['meaningful_words'] < 3:  # ОСЛАБЛЕННЫЙ с 5 до 3
-            filter_stats['filtered_by_morphology'] += 1
-            if len(filter_stats['filtered_examples']['morphology']) < 5:
-                filter_stats['filtered_examples']['morphology'].append(sent[:100])
-            continue
-        
-        meaningful_sentences.append(sent)
-        filter_stats['passed_filter'] += 1
-        
-        # Ограничиваем количество для ускорения
-        if len(meaningful_sentences) >= MAX_SENTENCES:
-            break
+    # Разбиение и фильтрация с детальной статистикой (ОСЛАБЛЕННЫЕ критерии ANALYSIS_FILTER:
+    # длина от 20 символов, до 85% стоп-слов, от 3 значимых слов; не больше MAX_SENTENCES)
+    if isinstance(text, PreparedTranscript):
+        prepared, preprocess_cached = text, True
+    else:
+        prepared, preprocess_cached = prepare_text(text, ANALYSIS_FILTER)
+    meaningful_sentences = list(prepared.sentences)
+    sentence_categories = prepared.categories_by_sentence()
+    filter_stats = prepared.filter_stats()
     
+    if preprocess_cached:
+        print(f"♻️ Предобработка взята из кэша ({prepared.digest[:12]})")
     print(f"✅ Статистика фильтрации:")
     print(f"   Всего предложений: {filter_stats['total_sentences']}")
     print(f"   Прошли фильтр: {filter_stats['passed_filter']}")
@@ -451,14 +1022,99 @@ async def analyze_text_optimized(text: str, triggers: dict, giga_chat: 'AsyncGig
     print(f"   Отфильтровано по морфологии: {filter_stats['filtered_by_morphology']}")
     
     results = {}
-    total_tokens = 0
     processed_comparisons = 0
+    advice_matches = []
+
+    # Отбор кандидатов: каждый маркер сравнивается только с предложениями,
+    # у которых есть общие основы слов и триграммы
+    candidates = None
+    embedding_scores = None
+    index_stats = {'enabled': use_index, 'full_pairs': 0, 'candidate_pairs': 0}
+    if scoring_mode in ('rerank', 'offline'):
+        # Кандидаты из векторного поиска по локальным эмбеддингам
+        from embeddings import get_embedding_backend
+        backend = embedding_backend or get_embedding_backend(EMBEDDING_BACKEND)
+        top_k = RERANK_TOP_K if scoring_mode == 'rerank' else OFFLINE_TOP_K
+        candidates, embedding_scores = _embedding_candidates(
+            meaningful_sentences, triggers, backend, top_k, trigger_model
+        )
+        index_stats['full_pairs'] = len(candidates) * len(meaningful_sentences)
+        index_stats['candidate_pairs'] = sum(len(sents) for sents in candidates.values())
+        print(f"🧭 Векторный поиск ({backend.name}): {index_stats['candidate_pairs']} пар вместо {index_stats['full_pairs']}")
+    elif use_index:
+        marker_grams = dict(zip(trigger_model.markers, trigger_model.marker_grams)) if trigger_model else None
+        candidates = NgramIndex(meaningful_sentences, sentence_tokens=prepared.tokens).candidates_for_triggers(
+            triggers, marker_grams
+        )
+        index_stats['full_pairs'] = len(candidates) * len(meaningful_sentences)
+        index_stats['candidate_pairs'] = sum(len(sents) for sents in candidates.values())
+        print(f"🔎 Индекс кандидатов: {index_stats['candidate_pairs']} пар вместо {index_stats['full_pairs']}")
+
+    # Матрица лексической схожести всех предложений со всеми маркерами
+    lexical = None
+    if use_lexical_engine:
+        from lexical_engine import LexicalSimilarityEngine
+        lexical_start = time.time()
+        if trigger_model:
+            lexical = LexicalSimilarityEngine(
+                meaningful_sentences, trigger_model.markers,
+                marker_counts=dict(zip(trigger_model.markers, trigger_model.marker_ngram_counts))
+            )
+        else:
+            lexical = LexicalSimilarityEngine(meaningful_sentences, collect_markers(triggers))
+        print(f"🧮 Матрица схожести {lexical.matrix.shape[0]}×{lexical.matrix.shape[1]} за {time.time() - lexical_start:.2f}с")
+
+    if scoring_mode == 'offline':
+        # Схожесть берётся прямо из эмбеддингов, запросов к GigaChat нет
+        similarities = {}
+        for polarity, sent, marker in ComparisonScheduler(None).build_work_set(meaningful_sentences, triggers, candidates):
+            score = embedding_scores.get((sent, marker), 0.0)
+            similarities[(polarity, sent, marker)] = min(score, MAX_SIMILARITY_CAP) if score >= EMBEDDING_MATCH_THRESHOLD else 0.0
+        llm_pairs = 0
+        degraded = Counter()
+    else:
+        # Все сравнения выполняются заранее параллельно, дальше только разбор результатов
+        print(f"🔄 Параллельное сравнение (до {max_concurrency} запросов одновременно)...")
+        cascade = None
+        if scoring_mode == 'cascade':
+            from cascade_scorer import CascadeScorer
+            from embeddings import get_embedding_backend
+            cascade_start = time.time()
+            markers = trigger_model.markers if trigger_model else collect_markers(triggers)
+            cascade = CascadeScorer(
+                meaningful_sentences, markers, CASCADE_BAND, SEMANTIC_THRESHOLD,
+                {'pos': 0.8, 'neg': MAX_SIMILARITY_CAP},
+                stage_bands={'lexical': CASCADE_LEXICAL_BANDS['tfidf' if lexical is not None else 'sequence'], **CASCADE_STAGE_BANDS},
+                embedding_backend=embedding_backend or get_embedding_backend(EMBEDDING_BACKEND),
+                trigger_model=trigger_model, lexical=lexical, sentence_stems=prepared.stems_by_sentence()
+            )
+            print(f"🪜 Каскад оценок ({', '.join(cascade.stages)}) подготовлен за {time.time() - cascade_start:.2f}с")
+        scheduler = ComparisonScheduler(giga_chat, max_concurrency, batch_size, lexical, cascade, scoring_mode)
+        if use_match_caps:
+            similarities = await scheduler.run_capped(meaningful_sentences, triggers, candidates)
+            print(f"✂️ Пропущено пар после заполнения лимитов: {scheduler.skipped_pairs}")
+        else:
+            similarities = await scheduler.run(meaningful_sentences, triggers, candidates)
+        llm_pairs, degraded = scheduler.llm_pairs, scheduler.degraded
+        if degraded['budget']:
+            print(f"💸 Бюджет токенов исчерпан: {degraded['budget']} пар оценено локально")
+        if degraded['circuit_open']:
+            print(f"🔌 GigaChat недоступен: {degraded['circuit_open']} пар оценено локально")
+        if degraded['error']:
+            print(f"⚠️ Запросы к GigaChat не удались: {degraded['error']} пар оценено локально")
     
     # Подробная статистика по каждой компетенции
     detailed_stats = {
         'filter_stats': filter_stats,
+        'preprocess_cached': preprocess_cached,
+        'index_stats': index_stats,
+        'scoring_mode': scoring_mode,
         'competency_stats': {}
     }
+    if scoring_mode == 'cascade':
+        # Сколько пар решила каждая стадия каскада и сколько ушло в GigaChat
+        detailed_stats['cascade_stats'] = dict(cascade.stats)
+        print(f"🪜 Стадии каскада: {detailed_stats['cascade_stats']}")
 
     for comp_idx, (comp, indicators) in enumerate(triggers.items()):
         comp_start = time.time()
@@ -495,6 +1151,7 @@ async def analyze_text_optimized(text: str, triggers: dict, giga_chat: 'AsyncGig
                 'negative_matches': 0,
                 'below_threshold': 0,
                 'contextually_filtered': 0,
+                'skipped_by_cap': 0,
                 'marker_analysis': {}
             }
 
@@ -518,15 +1175,18 @@ async def analyze_text_optimized(text: str, triggers: dict, giga_chat: 'AsyncGig
                     'contextually_filtered_count': 0
                 }
 
-                for sent in meaningful_sentences:
-                    similarity, total_tokens = await check_phrase_similarity_positive(
-                        giga_chat, sent, marker, total_tokens
-                    )
+                marker_sentences = candidates[marker] if candidates is not None else meaningful_sentences
+                for sent in marker_sentences:
+                    similarity = similarities.get(('pos', sent, marker))
+                    if similarity is None:
+                        # Пара не проверялась: лимит совпадений индикатора уже заполнен
+                        indicator_stats['skipped_by_cap'] += 1
+                        continue
                     marker_stats['comparisons'] += 1
                     indicator_stats['positive_comparisons'] += 1
                     processed_comparisons += 1
 
-                    if not is_contextually_relevant_positive(sent, marker):
+                    if not is_contextually_relevant_positive(sent, marker, sentence_categories[sent]):
                         marker_stats['contextually_filtered_count'] += 1
                         indicator_stats['contextually_filtered'] += 1
                         continue
@@ -566,15 +1226,18 @@ async def analyze_text_optimized(text: str, triggers: dict, giga_chat: 'AsyncGig
                     'contextually_filtered_count': 0
                 }
 
-                for sent in meaningful_sentences:
-                    similarity, total_tokens = await check_phrase_similarity_optimized(
-                        giga_chat, sent, marker, total_tokens
-                    )
+                marker_sentences = candidates[marker] if candidates is not None else meaningful_sentences
+                for sent in marker_sentences:
+                    similarity = similarities.get(('neg', sent, marker))
+                    if similarity is None:
+                        # Пара не проверялась: лимит совпадений индикатора уже заполнен
+                        indicator_stats['skipped_by_cap'] += 1
+                        continue
                     marker_stats['comparisons'] += 1
                     indicator_stats['negative_comparisons'] += 1
                     processed_comparisons += 1
 
-                    if not is_contextually_relevant(sent, marker):
+                    if not is_contextually_relevant(sent, marker, sentence_categories[sent]):
                         marker_stats['contextually_filtered_count'] += 1
                         indicator_stats['contextually_filtered'] += 1
                         continue
@@ -583,28 +1246,16 @@ async def analyze_text_optimized(text: str, triggers: dict, giga_chat: 'AsyncGig
                         # 🔧 ИСПРАВЛЕНО: присваиваем ПОЛНЫЙ балл из Excel для негативных маркеров
                         weighted_score = score  # Берем полный балл из файла триггеров
                         method = "sequence_matcher" if similarity <= 0.3 else "giga_enhanced"
-                        prompt = (
-                            f"Преобразуй негативную фразу в конструктивную, позитивную, сохраняя суть. "
-                            f"Ответь ТОЛЬКО позитивной фразой без лишних слов, разметки или объяснений.\n"
-                            f"Негатив: \"{sent}\"\n"
-                            f"Позитив:"
-                        )
-                        try:
-                            advice = await giga_chat.send(prompt)
-                            advice = advice.strip()
-                            # Post-processing: если совет неинформативный, подставить дефолт
-                            if not advice or advice.lower().startswith("позитив:") or len(advice) < 5:
-                                advice = "Сформулируйте мысль конструктивно, с акцентом на развитие и готовность к изменениям."
-                        except Exception:
-                            advice = "Сформулируйте мысль конструктивно, с акцентом на развитие и готовность к изменениям."
+                        # Совет заполняется отдельным проходом после сопоставления
                         match_info = {
                             "found": sent,
                             "original": marker,
                             "score": weighted_score,
                             "similarity": similarity,
                             "method": method,
-                            "advice": advice
+                            "advice": DEFAULT_ADVICE
                         }
+                        advice_matches.append(match_info)
                         neg_matches.append(match_info)
                         marker_stats['matches'].append(match_info)
                         indicator_stats['negative_matches'] += 1
@@ -615,6 +1266,13 @@ async def analyze_text_optimized(text: str, triggers: dict, giga_chat: 'AsyncGig
                 indicator_stats['marker_analysis'][f"neg_{marker[:50]}"] = marker_stats
                 comp_stats['total_markers'] += 1
 
+            # Оставляем лучшие совпадения в пределах лимитов индикатора
+            pos_matches = sorted(pos_matches, key=lambda x: x['similarity'], reverse=True)
+            neg_matches = sorted(neg_matches, key=lambda x: x['similarity'], reverse=True)
+            if use_match_caps:
+                pos_matches = pos_matches[:MAX_POSITIVE_MATCHES]
+                neg_matches = neg_matches[:MAX_NEGATIVE_MATCHES]
+
             # Подсчет СРЕДНИХ баллов вместо суммирования
             pos_score = sum(m['score'] for m in pos_matches) / len(pos_matches) if pos_matches else 0
             neg_score = sum(m['score'] for m in neg_matches) / len(neg_matches) if neg_matches else 0
@@ -623,19 +1281,19 @@ async def analyze_text_optimized(text: str, triggers: dict, giga_chat: 'AsyncGig
             # Добавляем балл индикатора в список для вычисления среднего по компетенции
             comp_results["indicator_scores"].append(total_score)
 
-            # Формируем результаты со ВСЕМИ найденными совпадениями
+            # Формируем результаты с лучшими найденными совпадениями
             comp_results["indicators"][indicator] = {
                 "score": total_score,
                 "max_score": indicator_max_score,
                 "positive": {
                     "count": len(pos_matches),
                     "score": pos_score,
-                    "examples": sorted(pos_matches, key=lambda x: x['similarity'], reverse=True)
+                    "examples": pos_matches
                 },
                 "negative": {
                     "count": len(neg_matches),
                     "score": neg_score,
-                    "examples": sorted(neg_matches, key=lambda x: x['similarity'], reverse=True)
+                    "examples": neg_matches
                 },
                 "courses": data['courses'] if neg_score > 0 else [],  # Показываем курсы только если есть негативные
                 "detailed_stats": indicator_stats
@@ -661,11 +1319,54 @@ async def analyze_text_optimized(text: str, triggers: dict, giga_chat: 'AsyncGig
         results[comp] = comp_results
         detailed_stats['competency_stats'][comp] = comp_stats
 
+    # Советы генерируются один раз на уникальную фразу из итоговых негативных примеров
+    advice_sentences = [
+        match['found']
+        for comp, comp_results in results.items()
+        for ind_results in comp_results['indicators'].values()
+        for match in ind_results['negative']['examples']
+    ]
+    advice_stats = {'sentences': len(set(advice_sentences)), 'cached': 0, 'requests': 0, 'failed': 0}
+    if advice_sentences and scoring_mode != 'offline':
+        print(f"💡 Генерация советов для {advice_stats['sentences']} фраз...")
+        advice, advice_stats = await generate_advice(giga_chat, advice_sentences, max_concurrency)
+        for match in advice_matches:
+            match['advice'] = advice.get(match['found'], DEFAULT_ADVICE)
+    detailed_stats['advice_stats'] = advice_stats
+    client_stats = getattr(giga_chat, 'stats', {})
+    detailed_stats['client_stats'] = {
+        key: value - client_stats_before.get(key, 0) for key, value in client_stats.items()
+    }
+    # Отчёт помечается как деградированный, если GigaChat был недоступен и часть оценок локальная.
+    # Отказы предохранителя считаются по анализу (в его области учёта), а не по общему клиенту
+    ledger = getattr(giga_chat, 'ledger', None)
+    usage = ledger.current() if ledger is not None else None
+    circuit_rejected = usage.circuit_rejected if usage is not None else 0
+    detailed_stats['degraded'] = bool(degraded['circuit_open'] or degraded['error'] or circuit_rejected)
+    detailed_stats['degraded_pairs'] = dict(degraded)
+
+    # Реальный расход токенов по блоку usage ответов и оценка сэкономленного
+    usage_stats = usage.report() if usage is not None else {'spent_tokens': 0, 'requests': 0}
+    tokens_per_pair = usage_stats['spent_tokens'] / llm_pairs if llm_pairs else 0
+    usage_stats.update({
+        'llm_pairs': llm_pairs,
+        'degraded_pairs': degraded['budget'],
+        'saved_tokens_estimate': int(degraded['budget'] * tokens_per_pair),
+    })
+    detailed_stats['usage_stats'] = usage_stats
+
     total_time = time.time() - start_time
+    detailed_stats.update({
+        'processing_time': total_time,
+        'total_comparisons': processed_comparisons,
+        'tokens_used': usage_stats['spent_tokens'],
+        'cache_size': len(similarity_cache),
+        'sentences_processed': len(meaningful_sentences),
+    })
     print(f"\n📊 Общая статистика обработки:")
     print(f"   - Время: {total_time:.1f}с")
     print(f"   - Сравнений: {processed_comparisons}")
-    print(f"   - Токенов использовано: {total_tokens}")
+    print(f"   - Токенов использовано: {usage_stats['spent_tokens']}")
     print(f"   - Размер кэша: {len(similarity_cache)}")
 
     # Добавляем детальную статистику к результатам
@@ -676,6 +1377,8 @@ def format_simple_report(analysis: dict) -> str:
     """Формирует упрощенный отчет только с компетенциями, индикаторами, баллами и расшифровкой"""
     
     report = "🎯 АНАЛИЗ КОМПЕТЕНЦИЙ\n\n"
+    if analysis.get('_detailed_stats', {}).get('degraded'):
+        report += DEGRADED_NOTICE + "\n\n"
     report += "=" * 80 + "\n"
     
     # Анализ компетенций
@@ -753,61 +1456,6 @@ def filter_by_main_speaker(text: str, main_speaker: str = "Александр")
     
     return '\n'.join(speaker_lines)
 
-class AsyncGigaChat:
-    def __init__(self):
-        self.session = None
-        self.token = None
-        self.history = []
-
-    async def initialize(self):
-        self.session = aiohttp.ClientSession()
-        await self._fetch_token()
-
-    async def close(self):
-        if self.session:
-            await self.session.close()
-
-    async def _fetch_token(self):
-        headers = {
-            'Authorization': f'Basic {AUTH_KEY}',
-            'Content-Type': 'application/x-www-form-urlencoded',
-            'Accept': 'application/json',
-            'RqUID': str(uuid.uuid4()),
-        }
-        data = {'grant_type': 'client_credentials', 'scope': SCOPE}
-        async with self.session.post(API_AUTH_URL, headers=headers, data=data, ssl=False) as resp:
-            js = await resp.json()
-            self.token = js.get('access_token')
-            if resp.status != 200 or not self.token:
-                raise RuntimeError(f"Auth failed {resp.status}")
-
-    async def send(self, prompt: str) -> str:
-        if not self.token:
-            await self._fetch_token()
-
-        headers = {
-            'Authorization': f'Bearer {self.token}',
-            'Content-Type': 'application/json'
-        }
-        payload = {
-            'model': 'GigaChat',
-            'messages': [
-                {
-                    'role': 'user',
-                    'content': prompt
-                }
-            ],
-            'temperature': 0.7,
-            'max_tokens': 500
-        }
-
-        async with self.session.post(API_CHAT_URL, headers=headers, json=payload, ssl=False) as resp:
-            if resp.status == 200:
-                js = await resp.json()
-                return js['choices'][0]['message']['content']
-            else:
-                raise RuntimeError(f"Request failed with status {resp.status}")
-
 async def main():
     """Главная оптимизированная функция"""
     try:
@@ -835,7 +1483,9 @@ async def main():
         if not os.path.exists('./backstage/triggers.xlsx'):
             raise FileNotFoundError("Файл triggers.xlsx не найден")
 
-        triggers = load_triggers('./backstage/triggers.xlsx')
+        from trigger_model import load_trigger_model
+        trigger_model = load_trigger_model('./backstage/triggers.xlsx')
+        triggers = trigger_model.triggers
         full_text = load_transcript('./backstage/trans.docx')
         
         text = filter_by_main_speaker(full_text, "Александр")
@@ -849,7 +1499,7 @@ async def main():
         try:
             # 3. Оптимизированный анализ
             logging.info("Начало анализа текста...")
-            analysis = await analyze_text_optimized(text, triggers, giga_chat)
+            analysis = await analyze_text_optimized(text, triggers, giga_chat, trigger_model=trigger_model)
 
             # 4. Формирование упрощенного отчета
             final_report = format_simple_report(analysis)
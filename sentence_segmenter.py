@@ -0,0 +1,123 @@
+import re
+from typing import List, NamedTuple, Optional
+
+MIN_SENTENCE_LENGTH = 10  # Предложения короче (после strip) отбрасываются split_sentences
+
+# Сокращения, после точки в которых предложение не заканчивается
+ABBREVIATIONS = (
+    'т.е', 'т.к', 'т.н', 'т.ч', 'т.о', 'т.д', 'т.п', 'и.о', 'др', 'пр', 'см', 'ср', 'напр',
+    'г', 'гг', 'ул', 'д', 'стр', 'руб', 'коп', 'тыс', 'млн', 'млрд', 'трлн', 'шт', 'мин', 'сек',
+    'проф', 'доц', 'акад', 'зам', 'нач', 'рис', 'табл', 'прим', 'англ', 'etc', 'e.g', 'i.e',
+)
+# Эти сокращения часто стоят в конце фразы («и т.д.»): граница, если дальше заглавная буква
+TERMINAL_ABBREVIATIONS = frozenset({'т.д', 'т.п', 'др', 'etc'})
+
+_ABBR_ALTERNATION = '|'.join(
+    r'\.\s?'.join(re.escape(part) for part in abbr.split('.'))
+    for abbr in sorted(ABBREVIATIONS, key=len, reverse=True)
+)
+
+# Один проход по тексту: сканирование останавливается только на переводах строки (там
+# проверяется заголовок реплики) и на группах знаков конца предложения. Класс символов
+# без альтернатив регулярное выражение просматривает в несколько раз быстрее.
+_BOUNDARY_RE = re.compile(r'[.!?…\n][.!?…]*')
+_HEADER_RE = re.compile(
+    r'[ \t]*\d{2,4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(?::\d{2})?[ \t]*-[ \t]*(?P<speaker>[^\n:]+?)[ \t]*:'
+)
+# Сокращение, начинающееся с позиции pos
+_ABBR_RE = re.compile(rf'(?i:{_ABBR_ALTERNATION})\.')
+_ABBR_WINDOW = max(len(abbr) for abbr in ABBREVIATIONS)
+_NEXT_CHAR_RE = re.compile(r'\s*(\S)')
+
+
+class Sentence(NamedTuple):
+    """Предложение стенограммы: текст, смещения [start, end) в исходном тексте и реплика"""
+    text: str
+    start: int
+    end: int
+    speaker: Optional[str]  # Спикер из заголовка реплики (None, если заголовков нет)
+    turn: int  # Номер реплики: увеличивается на каждом заголовке с временной меткой
+
+
+def _next_char(text: str, pos: int) -> str:
+    match = _NEXT_CHAR_RE.match(text, pos)
+    return match.group(1) if match else ''
+
+
+def segment(text: str) -> List[Sentence]:
+    """Разбивает стенограмму на предложения за один проход скомпилированным регулярным выражением.
+
+    Границы: '.', '!', '?', '…' и их группы; заголовки реплик вида
+    «2025-06-06 10:16:10 - Спикер:» закрывают текущее предложение и в текст не входят.
+    Не являются границей: сокращения (т.е., т.к., г.), числа с точкой, инициалы и
+    многоточие, после которого фраза продолжается со строчной буквы.
+    """
+    sentences = []
+    speaker = None
+    turn = 0
+    start = 0
+    abbr_end = -1  # Конец последнего найденного сокращения
+    terminal_abbr = False
+
+    def close(end: int):
+        chunk = text[start:end]
+        stripped = chunk.strip()
+        if stripped:
+            left = start + len(chunk) - len(chunk.lstrip())
+            sentences.append(Sentence(stripped, left, left + len(stripped), speaker, turn))
+
+    header = _HEADER_RE.match(text)
+    if header:
+        speaker, turn, start = header.group('speaker').strip(), 1, header.end()
+
+    for match in _BOUNDARY_RE.finditer(text):
+        pos, end = match.span()
+        mark = match.group()
+        if mark[0] == '\n':
+            header = _HEADER_RE.match(text, pos + 1)
+            if header:
+                close(pos)
+                speaker = header.group('speaker').strip()
+                turn += 1
+                start = header.end()
+                continue
+            mark = mark[1:]
+            pos += 1
+            if not mark:
+                continue
+
+        if mark == '.':
+            before = text[pos - 1] if pos else ''
+            # Число с точкой: время 12.30, дробь 3.5
+            if before.isdigit() and text[end:end + 1].isdigit():
+                continue
+            if before.isalpha():
+                if end > abbr_end:
+                    word_start = pos - 1
+                    while word_start > 0 and pos - word_start < _ABBR_WINDOW and text[word_start - 1].isalpha():
+                        word_start -= 1
+                    abbr = None if word_start and text[word_start - 1].isalnum() else _ABBR_RE.match(text, word_start)
+                    if abbr is not None:
+                        abbr_end = abbr.end()
+                        terminal_abbr = ''.join(abbr.group()[:-1].split()).lower() in TERMINAL_ABBREVIATIONS
+                if end <= abbr_end:
+                    # Внутренняя точка сокращения или «т.е. мы»; «и т.д. Потом» - конец фразы
+                    if end < abbr_end or not terminal_abbr or not _next_char(text, end).isupper():
+                        continue
+                # Инициал перед фамилией: «А. С. Пушкин» (но не «я.»)
+                elif before.isupper() and before != 'Я' and (pos < 2 or not text[pos - 2].isalnum()) \
+                        and _next_char(text, end).isupper():
+                    continue
+        elif ('…' in mark or '..' in mark) and _next_char(text, end).islower():
+            # Многоточие посреди фразы: «ну... я думаю»
+            continue
+        close(end)
+        start = end
+
+    close(len(text))
+    return sentences
+
+
+def split_sentences(text: str, min_length: int = MIN_SENTENCE_LENGTH) -> List[str]:
+    """Тексты предложений длиннее min_length символов"""
+    return [sentence.text for sentence in segment(text) if len(sentence.text) > min_length]
@@ -0,0 +1,187 @@
+import hashlib
+import os
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+CACHE_DB_PATH = os.environ.get('SIMILARITY_CACHE_PATH', os.path.join('cache', 'similarity_cache.sqlite3'))
+MAX_ENTRIES = 200000  # Максимум записей на диске, старые вытесняются по LRU
+MEMORY_ENTRIES = 50000  # Максимум записей в памяти процесса
+FLUSH_BATCH = 200  # Сколько новых записей накапливать перед записью на диск
+READ_BATCH = 500  # Ключей в одном SELECT ... IN (...)
+
+_SPACES_RE = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """Нормализует фразу для ключа кэша: регистр, ё/е и пробелы не влияют на ключ"""
+    return _SPACES_RE.sub(' ', text.lower().replace('ё', 'е')).strip()
+
+
+def make_key(polarity: str, sentence: str, marker: str, prompt_version: str, variant: str = '') -> str:
+    """Стабильный между запусками ключ: SHA-256 от нормализованных фраз, полярности и версии промпта.
+    variant - источник базового сходства и режим оценки, если они не по умолчанию
+    (SequenceMatcher и режим 'llm'); ключи по умолчанию не меняются"""
+    parts = (polarity, prompt_version, normalize_text(sentence), normalize_text(marker))
+    if variant:
+        parts += (variant,)
+    payload = '\x1f'.join(parts)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class PersistentSimilarityCache:
+    """Кэш оценок схожести в SQLite (WAL) с LRU-вытеснением и пакетным чтением/записью.
+
+    Ведёт себя как словарь: `key in cache`, `cache[key]`, `cache[key] = value`.
+    Записи, сделанные через `set(..., persist=False)`, живут только в памяти процесса.
+    """
+
+    table = 'similarity'
+    value_type = 'REAL'
+
+    def __init__(self, path: str = CACHE_DB_PATH, max_entries: int = MAX_ENTRIES,
+                 memory_entries: int = MEMORY_ENTRIES, flush_batch: int = FLUSH_BATCH):
+        self.path = path
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.flush_batch = flush_batch
+        self._memory: OrderedDict = OrderedDict()
+        self._pending: Dict[str, float] = {}
+        self._touched: set = set()
+        # Ключи, которых нет на диске (по prefetch). Живут до flush() в конце анализа:
+        # другой процесс мог записать их, а в долгоживущем боте множество росло бы без предела
+        self._absent: set = set()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disabled = False
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self._conn is not None or self._disabled:
+            return self._conn
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.table} ('
+                f'key TEXT PRIMARY KEY, value {self.value_type} NOT NULL, last_used INTEGER NOT NULL)'
+            )
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_last_used ON {self.table}(last_used)')
+            conn.commit()
+            self._conn = conn
+        except sqlite3.Error as e:
+            # Без диска кэш продолжает работать только в памяти
+            print(f"Не удалось открыть кэш {self.table} {self.path}: {e}")
+            self._disabled = True
+        return self._conn
+
+    def _remember(self, key: str, value: float):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def prefetch(self, keys: Iterable[str]):
+        """Пакетно загружает в память уже сохранённые на диске оценки"""
+        conn = self._connect()
+        if conn is None:
+            return
+        missing = [key for key in dict.fromkeys(keys) if key not in self._memory]
+        for start in range(0, len(missing), READ_BATCH):
+            chunk = missing[start:start + READ_BATCH]
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(f'SELECT key, value FROM {self.table} WHERE key IN ({placeholders})', chunk)
+            for key, value in rows:
+                self._remember(key, value)
+                self._touched.add(key)
+        # Ключи, которых нет на диске, потом не ищем повторно по одному
+        self._absent.update(key for key in missing if key not in self._memory)
+
+    def get(self, key: str) -> Optional[float]:
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self._touched.add(key)
+            return self._memory[key]
+        if key in self._absent:
+            return None
+        conn = self._connect()
+        if conn is None:
+            return None
+        row = conn.execute(f'SELECT value FROM {self.table} WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        self._remember(key, row[0])
+        self._touched.add(key)
+        return row[0]
+
+    def set(self, key: str, value: float, persist: bool = True):
+        self._remember(key, value)
+        self._absent.discard(key)
+        if persist:
+            self._pending[key] = value
+            if len(self._pending) >= self.flush_batch:
+                self._write()
+
+    def flush(self):
+        """Записывает накопленные оценки и забывает отсутствующие ключи (вызывается в конце анализа)"""
+        self._write()
+        self._absent.clear()
+
+    def _write(self):
+        """Записывает накопленные оценки одной транзакцией и вытесняет самые старые записи"""
+        conn = self._connect()
+        if conn is None or (not self._pending and not self._touched):
+            self._pending.clear()
+            self._touched.clear()
+            return
+        now = time.time_ns()
+        with conn:
+            conn.executemany(
+                f'INSERT INTO {self.table}(key, value, last_used) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET value = excluded.value, last_used = excluded.last_used',
+                [(key, value, now) for key, value in self._pending.items()]
+            )
+            touched = [key for key in self._touched if key not in self._pending]
+            conn.executemany(f'UPDATE {self.table} SET last_used = ? WHERE key = ?', [(now, key) for key in touched])
+
+            count = conn.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+            if count > self.max_entries:
+                conn.execute(
+                    f'DELETE FROM {self.table} WHERE key IN '
+                    f'(SELECT key FROM {self.table} ORDER BY last_used LIMIT ?)',
+                    (count - self.max_entries,)
+                )
+        self._pending.clear()
+        self._touched.clear()
+
+    def close(self):
+        self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __getitem__(self, key: str) -> float:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: float):
+        self.set(key, value)
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+
+class PersistentAdviceCache(PersistentSimilarityCache):
+    """Кэш сгенерированных советов (текст) в той же базе, в отдельной таблице"""
+
+    table = 'advice'
+    value_type = 'TEXT'
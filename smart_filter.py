@@ -1,36 +1,51 @@
-import nltk
 import re
 import string
-from typing import List, Set
+from typing import List, Optional, Set, Tuple
 import asyncio
 
+# Русские стоп-слова поставляются с модулем: первые 151 - список NLTK (corpora/stopwords/russian),
+# остальные - разговорная речь. Загрузка корпуса NLTK требовала сети при импорте.
+RUSSIAN_STOPWORDS = frozenset({
+    'и', 'в', 'во', 'не', 'что', 'он', 'на', 'я', 'с', 'со', 'как', 'а', 'то', 'все', 'она', 'так',
+    'его', 'но', 'да', 'ты', 'к', 'у', 'же', 'вы', 'за', 'бы', 'по', 'только', 'ее', 'мне', 'было',
+    'вот', 'от', 'меня', 'еще', 'нет', 'о', 'из', 'ему', 'теперь', 'когда', 'даже', 'ну', 'вдруг',
+    'ли', 'если', 'уже', 'или', 'ни', 'быть', 'был', 'него', 'до', 'вас', 'нибудь', 'опять', 'уж',
+    'вам', 'ведь', 'там', 'потом', 'себя', 'ничего', 'ей', 'может', 'они', 'тут', 'где', 'есть',
+    'надо', 'ней', 'для', 'мы', 'тебя', 'их', 'чем', 'была', 'сам', 'чтоб', 'без', 'будто', 'чего',
+    'раз', 'тоже', 'себе', 'под', 'будет', 'ж', 'тогда', 'кто', 'этот', 'того', 'потому', 'этого',
+    'какой', 'совсем', 'ним', 'здесь', 'этом', 'один', 'почти', 'мой', 'тем', 'чтобы', 'нее',
+    'сейчас', 'были', 'куда', 'зачем', 'всех', 'никогда', 'можно', 'при', 'наконец', 'два',
+    'об', 'другой', 'хоть', 'после', 'над', 'больше', 'тот', 'через', 'эти', 'нас', 'про', 'всего',
+    'них', 'какая', 'много', 'разве', 'три', 'эту', 'моя', 'впрочем', 'хорошо', 'свою', 'этой',
+    'перед', 'иногда', 'лучше', 'чуть', 'том', 'нельзя', 'такой', 'им', 'более', 'всегда',
+    'конечно', 'всю', 'между', 'это', 'всё', 'то', 'этот', 'тот', 'эта', 'эти', 'те', 'мои',
+    'твои', 'его', 'её', 'их', 'него', 'неё', 'них', 'мне', 'мной', 'мною', 'тебе', 'тебя',
+    'тобой', 'тобою', 'нам', 'нами', 'вам', 'вами', 'им', 'ими', 'это', 'этот', 'эта', 'эти',
+    'тот', 'та', 'те', 'такой', 'такая', 'такие', 'такое', 'так', 'также', 'тоже', 'либо',
+    'или', 'ни', 'не', 'нет', 'ничего', 'никто', 'никогда', 'нигде', 'никуда', 'ниоткуда',
+    'никак', 'нисколько', 'ничуть', 'ничуть', 'ничуть', 'ничуть', 'ничуть', 'ничуть', 'ничуть'
+})
+
+# Временная метка реплики, которую clean_phrase убирает из фразы
+TIMESTAMP_RE = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} -\s*\w+:\s*')
+# Пунктуация, удаляемая перед разбиением на слова (для кириллицы быстрее str.translate)
+PUNCTUATION_RE = re.compile(f'[{re.escape(string.punctuation)}]+')
+
+# Простые междометия и незначимые слова
+INTERJECTIONS = frozenset({
+    'угу', 'ага', 'хм', 'эм', 'э', 'ну', 'да', 'нет', 'хорошо', 'понятно',
+    'ясно', 'ладно', 'точно', 'конечно', 'разумеется', 'спасибо', 'пожалуйста'
+})
+
+# Причины отсева фразы в порядке проверки (ключи filtered_by_* в статистике filter_batch)
+FILTER_REASONS = ('pattern', 'length', 'stopwords', 'morphology')
+MAX_FILTER_EXAMPLES = 5  # Примеров отсеянных фраз на причину в статистике
+
+
 class SmartPhraseFilter:
     def __init__(self):
-        # Расширенный список русских стоп-слов
-        self.extended_stopwords = {
-            'и', 'в', 'во', 'не', 'что', 'он', 'на', 'я', 'с', 'со', 'как', 'а', 'то', 'все', 'она', 'так',
-            'его', 'но', 'да', 'ты', 'к', 'у', 'же', 'вы', 'за', 'бы', 'по', 'только', 'ее', 'мне', 'было',
-            'вот', 'от', 'меня', 'еще', 'нет', 'о', 'из', 'ему', 'теперь', 'когда', 'даже', 'ну', 'вдруг',
-            'ли', 'если', 'уже', 'или', 'ни', 'быть', 'был', 'него', 'до', 'вас', 'нибудь', 'опять', 'уж',
-            'вам', 'ведь', 'там', 'потом', 'себя', 'ничего', 'ей', 'может', 'они', 'тут', 'где', 'есть',
-            'надо', 'ней', 'для', 'мы', 'тебя', 'их', 'чем', 'была', 'сам', 'чтоб', 'без', 'будто', 'чего',
-            'раз', 'тоже', 'себе', 'под', 'будет', 'ж', 'тогда', 'кто', 'этот', 'того', 'потому', 'этого',
-            'какой', 'совсем', 'ним', 'здесь', 'этом', 'один', 'почти', 'мой', 'тем', 'чтобы', 'нее',
-            'сейчас', 'были', 'куда', 'зачем', 'всех', 'никогда', 'можно', 'при', 'наконец', 'два',
-            'об', 'другой', 'хоть', 'после', 'над', 'больше', 'тот', 'через', 'эти', 'нас', 'про', 'всего',
-            'них', 'какая', 'много', 'разве', 'три', 'эту', 'моя', 'впрочем', 'хорошо', 'свою', 'этой',
-            'перед', 'иногда', 'лучше', 'чуть', 'том', 'нельзя', 'такой', 'им', 'более', 'всегда',
-            'конечно', 'всю', 'между', 'это', 'всё', 'то', 'этот', 'тот', 'эта', 'эти', 'те', 'мои',
-            'твои', 'его', 'её', 'их', 'него', 'неё', 'них', 'мне', 'мной', 'мною', 'тебе', 'тебя',
-            'тобой', 'тобою', 'нам', 'нами', 'вам', 'вами', 'им', 'ими', 'это', 'этот', 'эта', 'эти',
-            'тот', 'та', 'те', 'такой', 'такая', 'такие', 'такое', 'так', 'также', 'тоже', 'либо',
-            'или', 'ни', 'не', 'нет', 'ничего', 'никто', 'никогда', 'нигде', 'никуда', 'ниоткуда',
-            'никак', 'нисколько', 'ничуть', 'ничуть', 'ничуть', 'ничуть', 'ничуть', 'ничуть', 'ничуть'
-        }
-        
-        self.setup_nltk()
-        self.russian_stopwords = set()
-        self.load_russian_stopwords()
+        self.extended_stopwords = RUSSIAN_STOPWORDS
+        self.russian_stopwords = RUSSIAN_STOPWORDS
         
         # Паттерны незначимых фраз
         self.insignificant_patterns = [
@@ -45,52 +60,46 @@ class SmartPhraseFilter:
             r'^(хорошо|понятно|ясно|ладно)\s*[,.!?]*$',  # Согласие
             r'^(точно|конечно|разумеется)\s*[,.!?]*$',  # Подтверждение
         ]
-    
-    def setup_nltk(self):
-        """Настройка NLTK"""
-        try:
-            # Пытаемся загрузить русские стоп-слова
-            nltk.data.find('corpora/stopwords')
-        except LookupError:
-            print("Скачиваю стоп-слова NLTK...")
-            nltk.download('stopwords', quiet=True)
-    
-    def load_russian_stopwords(self):
-        """Загружает русские стоп-слова из NLTK"""
-        try:
-            from nltk.corpus import stopwords
-            self.russian_stopwords = set(stopwords.words('russian'))
-            # Добавляем расширенные стоп-слова
-            self.russian_stopwords.update(self.extended_stopwords)
-            
-        except Exception as e:
-            print(f"Не удалось загрузить стоп-слова NLTK: {e}")
-            # Используем базовый набор русских стоп-слов как fallback
-            self.russian_stopwords = self.extended_stopwords
+        # Все паттерны - одно регулярное выражение, компилируется один раз
+        self.insignificant_re = re.compile(
+            '|'.join(f'(?:{pattern})' for pattern in self.insignificant_patterns), re.IGNORECASE
+        )
     
     def clean_phrase(self, phrase: str) -> str:
         """Очищает фразу от временных меток и лишних символов"""
         # Убираем временные метки
-        cleaned = re.sub(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} -\s*\w+:\s*', '', phrase)
+        cleaned = TIMESTAMP_RE.sub('', phrase)
         
         # Убираем лишние пробелы
-        cleaned = re.sub(r'\s+', ' ', cleaned).strip()
+        cleaned = ' '.join(cleaned.split())
         
         return cleaned
     
     def is_insignificant_by_pattern(self, phrase: str) -> bool:
         """Проверяет, является ли фраза незначимой по паттернам"""
-        cleaned_phrase = self.clean_phrase(phrase).lower()
-        
-        for pattern in self.insignificant_patterns:
-            if re.match(pattern, cleaned_phrase, re.IGNORECASE):
-                return True
-        return False
+        return self.insignificant_re.match(self.clean_phrase(phrase)) is not None
+    
+    def _tokenize(self, cleaned_phrase: str) -> List[str]:
+        """Слова очищенной фразы в нижнем регистре без пунктуации"""
+        return PUNCTUATION_RE.sub('', cleaned_phrase.lower()).split()
+    
+    def _count_words(self, words: List[str]) -> Tuple[int, int, List[str]]:
+        """Стоп-слова, междометия и значимые слова (длиннее 2 символов) среди words"""
+        stopwords_count = 0
+        interjections_count = 0
+        meaningful_words = []
+        for word in words:
+            if word in self.russian_stopwords:
+                stopwords_count += 1
+            elif word in INTERJECTIONS:
+                interjections_count += 1
+            elif len(word) > 2:
+                meaningful_words.append(word)
+        return stopwords_count, interjections_count, meaningful_words
     
     def analyze_morphology(self, phrase: str) -> dict:
         """Упрощенный анализ фразы без pymorphy2"""
-        cleaned_phrase = self.clean_phrase(phrase)
-        words = cleaned_phrase.translate(str.maketrans('', '', string.punctuation)).split()
+        words = self._tokenize(self.clean_phrase(phrase))
         
         if not words:
             return {
@@ -101,73 +110,68 @@ class SmartPhraseFilter:
                 'significant_pos_count': 0
             }
         
-        meaningful_words = []
-        stopwords_count = 0
-        interjections_count = 0
-        significant_pos_count = 0
-        
-        # Простые междометия и незначимые слова
-        interjections = {
-            'угу', 'ага', 'хм', 'эм', 'э', 'ну', 'да', 'нет', 'хорошо', 'понятно', 
-            'ясно', 'ладно', 'точно', 'конечно', 'разумеется', 'спасибо', 'пожалуйста'
-        }
-        
-        for word in words:
-            word_lower = word.lower()
-            
-            # Проверяем стоп-слова
-            if word_lower in self.russian_stopwords:
-                stopwords_count += 1
-                continue
-            
-            # Проверяем междометия
-            if word_lower in interjections:
-                interjections_count += 1
-                continue
-            
-            # Проверяем длину слова (слова длиннее 2 символов считаются значимыми)
-            if len(word_lower) > 2:
-                significant_pos_count += 1
-                meaningful_words.append(word_lower)
+        stopwords_count, interjections_count, meaningful_words = self._count_words(words)
         
         return {
             'total_words': len(words),
             'meaningful_words': len(meaningful_words),
             'stopwords_count': stopwords_count,
             'interjections_count': interjections_count,
-            'significant_pos_count': significant_pos_count,
+            'significant_pos_count': len(meaningful_words),
             'meaningful_word_list': meaningful_words
         }
     
-    def is_meaningful_phrase_basic(self, phrase: str, min_length: int = 15, min_meaningful_words: int = 2) -> bool:
-        """Базовая проверка значимости фразы без ИИ"""
-        # Проверяем по паттернам
-        if self.is_insignificant_by_pattern(phrase):
-            return False
-        
-        # Проверяем минимальную длину
+    def check_phrase(self, phrase: str, min_length: int = 15, max_stopword_ratio: float = 0.7,
+                     min_meaningful_words: int = 2) -> Optional[str]:
+        """Причина отсева фразы из FILTER_REASONS или None, если фраза значимая.
+        Фраза очищается и разбивается на слова один раз."""
         cleaned = self.clean_phrase(phrase)
+        if self.insignificant_re.match(cleaned):
+            return 'pattern'
         if len(cleaned) < min_length:
-            return False
-        
-        # Морфологический анализ
-        morph_analysis = self.analyze_morphology(phrase)
-        
-        # Если слишком много стоп-слов относительно общего количества
-        if morph_analysis['total_words'] > 0:
-            stopword_ratio = morph_analysis['stopwords_count'] / morph_analysis['total_words']
-            if stopword_ratio > 0.7:  # Более 70% стоп-слов
-                return False
-        
-        # Если есть значимые слова
-        if morph_analysis['meaningful_words'] >= min_meaningful_words:
-            return True
-        
-        # Если есть значимые части речи
-        if morph_analysis['significant_pos_count'] >= min_meaningful_words:
-            return True
-        
-        return False
+            return 'length'
+        words = self._tokenize(cleaned)
+        stopwords_count, _, meaningful_words = self._count_words(words)
+        if words and stopwords_count / len(words) > max_stopword_ratio:
+            return 'stopwords'
+        if len(meaningful_words) < min_meaningful_words:
+            return 'morphology'
+        return None
+    
+    def filter_batch(self, sentences: List[str], min_length: int = 15, max_stopword_ratio: float = 0.7,
+                     min_meaningful_words: int = 2, limit: Optional[int] = None
+                     ) -> Tuple[List[Optional[str]], dict]:
+        """Фильтрует пачку фраз.
+        
+        Возвращает вердикты по порядку фраз (None - фраза значимая, иначе причина
+        из FILTER_REASONS) и статистику: total_sentences, passed_filter, filtered_by_<причина>
+        и до MAX_FILTER_EXAMPLES примеров на причину. При limit обработка останавливается
+        после limit значимых фраз, вердикты есть только для просмотренных фраз.
+        """
+        stats = {
+            'total_sentences': len(sentences),
+            'passed_filter': 0,
+            **{f'filtered_by_{reason}': 0 for reason in FILTER_REASONS},
+            'filtered_examples': {reason: [] for reason in FILTER_REASONS},
+        }
+        verdicts = []
+        for sentence in sentences:
+            if limit is not None and stats['passed_filter'] >= limit:
+                break
+            reason = self.check_phrase(sentence, min_length, max_stopword_ratio, min_meaningful_words)
+            verdicts.append(reason)
+            if reason is None:
+                stats['passed_filter'] += 1
+                continue
+            stats[f'filtered_by_{reason}'] += 1
+            examples = stats['filtered_examples'][reason]
+            if len(examples) < MAX_FILTER_EXAMPLES:
+                examples.append(sentence[:100])
+        return verdicts, stats
+    
+    def is_meaningful_phrase_basic(self, phrase: str, min_length: int = 15, min_meaningful_words: int = 2) -> bool:
+        """Базовая проверка значимости фразы без ИИ"""
+        return self.check_phrase(phrase, min_length=min_length, min_meaningful_words=min_meaningful_words) is None
     
     async def is_meaningful_phrase_ai(self, phrase: str, giga_chat, context: str = "анализ компетенций") -> bool:
         """Проверка значимости фразы с помощью ИИ"""
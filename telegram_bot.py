@@ -1,21 +1,23 @@
 import asyncio
 import logging
 from aiogram import Bot, Dispatcher, types
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.filters import Command
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 import os
+import time
 from datetime import datetime
 
 # Импортируем наши модули
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from giga_recomendation import MeetingAnalyzer
+from giga_recomendation import AsyncMeetingAnalyzer
 from competency_analyzer import analyze_competencies_async
-from docx import Document
+import giga_client
 
 # Настройка логирования
 logging.basicConfig(
@@ -35,17 +37,84 @@ class UserStates(StatesGroup):
     waiting_for_trans_file = State()
     waiting_for_triggers_file = State()
 
-# Создаем экземпляр анализатора встреч
-AUTH_KEY = 'ZGMzMGJmZjEtODQwYS00ZjAwLWI2NjgtNGIyNGNiY2ViNmE1OjYwNjM3NTU0LWQxMDctNDA5ZS1hZWM3LTAwYjQ5MjZkOGU2OA=='
-SCOPE = 'GIGACHAT_API_PERS'
-API_AUTH_URL = 'https://ngw.devices.sberbank.ru:9443/api/v2/oauth'
-API_CHAT_URL = 'https://gigachat.devices.sberbank.ru/api/v1/chat/completions'
-
-meeting_analyzer = MeetingAnalyzer(AUTH_KEY, SCOPE, API_AUTH_URL, API_CHAT_URL)
+# Анализатор встреч работает на общем клиенте GigaChat и не блокирует обработку других обновлений
+meeting_analyzer = AsyncMeetingAnalyzer()
 
 # Словарь для хранения файлов пользователей
 user_files = {}
 
+# Потоковая выдача рекомендаций
+EDIT_INTERVAL = 1.5  # Секунд между правками сообщения (Telegram допускает около одной правки в секунду на чат)
+MESSAGE_LIMIT = 4096  # Максимальная длина сообщения Telegram
+PROGRESS_HEADER = "✍️ Рекомендации генерируются...\n\n"
+
+
+class RecommendationProgress:
+    """Показывает рекомендации по мере генерации: правит одно сообщение не чаще
+    раза в EDIT_INTERVAL секунд и дописывает в файл разделы, за которыми уже начался следующий"""
+
+    def __init__(self, message: types.Message, filename: str):
+        self.message = message
+        self.filename = filename
+        self.flushed = ''  # Текст, уже записанный в файл
+        self.shown = ''
+        self.next_edit = 0.0
+
+    def _write(self, text, mode='a'):
+        with open(self.filename, mode, encoding='utf-8') as f:
+            f.write(text)
+
+    def _flush_sections(self, text):
+        # Раздел завершён, когда после него начался заголовок следующего
+        boundary = text.rfind('\n#')
+        if boundary > len(self.flushed):
+            self._write(text[len(self.flushed):boundary], 'a' if self.flushed else 'w')
+            self.flushed = text[:boundary]
+
+    async def _edit(self, text):
+        preview = text if len(text) <= MESSAGE_LIMIT - len(PROGRESS_HEADER) \
+            else '…' + text[-(MESSAGE_LIMIT - len(PROGRESS_HEADER) - 1):]
+        if not preview.strip() or preview == self.shown:
+            return
+        try:
+            await self.message.edit_text(PROGRESS_HEADER + preview)
+            self.shown = preview
+            self.next_edit = time.monotonic() + EDIT_INTERVAL
+        except TelegramRetryAfter as e:
+            self.next_edit = time.monotonic() + e.retry_after
+        except TelegramBadRequest as e:
+            logging.warning(f"Не удалось обновить сообщение с рекомендациями: {e}")
+            self.next_edit = time.monotonic() + EDIT_INTERVAL
+
+    async def __call__(self, text):
+        self._flush_sections(text)
+        if time.monotonic() >= self.next_edit:
+            await self._edit(text)
+
+    async def finish(self, text):
+        """Записывает итоговый текст в файл и показывает его окончание в сообщении"""
+        if self.flushed and text.startswith(self.flushed):
+            self._write(text[len(self.flushed):])
+        else:
+            # Ошибка посреди генерации: в файле должен остаться итоговый результат
+            self._write(text, 'w')
+        self.flushed = text
+        await asyncio.sleep(max(0.0, self.next_edit - time.monotonic()))
+        await self._edit(text)
+
+
+async def generate_recommendations(message: types.Message, file_path):
+    """Генерирует рекомендации потоком с показом в сообщении.
+    Возвращает (результат, имя файла с рекомендациями или None при ошибке подготовки)"""
+    recommendations_filename = f"detailed_recommendations_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+    status_message = await message.answer(PROGRESS_HEADER.strip())
+    progress = RecommendationProgress(status_message, recommendations_filename)
+    analysis_result = await meeting_analyzer.analyze_meeting_with_file(file_path, on_progress=progress)
+    if analysis_result.startswith("❌"):
+        return analysis_result, None
+    await progress.finish(analysis_result)
+    return analysis_result, recommendations_filename
+
 def filter_facilitator_speech(text):
     """Фильтрует речь ведущего, определяя его по количеству предложений"""
     lines = text.split('\n')
@@ -79,6 +148,7 @@ def filter_facilitator_speech(text):
 def read_docx_filtered(file_path):
     """Чтение и фильтрация текста из файла .docx"""
     try:
+        from docx import Document
         doc = Document(file_path)
         full_text = []
         for paragraph in doc.paragraphs:
@@ -156,15 +226,12 @@ async def get_recommendations_handler(callback: types.CallbackQuery, state: FSMC
     if os.path.exists(trans_file_path):
         await callback.message.answer("✅ Начинаю анализ...")
         try:
-            analysis_result = meeting_analyzer.analyze_meeting_with_file(trans_file_path)
+            analysis_result, recommendations_filename = await generate_recommendations(callback.message, trans_file_path)
             if analysis_result.startswith("❌"):
                 await callback.message.answer(analysis_result)
                 os.remove(trans_file_path)
                 await state.clear()
                 return
-            recommendations_filename = f"detailed_recommendations_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-            with open(recommendations_filename, 'w', encoding='utf-8') as f:
-                f.write(analysis_result)
             with open(recommendations_filename, 'rb') as f:
                 await callback.message.answer_document(
                     types.BufferedInputFile(f.read(), filename=recommendations_filename),
@@ -355,7 +422,7 @@ async def analyze_user_files(message: types.Message, user_id: int):
         await message.answer("🔍 Анализирую компетенции...")
         
         # Анализируем компетенции
-        full_report, summary = await analyze_competencies_async(trans_file, triggers_file)
+        full_report, summary = await analyze_competencies_async(trans_file, triggers_file, user_id=user_id)
         
         # Сохраняем полный отчет
         report_filename = f"competency_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
@@ -421,7 +488,8 @@ async def handle_trans_file(message: types.Message, state: FSMContext):
     
     try:
         # Анализируем встречу с учетом отчета компетенций
-        analysis_result = meeting_analyzer.analyze_meeting_with_file(file_path)
+        # Рекомендации показываются по мере генерации и записываются в файл по разделам
+        analysis_result, recommendations_filename = await generate_recommendations(message, file_path)
         
         # Проверяем, не является ли результат ошибкой
         if analysis_result.startswith("❌"):
@@ -430,11 +498,6 @@ async def handle_trans_file(message: types.Message, state: FSMContext):
             await state.clear()
             return
         
-        # Создаем файл с детальными рекомендациями
-        recommendations_filename = f"detailed_recommendations_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-        with open(recommendations_filename, 'w', encoding='utf-8') as f:
-            f.write(analysis_result)
-        
         # Отправляем файл с детальными рекомендациями
         with open(recommendations_filename, 'rb') as f:
             await message.answer_document(
@@ -469,11 +532,27 @@ def cleanup_user_files(user_id):
                 pass
         del user_files[user_id]
 
+async def on_startup():
+    """Открывает пул соединений и получает токен GigaChat заранее"""
+    try:
+        await giga_client.startup()
+    except Exception as e:
+        # Бот запускается и без GigaChat: клиент будет создан при первом анализе
+        logging.error(f"Не удалось подключиться к GigaChat при запуске: {e}")
+
+async def on_shutdown():
+    """Закрывает общий клиент GigaChat"""
+    await giga_client.shutdown()
+
 async def main():
     """Главная функция"""
     # Создаем папку для временных файлов
     os.makedirs("temp_files", exist_ok=True)
-    
+
+    # Общий клиент GigaChat открывается при старте и закрывается при остановке бота
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+
     # Запускаем бота
     await dp.start_polling(bot)
 
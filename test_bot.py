@@ -49,10 +49,8 @@ async def test_recommendations():
     
     try:
         # Создаем анализатор
-        AUTH_KEY = 'ZGMzMGJmZjEtODQwYS00ZjAwLWI2NjgtNGIyNGNiY2ViNmE1OjYwNjM3NTU0LWQxMDctNDA5ZS1hZWM3LTAwYjQ5MjZkOGU2OA=='
-        SCOPE = 'GIGACHAT_API_PERS'
-        API_AUTH_URL = 'https://ngw.devices.sberbank.ru:9443/api/v2/oauth'
-        API_CHAT_URL = 'https://gigachat.devices.sberbank.ru/api/v1/chat/completions'
+        # Адреса переопределяются GIGACHAT_AUTH_URL / GIGACHAT_CHAT_URL (например, на giga_stub.py)
+        from giga_client import AUTH_KEY, SCOPE, API_AUTH_URL, API_CHAT_URL
         
         analyzer = MeetingAnalyzer(AUTH_KEY, SCOPE, API_AUTH_URL, API_CHAT_URL)
         
@@ -73,6 +71,138 @@ async def test_recommendations():
         print(f"❌ Ошибка генерации рекомендаций: {e}")
         return False
 
+async def test_user_budget():
+    """Тест суточного бюджета: второй анализ пользователя сверх бюджета оценивается локально"""
+    print("\n🧪 Тестирование суточного бюджета токенов пользователя...")
+    
+    import tempfile
+    import giga_client
+    import search_optimized
+    from giga_client import AsyncGigaChat
+    from giga_stub import GigaChatStub
+    from similarity_cache import PersistentAdviceCache, PersistentSimilarityCache
+    from token_ledger import UsageLedger
+    
+    trans_file = "./backstage/trans.docx"
+    triggers_file = "./backstage/triggers.xlsx"
+    if not os.path.exists(trans_file) or not os.path.exists(triggers_file):
+        print(f"❌ Файлы {trans_file} / {triggers_file} не найдены")
+        return False
+    
+    # Запросы идут в заглушку GigaChat, оценки - в пустой временный кэш
+    port = 8097
+    urls = giga_client.API_AUTH_URL, giga_client.API_CHAT_URL
+    caches = search_optimized.similarity_cache, search_optimized.advice_cache
+    runner = await GigaChatStub().start(port=port)
+    client = None
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            giga_client.API_AUTH_URL = f"http://127.0.0.1:{port}/api/v2/oauth"
+            giga_client.API_CHAT_URL = f"http://127.0.0.1:{port}/api/v1/chat/completions"
+            search_optimized.similarity_cache = PersistentSimilarityCache(os.path.join(cache_dir, 'similarity.sqlite3'))
+            search_optimized.advice_cache = PersistentAdviceCache(os.path.join(cache_dir, 'advice.sqlite3'))
+            
+            ledger = UsageLedger(user_daily_budget=None)
+            client = AsyncGigaChat(ledger=ledger)
+            await client.initialize()
+            triggers = search_optimized.load_triggers(triggers_file)
+            lines = search_optimized.filter_by_main_speaker(
+                search_optimized.load_transcript(trans_file), "Александр").split('\n')
+            # Половины стенограммы дают разные пары, поэтому второй анализ не берёт оценки из кэша
+            first_text = '\n'.join(lines[:len(lines) // 2])
+            second_text = '\n'.join(lines[len(lines) // 2:])
+            
+            first = await search_optimized.analyze_text_optimized(first_text, triggers, client, user_id=1)
+            # Бюджет пользователя равен уже потраченному: следующий анализ не должен тратить токены
+            ledger.user_daily_budget = ledger.user_spent(1)
+            second = await search_optimized.analyze_text_optimized(second_text, triggers, client, user_id=1)
+            other = await search_optimized.analyze_text_optimized(second_text, triggers, client, user_id=2)
+    finally:
+        giga_client.API_AUTH_URL, giga_client.API_CHAT_URL = urls
+        search_optimized.similarity_cache, search_optimized.advice_cache = caches
+        if client is not None:
+            await client.close()
+        await runner.cleanup()
+    
+    first_usage = first['_detailed_stats']['usage_stats']
+    second_usage = second['_detailed_stats']['usage_stats']
+    print(f"📊 Первый анализ: {first_usage['spent_tokens']} токенов, {first_usage['degraded_pairs']} пар локально")
+    print(f"📊 Второй анализ: {second_usage['spent_tokens']} токенов, {second_usage['degraded_pairs']} пар локально")
+    if first_usage['spent_tokens'] == 0 or first_usage['degraded_pairs']:
+        print("❌ Первый анализ должен пройти через GigaChat без деградации")
+        return False
+    if second_usage['spent_tokens'] or not second_usage['degraded_pairs']:
+        print("❌ Второй анализ сверх бюджета должен деградировать")
+        return False
+    if other['_detailed_stats']['usage_stats']['degraded_pairs']:
+        print("❌ Бюджет одного пользователя не должен влиять на другого")
+        return False
+    print("✅ Анализ сверх суточного бюджета пользователя деградирует")
+    return True
+
+async def test_cascade_then_llm():
+    """Тест кэша схожести: анализ в режиме 'cascade' не меняет результат следующего анализа 'llm'"""
+    print("\n🧪 Тестирование анализа 'llm' после 'cascade' в одном процессе...")
+    
+    import tempfile
+    import giga_client
+    import search_optimized
+    from giga_client import AsyncGigaChat
+    from giga_stub import GigaChatStub
+    from similarity_cache import PersistentAdviceCache, PersistentSimilarityCache
+    
+    trans_file = "./backstage/trans.docx"
+    triggers_file = "./backstage/triggers.xlsx"
+    if not os.path.exists(trans_file) or not os.path.exists(triggers_file):
+        print(f"❌ Файлы {trans_file} / {triggers_file} не найдены")
+        return False
+    
+    def use_fresh_caches(cache_dir, name):
+        search_optimized.similarity_cache = PersistentSimilarityCache(os.path.join(cache_dir, f'{name}_similarity.sqlite3'))
+        search_optimized.advice_cache = PersistentAdviceCache(os.path.join(cache_dir, f'{name}_advice.sqlite3'))
+    
+    # Заглушка отвечает детерминированно, поэтому анализ 'llm' на пустом кэше - эталон
+    port = 8096
+    urls = giga_client.API_AUTH_URL, giga_client.API_CHAT_URL
+    caches = search_optimized.similarity_cache, search_optimized.advice_cache
+    runner = await GigaChatStub().start(port=port)
+    client = None
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            giga_client.API_AUTH_URL = f"http://127.0.0.1:{port}/api/v2/oauth"
+            giga_client.API_CHAT_URL = f"http://127.0.0.1:{port}/api/v1/chat/completions"
+            client = AsyncGigaChat()
+            await client.initialize()
+            triggers = search_optimized.load_triggers(triggers_file)
+            text = search_optimized.filter_by_main_speaker(search_optimized.load_transcript(trans_file), "Александр")
+            
+            use_fresh_caches(cache_dir, 'reference')
+            reference = await search_optimized.analyze_text_optimized(text, triggers, client, scoring_mode='llm')
+            use_fresh_caches(cache_dir, 'mixed')
+            await search_optimized.analyze_text_optimized(text, triggers, client, scoring_mode='cascade')
+            after_cascade = await search_optimized.analyze_text_optimized(text, triggers, client, scoring_mode='llm')
+    finally:
+        giga_client.API_AUTH_URL, giga_client.API_CHAT_URL = urls
+        search_optimized.similarity_cache, search_optimized.advice_cache = caches
+        if client is not None:
+            await client.close()
+        await runner.cleanup()
+    
+    differing = [
+        (competency, indicator)
+        for competency, data in reference.items() if not competency.startswith('_')
+        for indicator, result in data['indicators'].items()
+        if after_cascade[competency]['indicators'][indicator]['score'] != result['score']
+        or after_cascade[competency]['indicators'][indicator]['positive'] != result['positive']
+        or after_cascade[competency]['indicators'][indicator]['negative'] != result['negative']
+    ]
+    print(f"📊 Индикаторов с отличиями от эталона: {len(differing)}")
+    if differing:
+        print(f"❌ Решения каскада попали в оценки анализа 'llm': {differing[:3]}")
+        return False
+    print("✅ Анализ 'llm' после 'cascade' совпадает с эталоном")
+    return True
+
 async def main():
     """Главная функция тестирования"""
     print("🚀 Запуск тестов функциональности бота...")
@@ -84,13 +214,17 @@ async def main():
     # Тестируем компоненты
     competency_test = await test_competency_analysis()
     recommendations_test = await test_recommendations()
+    budget_test = await test_user_budget()
+    cascade_cache_test = await test_cascade_then_llm()
     
     print("\n" + "=" * 60)
     print("📊 РЕЗУЛЬТАТЫ ТЕСТИРОВАНИЯ:")
     print(f"📊 Анализ компетенций: {'✅ УСПЕШНО' if competency_test else '❌ ОШИБКА'}")
     print(f"💡 Генерация рекомендаций: {'✅ УСПЕШНО' if recommendations_test else '❌ ОШИБКА'}")
+    print(f"💸 Бюджет пользователя: {'✅ УСПЕШНО' if budget_test else '❌ ОШИБКА'}")
+    print(f"🪜 Каскад и кэш схожести: {'✅ УСПЕШНО' if cascade_cache_test else '❌ ОШИБКА'}")
     
-    if competency_test and recommendations_test:
+    if competency_test and recommendations_test and budget_test and cascade_cache_test:
         print("\n🎉 ВСЕ ТЕСТЫ ПРОЙДЕНЫ УСПЕШНО!")
         print("🤖 Бот готов к использованию")
     else:
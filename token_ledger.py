@@ -0,0 +1,137 @@
+import contextvars
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+ANALYSIS_TOKEN_BUDGET = 200000  # Токенов GigaChat на один анализ (по данным usage)
+USER_DAILY_TOKEN_BUDGET = 1000000  # Токенов GigaChat на пользователя в сутки
+
+_current_usage: contextvars.ContextVar[Optional['AnalysisUsage']] = contextvars.ContextVar('analysis_usage', default=None)
+
+
+class BudgetExceeded(RuntimeError):
+    """Бюджет токенов анализа или пользователя исчерпан"""
+
+
+class AnalysisUsage:
+    """Расход токенов одного анализа: потрачено по usage, зарезервировано под запросы в полёте"""
+
+    def __init__(self, ledger: 'UsageLedger', analysis_id: str, user_id=None,
+                 budget: Optional[int] = ANALYSIS_TOKEN_BUDGET):
+        self.ledger = ledger
+        self.analysis_id = analysis_id
+        self.user_id = user_id
+        self.budget = budget
+        self.spent = Counter()  # prompt_tokens, completion_tokens, total_tokens, requests
+        self.reserved = 0
+        self.rejected = 0  # Запросов, не отправленных из-за бюджета
+        self.circuit_rejected = 0  # Запросов анализа, отклонённых предохранителем
+
+    def remaining(self) -> Optional[int]:
+        if self.budget is None:
+            return None
+        return self.budget - self.spent['total_tokens'] - self.reserved
+
+    def exhausted(self) -> bool:
+        remaining = self.remaining()
+        return (remaining is not None and remaining <= 0) or self.ledger.user_exhausted(self.user_id)
+
+    def report(self) -> dict:
+        return {
+            'analysis_id': self.analysis_id,
+            'user_id': self.user_id,
+            'budget': self.budget,
+            'spent_tokens': self.spent['total_tokens'],
+            'prompt_tokens': self.spent['prompt_tokens'],
+            'completion_tokens': self.spent['completion_tokens'],
+            'requests': self.spent['requests'],
+            'rejected_by_budget': self.rejected,
+            'circuit_rejected': self.circuit_rejected,
+            'user_spent_today': self.ledger.user_spent(self.user_id),
+        }
+
+
+class UsageLedger:
+    """Учёт реального расхода токенов по блоку usage ответов GigaChat.
+
+    Анализ открывает scope(), и все запросы клиента внутри него (включая
+    дочерние задачи asyncio) списываются на этот анализ и его пользователя.
+    Перед запросом резервируется оценка, после ответа резерв заменяется
+    фактическим расходом.
+    """
+
+    def __init__(self, user_daily_budget: Optional[int] = USER_DAILY_TOKEN_BUDGET):
+        self.user_daily_budget = user_daily_budget
+        self.totals = Counter()
+        self._users: Dict[Tuple[object, date], int] = {}
+        self._users_reserved: Counter = Counter()
+
+    @contextmanager
+    def scope(self, user_id=None, budget: Optional[int] = ANALYSIS_TOKEN_BUDGET, analysis_id: Optional[str] = None):
+        usage = AnalysisUsage(self, analysis_id or uuid.uuid4().hex[:12], user_id, budget)
+        token = _current_usage.set(usage)
+        try:
+            yield usage
+        finally:
+            _current_usage.reset(token)
+
+    @staticmethod
+    def current() -> Optional[AnalysisUsage]:
+        return _current_usage.get()
+
+    def user_spent(self, user_id) -> int:
+        return self._users.get((user_id, date.today()), 0) if user_id is not None else 0
+
+    def user_exhausted(self, user_id) -> bool:
+        if user_id is None or self.user_daily_budget is None:
+            return False
+        return self.user_spent(user_id) + self._users_reserved[user_id] >= self.user_daily_budget
+
+    def exhausted(self) -> bool:
+        """Исчерпан ли бюджет текущего анализа или его пользователя"""
+        usage = self.current()
+        return usage is not None and usage.exhausted()
+
+    def reserve(self, estimate: int) -> Optional[AnalysisUsage]:
+        """Резервирует оценку запроса; при исчерпанном бюджете бросает BudgetExceeded"""
+        usage = self.current()
+        if usage is None:
+            return None
+        if usage.exhausted():
+            usage.rejected += 1
+            raise BudgetExceeded(f"Бюджет токенов исчерпан (анализ {usage.analysis_id})")
+        usage.reserved += estimate
+        if usage.user_id is not None:
+            self._users_reserved[usage.user_id] += estimate
+        return usage
+
+    def release(self, usage: Optional[AnalysisUsage], estimate: int):
+        if usage is None:
+            return
+        usage.reserved -= estimate
+        if usage.user_id is not None:
+            self._users_reserved[usage.user_id] -= estimate
+
+    def commit(self, usage: Optional[AnalysisUsage], estimate: int, reported: Optional[dict]):
+        """Заменяет резерв фактическим расходом из блока usage (или оценкой, если его нет)"""
+        self.release(usage, estimate)
+        reported = reported or {}
+        total = int(reported.get('total_tokens') or estimate)
+        spent = {
+            'prompt_tokens': int(reported.get('prompt_tokens') or 0),
+            'completion_tokens': int(reported.get('completion_tokens') or 0),
+            'total_tokens': total,
+            'requests': 1,
+        }
+        self.totals.update(spent)
+        if usage is None:
+            return
+        usage.spent.update(spent)
+        if usage.user_id is not None:
+            key = (usage.user_id, date.today())
+            if key not in self._users:
+                # Расход за прошлые сутки больше не нужен
+                self._users = {k: v for k, v in self._users.items() if k[1] == key[1]}
+            self._users[key] = self._users.get(key, 0) + total
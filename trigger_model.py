@@ -0,0 +1,120 @@
+import hashlib
+import os
+import pickle
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from ngram_index import MIN_WORD_LENGTH, char_ngrams, grams_from_words
+from prepared_transcript import tokenize
+from russian_stemmer import stem_table
+
+if TYPE_CHECKING:
+    import numpy as np
+
+ARTIFACT_VERSION = 4  # Увеличивайте при изменении состава артефакта
+ARTIFACT_SUFFIX = '.trigmodel'
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def artifact_path(xlsx_path: str, digest: str) -> str:
+    """Путь артефакта рядом с загруженным файлом триггеров"""
+    directory = os.path.dirname(os.path.abspath(xlsx_path))
+    return os.path.join(directory, f"triggers_{digest[:16]}{ARTIFACT_SUFFIX}")
+
+
+class TriggerModel:
+    """Скомпилированный файл триггеров: всё, что нужно анализу, без повторного чтения Excel"""
+
+    def __init__(self, digest: str, triggers: dict):
+        self.version = ARTIFACT_VERSION
+        self.digest = digest
+        self.triggers = triggers
+        self.path: Optional[str] = None
+        # Эмбеддинги маркеров по ключу бэкенда (заполняются embeddings.marker_embeddings)
+        self.embeddings: Dict[str, 'np.ndarray'] = {}
+
+        # Уникальные маркеры и их предвычисленные признаки
+        markers = {}
+        for indicators in triggers.values():
+            for data in indicators.values():
+                for marker in list(data['positive_markers']) + list(data['negative_markers']):
+                    if marker:
+                        markers.setdefault(marker, None)
+        self.markers: List[str] = list(markers)
+        self.marker_ngram_counts: List[dict] = [dict(char_ngrams(marker)) for marker in self.markers]
+        self.marker_tokens: List[Tuple[str, ...]] = [tokenize(marker) for marker in self.markers]
+        # Основы слов маркеров сохраняются в артефакте: после загрузки они попадают
+        # в общую таблицу основ процесса без повторного стемминга
+        self.stem_memo: Dict[str, str] = stem_table.memo(
+            word for tokens in self.marker_tokens for word in tokens if len(word) >= MIN_WORD_LENGTH
+        )
+        self.bind_stems()
+
+    def bind_stems(self):
+        """Вычисляет признаки маркеров на идентификаторах основ общей таблицы процесса.
+        Идентификаторы зависят от процесса, поэтому в артефакт не сохраняются."""
+        stem_table.update(self.stem_memo)
+        self.marker_stem_ids: List[frozenset] = [
+            stem_table.word_ids(tokens, MIN_WORD_LENGTH) for tokens in self.marker_tokens
+        ]
+        self.marker_grams: List[frozenset] = [frozenset(grams_from_words(tokens)) for tokens in self.marker_tokens]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('marker_stem_ids', None)
+        state.pop('marker_grams', None)
+        return state
+
+    def save(self, path: str):
+        self.path = path
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path: str) -> Optional['TriggerModel']:
+        """Загружает артефакт или возвращает None, если он повреждён или устарел"""
+        try:
+            with open(path, 'rb') as f:
+                model = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+        if not isinstance(model, TriggerModel) or getattr(model, 'version', None) != ARTIFACT_VERSION:
+            return None
+        model.bind_stems()
+        return model
+
+
+def compile_triggers(xlsx_path: str, digest: Optional[str] = None) -> TriggerModel:
+    """Компилирует файл триггеров в модель (требует pandas/openpyxl)"""
+    from search_optimized import load_triggers
+
+    digest = digest or file_digest(xlsx_path)
+    return TriggerModel(digest, load_triggers(xlsx_path))
+
+
+def load_trigger_model(xlsx_path: str) -> TriggerModel:
+    """Возвращает модель триггеров: из готового артефакта рядом с файлом
+    или компилирует и сохраняет её при первом обращении"""
+    digest = file_digest(xlsx_path)
+    path = artifact_path(xlsx_path, digest)
+    if os.path.exists(path):
+        model = TriggerModel.load(path)
+        if model is not None and model.digest == digest:
+            model.path = path
+            return model
+
+    model = compile_triggers(xlsx_path, digest)
+    try:
+        model.save(path)
+    except OSError as e:
+        print(f"Не удалось сохранить модель триггеров {path}: {e}")
+    return model